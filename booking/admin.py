@@ -98,6 +98,7 @@ class AppointmentAdmin(ModelAdminJalaliMixin, admin.ModelAdmin):
     readonly_fields = ('get_services_display', 'created_at')
     list_per_page = 20
     raw_id_fields = ('patient', 'discount_code', 'selected_device')
+    filter_horizontal = ('resources',)
 
     def get_queryset(self, request: HttpRequest) -> QuerySet:
         """بهینه‌سازی کوئری لیست ادمین"""
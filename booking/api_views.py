@@ -1,31 +1,177 @@
 # booking/api_views.py
-from django.http import JsonResponse, HttpRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Sum
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+from django.views.decorators.vary import vary_on_headers
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Iterator, List, Optional, Tuple, Union
+import asyncio
+import json
+import re
+import time
+import jdatetime
+from asgiref.sync import sync_to_async
 
 from clinic.models import ServiceGroup, DiscountCode, Service
-from .utils import _get_patient_for_booking 
-from .calendar_logic import generate_available_slots_for_range
+from .utils import _aget_patient_for_booking, _get_patient_for_booking
+from .availability import get_available_slots, jalali_key
+from .slot_cache import aget_cached_slots, catalog_version, get_cached_slots, group_lanes, slots_etag
+from .calendar_logic import (
+    agenerate_available_slots_for_range, compact_slots_map, first_available_by_service,
+    generate_available_slots_for_range, iter_available_slots, next_available_slots
+)
+from .feed import acurrent_cursor, alane_changes, format_cursor, parse_cursor
+from .holds import HOLD_SECONDS, hold_first_free_lane, release_hold
+from .lanes import ANY_DEVICE, NO_DEVICE_LANE, lane_key
 
-def all_available_slots_api(request: HttpRequest) -> JsonResponse:
+# حداکثر افق نوبت‌دهی و حداکثر طول هر پنجره درخواستی (روز)
+BOOKING_HORIZON_DAYS = 365
+MAX_WINDOW_DAYS = 62
+# فقط ارقام لاتین پذیرفته می‌شوند؛ int() ارقام فارسی/یونیکد را هم می‌خواند
+JALALI_DATE_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})', re.ASCII)
+JALALI_MONTH_RE = re.compile(r'(\d{4})-(\d{1,2})', re.ASCII)
+
+def _parse_jalali_date(value: str) -> Optional[date]:
+    """تبدیل تاریخ شمسی YYYY-MM-DD به تاریخ میلادی (یا None در صورت نامعتبر بودن)."""
+    match = JALALI_DATE_RE.fullmatch(value or '')
+    if not match:
+        return None
+    try:
+        year, month, day = (int(part) for part in match.groups())
+        return jdatetime.date(year, month, day).togregorian()
+    except ValueError:
+        return None
+
+def _parse_jalali_month(value: str) -> Optional[Tuple[date, date]]:
+    """تبدیل ماه شمسی YYYY-MM به بازه اول تا آخر آن ماه."""
+    match = JALALI_MONTH_RE.fullmatch(value or '')
+    if not match:
+        return None
+    try:
+        year, month = (int(part) for part in match.groups())
+        first = jdatetime.date(year, month, 1)
+        next_first = jdatetime.date(year + 1, 1, 1) if month == 12 else jdatetime.date(year, month + 1, 1)
+    except ValueError:
+        return None
+    return first.togregorian(), next_first.togregorian() - timedelta(days=1)
+
+def month_windows(start_date: date, end_date: date) -> List[Tuple[date, date]]:
+    """
+    پنجره‌های ماه شمسی که تقویم رزرو برای بازه [start_date, end_date] درخواست می‌کند
+    (ماه اول از start_date شروع می‌شود؛ همان پنجره‌های پارامتر month در _resolve_window).
+    """
+    windows = []
+    j_day = jdatetime.date.fromgregorian(date=start_date)
+    year, month = j_day.year, j_day.month
+    while True:
+        first, last = _parse_jalali_month(f"{year}-{month}")
+        if first > end_date:
+            return windows
+        windows.append((max(first, start_date), min(last, end_date)))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+def _resolve_window(request: HttpRequest, max_days: int = MAX_WINDOW_DAYS) -> Optional[Tuple[date, date, Optional[date]]]:
     """
-    API دریافت زمان‌های خالی.
-    تغییرات:
-    1. حذف شرط لاگین اجباری.
-    2. دریافت پارامترهای services و device.
+    تعیین پنجره زمانی درخواست از پارامترهای month یا from/to (یا cursor).
+    خروجی: (شروع، پایان، شروع پنجره بعدی یا None). پنجره به امروز، افق نوبت‌دهی و
+    max_days (پیش‌فرض MAX_WINDOW_DAYS) محدود می‌شود؛ اگر پس از این محدودسازی خالی بماند
+    (تماماً گذشته یا فراتر از افق) None برمی‌گردد.
     """
-    # بازه زمانی (مثلاً تا ۴۵ روز آینده)
-    start_date = timezone.now().date()
-    end_date = start_date + timedelta(days=365)
+    today = timezone.localdate()
+    horizon_end = today + timedelta(days=BOOKING_HORIZON_DAYS)
+
+    month = request.GET.get('month')
+    start_param = request.GET.get('cursor') or request.GET.get('from')
+    end_param = request.GET.get('to')
+
+    if month:
+        window = _parse_jalali_month(month)
+        if not window:
+            return None
+        start_date, end_date = window
+    else:
+        start_date = _parse_jalali_date(start_param) if start_param else today
+        end_date = _parse_jalali_date(end_param) if end_param else None
+        if not start_date or (end_param and not end_date):
+            return None
+        if end_date is None:
+            # پیش‌فرض: تا پایان ماه شمسی جاری
+            j_start = jdatetime.date.fromgregorian(date=max(start_date, today))
+            _, end_date = _parse_jalali_month(f"{j_start.year}-{j_start.month}")
 
+    start_date = max(start_date, today)
+    end_date = min(end_date, horizon_end, start_date + timedelta(days=max_days - 1))
+    if end_date < start_date:
+        return None
+    next_start = end_date + timedelta(days=1)
+    return start_date, end_date, (next_start if next_start <= horizon_end else None)
+
+def _clean_device_id(device_id: Optional[str]) -> Union[int, str, None]:
+    """شناسه عددی دستگاه، ANY_DEVICE برای حالت «هر دستگاهی» یا None."""
+    if device_id == ANY_DEVICE:
+        return ANY_DEVICE
+    return int(device_id) if device_id else None
+
+# نوع رسانه قالب فشرده (جایگزین پارامتر format=compact)
+COMPACT_MEDIA_TYPE = 'application/vnd.booking.compact+json'
+
+def _wants_compact(request: HttpRequest) -> bool:
+    """قالب فشرده با ?format=compact یا هدر Accept درخواست می‌شود؛ پیش‌فرض همان قالب کامل قبلی است."""
+    requested = request.GET.get('format')
+    if requested:
+        return requested == 'compact'
+    return COMPACT_MEDIA_TYPE in request.headers.get('Accept', '')
+
+def _slots_etag(request: HttpRequest) -> Optional[str]:
+    """ETag پاسخ اسلات‌ها از نسخه خط و کاتالوگ؛ برای درخواست‌های نامعتبر None (بدون 304)."""
+    service_ids = [sid for sid in request.GET.getlist('service_ids[]') if sid.isdigit()]
+    device_id = request.GET.get('device_id')
+    window = _resolve_window(request)
+    if not service_ids or window is None or (device_id and not (device_id.isdigit() or device_id == ANY_DEVICE)):
+        return None
+    start_date, end_date, _ = window
+    patient_user, _, _ = _get_patient_for_booking(request)
+    return slots_etag(
+        start_date=start_date,
+        end_date=end_date,
+        service_ids=service_ids,
+        device_id=_clean_device_id(device_id),
+        patient_user=patient_user,
+        variant='compact' if _wants_compact(request) else 'full',
+    )
+
+@cache_control(private=True, no_cache=True)
+@vary_on_headers('Accept')
+@condition(etag_func=_slots_etag)
+def all_available_slots_api(request: HttpRequest) -> JsonResponse:
+    """
+    API دریافت زمان‌های خالی در یک پنجره زمانی.
+    پارامترها:
+    - service_ids[] و device_id (یا device_id=any برای اجتماع تمام دستگاه‌های گروه)
+    - month (ماه شمسی YYYY-MM) یا from/to (تاریخ شمسی YYYY-MM-DD)
+    - cursor: مقدار next پاسخ قبلی برای دریافت پنجره بعدی
+    - format=compact (یا Accept: application/vnd.booking.compact+json) برای قالب فشرده
+    خروجی: {'slots': {تاریخ شمسی: [...]}, 'from', 'to', 'next'}
+    با If-None-Match و ETag فعلی (نسخه خط و کاتالوگ) پاسخ 304 بدون اجرای موتور برمی‌گردد.
+    در قالب فشرده به جای slots: {'format': 'compact', 'duration', 'days': {تاریخ شمسی: {'date', 'tz', 'starts'}}}
+    """
     service_ids = request.GET.getlist('service_ids[]')
     device_id = request.GET.get('device_id')
     
+    window = _resolve_window(request)
+    if window is None:
+        return JsonResponse({'error': 'Invalid date window'}, status=400)
+    start_date, end_date, next_start = window
+
     # اگر سرویسی انتخاب نشده، تقویم خالی برگردان
     if not service_ids:
-        return JsonResponse({}, safe=True)
+        if _wants_compact(request):
+            return JsonResponse({'format': 'compact', 'duration': None, 'days': {}, 'from': None, 'to': None, 'next': None})
+        return JsonResponse({'slots': {}, 'from': None, 'to': None, 'next': None})
     
     # تمیزکاری ورودی‌ها
     clean_service_ids = []
@@ -33,31 +179,348 @@ def all_available_slots_api(request: HttpRequest) -> JsonResponse:
         if sid.isdigit():
             clean_service_ids.append(sid)
             
-    if device_id and not device_id.isdigit():
+    if device_id and not (device_id.isdigit() or device_id == ANY_DEVICE):
         return JsonResponse({'error': 'Invalid device ID'}, status=400)
 
     # دریافت کاربر (ممکن است None باشد)
     patient_user, _, _ = _get_patient_for_booking(request)
     
-    # نکته مهم: اینجا قبلاً شرط چک کردن لاگین بود که حذف شد.
+    grouped_slots = {}
+    if start_date <= end_date:
+        # کش نسخه‌دار خط؛ در صورت نبود، خواندن از جدول مادی‌شده
+        grouped_slots = get_cached_slots(
+            start_date=start_date,
+            end_date=end_date,
+            service_ids=clean_service_ids,
+            device_id=_clean_device_id(device_id),
+            patient_user=patient_user,
+            compute=get_available_slots,
+        )
     
-    # تولید اسلات‌ها
-    # حتما مطمئن شوید فایل calendar_logic.py هم آپدیت شده باشد
-    grouped_slots = generate_available_slots_for_range(
+    return _slots_response(request, grouped_slots, start_date, end_date, next_start)
+
+def _slots_response(request: HttpRequest, grouped_slots: dict, start_date: date, end_date: date,
+                    next_start: Optional[date]) -> JsonResponse:
+    """پاسخ API اسلات‌ها در قالب کامل یا فشرده (مشترک بین نسخه sync و async)."""
+    window_data = {
+        'from': jalali_key(start_date),
+        'to': jalali_key(end_date),
+        'next': jalali_key(next_start) if next_start else None,
+    }
+    if _wants_compact(request):
+        duration, days = compact_slots_map(grouped_slots)
+        return JsonResponse({'format': 'compact', 'duration': duration, 'days': days, **window_data})
+    return JsonResponse({'slots': grouped_slots, **window_data})
+
+async def all_available_slots_async_api(request: HttpRequest) -> JsonResponse:
+    """
+    نسخه async از all_available_slots_api برای اجرا زیر ASGI (clinic_project/asgi.py).
+    پارامترها و خروجی یکسان است؛ خواندن‌ها با ORM و کش async انجام می‌شود و جاروب اسلات‌ها
+    در thread executor، بنابراین یک worker می‌تواند هم‌زمان به درخواست‌های زیادی پاسخ دهد.
+    """
+    service_ids = [sid for sid in request.GET.getlist('service_ids[]') if sid.isdigit()]
+    device_id = request.GET.get('device_id')
+
+    window = _resolve_window(request)
+    if window is None:
+        return JsonResponse({'error': 'Invalid date window'}, status=400)
+    start_date, end_date, next_start = window
+    if device_id and not (device_id.isdigit() or device_id == ANY_DEVICE):
+        return JsonResponse({'error': 'Invalid device ID'}, status=400)
+
+    grouped_slots = {}
+    if service_ids and start_date <= end_date:
+        patient_user, _, _ = await _aget_patient_for_booking(request)
+        grouped_slots = await aget_cached_slots(
+            start_date=start_date,
+            end_date=end_date,
+            service_ids=service_ids,
+            device_id=_clean_device_id(device_id),
+            patient_user=patient_user,
+        )
+    return _slots_response(request, grouped_slots, start_date, end_date, next_start)
+
+async def _aiter_sync(items: Iterator) -> AsyncIterator:
+    """
+    پیمایش یک مولد sync که به دیتابیس دسترسی دارد از داخل event loop؛
+    هر قدم در thread جنگو (sync_to_async) اجرا می‌شود و بین قدم‌ها event loop آزاد است.
+    """
+    done = object()
+    step = sync_to_async(next)
+    while True:
+        item = await step(items, done)
+        if item is done:
+            return
+        yield item
+
+async def _stream_json_object(head: dict, field: str, items: AsyncIterator[Tuple[str, object]]) -> AsyncIterator[str]:
+    """
+    نویسنده JSON جریانی: کلیدهای head یکجا و سپس شیء field که اعضای آن
+    (کلید، مقدار) یکی‌یکی و بدون نگه‌داشتن کل پاسخ در حافظه نوشته می‌شوند.
+    """
+    yield json.dumps(head, cls=DjangoJSONEncoder)[:-1] + ', ' + json.dumps(field) + ': {'
+    separator = ''
+    async for key, value in items:
+        yield separator + json.dumps(key) + ': ' + json.dumps(value, cls=DjangoJSONEncoder)
+        separator = ', '
+    yield '}}'
+
+async def all_available_slots_stream_api(request: HttpRequest) -> HttpResponse:
+    """
+    نسخه جریانی API اسلات‌ها برای بازه‌های طولانی (تا کل افق نوبت‌دهی در یک درخواست).
+    پارامترها مانند all_available_slots_api است، ولی پنجره به MAX_WINDOW_DAYS محدود نمی‌شود.
+    اسلات‌ها روز به روز از iter_available_slots تولید و بلافاصله نوشته می‌شوند؛
+    بنابراین اولین بایت‌ها زود می‌رسند و حافظه مستقل از طول بازه است (بدون کش).
+    بدنه یک iterator async است تا زیر ASGI (clinic_project/asgi.py) بدون بافر شدن ارسال شود؛
+    زیر WSGI جنگو کل بدنه را یکجا جمع می‌کند.
+    """
+    service_ids = [sid for sid in request.GET.getlist('service_ids[]') if sid.isdigit()]
+    device_id = request.GET.get('device_id')
+
+    window = _resolve_window(request, max_days=BOOKING_HORIZON_DAYS + 1)
+    if window is None:
+        return JsonResponse({'error': 'Invalid date window'}, status=400)
+    if device_id and not (device_id.isdigit() or device_id == ANY_DEVICE):
+        return JsonResponse({'error': 'Invalid device ID'}, status=400)
+    start_date, end_date, next_start = window
+
+    patient_user, _, _ = await _aget_patient_for_booking(request)
+    days = _aiter_sync(iter_available_slots(
         start_date=start_date,
         end_date=end_date,
-        service_ids=clean_service_ids,
-        device_id=int(device_id) if device_id else None,
+        service_ids=service_ids,
+        device_id=_clean_device_id(device_id),
         patient_user=patient_user,
-        # اگر می‌خواهید برای مهمان پیش‌فرض خاصی بفرستید، اینجا اضافه کنید
-        # اما لاجیک داخل calendar_logic.py که قبلا فرستادم خودش هندل می‌کند.
+    ) if service_ids else iter(()))
+    head = {
+        'from': jalali_key(start_date),
+        'to': jalali_key(end_date),
+        'next': jalali_key(next_start) if next_start else None,
+    }
+
+    if _wants_compact(request):
+        duration = (await Service.objects.filter(id__in=service_ids).aaggregate(total=Sum('duration')))['total']
+        head = {'format': 'compact', 'duration': duration, **head}
+        body = _stream_json_object(head, 'days', (
+            (date_key, compact_slots_map({date_key: slots})[1][date_key]) async for date_key, slots in days
+        ))
+    else:
+        body = _stream_json_object(head, 'slots', days)
+    return StreamingHttpResponse(body, content_type='application/json')
+
+# حداکثر تعداد اسلاتی که API نزدیک‌ترین نوبت برمی‌گرداند
+NEXT_AVAILABLE_MAX_LIMIT = 20
+
+def next_available_api(request: HttpRequest) -> JsonResponse:
+    """
+    API نزدیک‌ترین زمان(های) خالی یک خدمت (برای پذیرش و صفحه اصلی).
+    پارامترها: service_ids[]، device_id و limit (پیش‌فرض ۱).
+    """
+    service_ids = [sid for sid in request.GET.getlist('service_ids[]') if sid.isdigit()]
+    device_id = request.GET.get('device_id')
+    limit = request.GET.get('limit', '1')
+
+    if not service_ids:
+        return JsonResponse({'slots': []})
+    if device_id and not (device_id.isdigit() or device_id == ANY_DEVICE):
+        return JsonResponse({'error': 'Invalid device ID'}, status=400)
+    if not limit.isdigit():
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    patient_user, _, _ = _get_patient_for_booking(request)
+    slots = next_available_slots(
+        service_ids=service_ids,
+        device_id=_clean_device_id(device_id),
+        patient_user=patient_user,
+        limit=min(max(int(limit), 1), NEXT_AVAILABLE_MAX_LIMIT),
+        horizon_days=BOOKING_HORIZON_DAYS,
     )
-    
-    return JsonResponse(grouped_slots, safe=True)
+    return JsonResponse({'slots': slots})
+
+# حداکثر تعداد خدمات در یک درخواست دسته‌ای و افق جستجوی نشان «اولین نوبت آزاد»
+BATCH_MAX_SERVICES = 200
+BATCH_HORIZON_DAYS = 14
+
+def next_available_batch_api(request: HttpRequest) -> JsonResponse:
+    """
+    API اولین زمان خالی چند خدمت به صورت یکجا (نشان «اولین نوبت آزاد» در لیست خدمات و صفحه اصلی).
+    پارامتر: service_ids[]؛ خروجی: {'services': {service_id: slot یا null}}.
+    """
+    service_ids = [sid for sid in request.GET.getlist('service_ids[]') if sid.isdigit()]
+    if not service_ids:
+        return JsonResponse({'services': {}})
+    if len(service_ids) > BATCH_MAX_SERVICES:
+        return JsonResponse({'error': 'Too many services'}, status=400)
+
+    patient_user, _, _ = _get_patient_for_booking(request)
+    first_slots = first_available_by_service(
+        service_ids=service_ids,
+        patient_user=patient_user,
+        horizon_days=BATCH_HORIZON_DAYS,
+    )
+    return JsonResponse({'services': {str(service_id): slot for service_id, slot in first_slots.items()}})
+
+# کلید توکن نگه‌داشت در session؛ هر session حداکثر یک نگه‌داشت فعال دارد
+HOLD_SESSION_KEY = 'booking_hold_token'
+
+@require_POST
+def slot_hold_api(request: HttpRequest) -> JsonResponse:
+    """
+    API نگه‌داشت موقت اسلات (هنگام کلیک روی ساعت در تقویم).
+    پارامترها: slot (ISO شروع)، services[] و device_id (یا any).
+    فقط شروع یکی از اسلات‌های آزاد همان روز و خط (داخل افق نوبت‌دهی) پذیرفته می‌شود.
+    نگه‌داشت به session بسته است: نگه‌داشت قبلی همان session آزاد و توکن آن دوباره استفاده می‌شود.
+    بازه برای HOLD_SECONDS ثانیه روی خط نگه داشته می‌شود و برای بقیه اشغال نمایش داده می‌شود؛
+    توکن برگشتی همراه فرم ثبت نوبت ارسال می‌شود. در حالت «هر دستگاهی» اولین دستگاه آزاد نگه داشته می‌شود.
+    """
+    service_ids = [sid for sid in request.POST.getlist('services[]') if sid.isdigit()]
+    device_id = request.POST.get('device_id')
+    services = list(Service.objects.select_related('group').filter(id__in=service_ids).order_by('pk'))
+    if not services:
+        return JsonResponse({'status': 'error', 'message': 'سرویس انتخابی نامعتبر است.'}, status=400)
+    try:
+        start_time = datetime.fromisoformat(request.POST.get('slot', ''))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'فرمت زمان نامعتبر است.'}, status=400)
+    if timezone.is_naive(start_time) or start_time < timezone.now():
+        return JsonResponse({'status': 'error', 'message': 'زمان انتخاب شده منقضی شده است.'}, status=400)
+    end_time = start_time + timedelta(minutes=sum(s.duration for s in services))
+    day = timezone.localtime(start_time).date()
+    if day > timezone.localdate() + timedelta(days=BOOKING_HORIZON_DAYS):
+        return JsonResponse({'status': 'error', 'message': 'این زمان قابل رزرو نیست.'}, status=400)
+
+    group = services[0].group
+    if not group.has_devices:
+        device_ids = [None]
+    elif device_id == ANY_DEVICE:
+        device_ids = list(group.available_devices.order_by('id').values_list('id', flat=True))
+    elif device_id and device_id.isdigit() and group.available_devices.filter(id=device_id).exists():
+        device_ids = [int(device_id)]
+    else:
+        return JsonResponse({'status': 'error', 'message': 'دستگاه نامعتبر است.'}, status=400)
+
+    # نگه‌داشت قبلی همین session قبل از بررسی آزاد می‌شود تا اسلات خود کاربر اشغال دیده نشود
+    token = request.session.get(HOLD_SESSION_KEY)
+    release_hold(token)
+    patient_user, _, _ = _get_patient_for_booking(request)
+    day_slots = generate_available_slots_for_range(
+        day, day, [str(s.id) for s in services], _clean_device_id(device_id) if group.has_devices else None,
+        patient_user,
+    ).get(jalali_key(day), [])
+    if start_time not in {datetime.fromisoformat(slot['start']) for slot in day_slots}:
+        return JsonResponse({'status': 'error', 'message': 'این زمان دیگر آزاد نیست.'}, status=409)
+
+    hold = hold_first_free_lane(group.id, device_ids, start_time, end_time, token)
+    if hold is None:
+        return JsonResponse({'status': 'error', 'message': 'این زمان دیگر آزاد نیست.'}, status=409)
+    request.session[HOLD_SESSION_KEY] = hold.token
+    return JsonResponse({
+        'status': 'success',
+        'token': hold.token,
+        'device_id': hold.device_id,
+        'expires_in': HOLD_SECONDS,
+    })
+
+@require_POST
+def slot_hold_release_api(request: HttpRequest) -> JsonResponse:
+    """آزادسازی نگه‌داشت همین session (مثلاً با تغییر خدمات یا دستگاه)."""
+    release_hold(request.session.pop(HOLD_SESSION_KEY, None))
+    return JsonResponse({'status': 'success'})
+
+# مدت هر اتصال فید، فاصله بررسی تغییرات و فاصله پیام‌های زنده نگه‌داشتن (ثانیه)
+FEED_STREAM_SECONDS = 25
+FEED_POLL_SECONDS = 1.0
+FEED_KEEPALIVE_SECONDS = 10
+FEED_RETRY_MS = 3000
+
+def _sse(event: str, data: dict, event_id: Optional[str] = None) -> str:
+    """یک پیام Server-Sent Events."""
+    head = f"id: {event_id}\n" if event_id else ''
+    return f"{head}event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+async def _feed_events(cursor: dict, service_ids: List[str], device_id: Union[int, str, None],
+                       patient_user) -> AsyncIterator[str]:
+    """
+    حلقه فید: هر FEED_POLL_SECONDS تغییرات خطوط بعد از مکان‌نما خوانده می‌شود و فقط روزهای
+    تغییرکرده (داخل افق نوبت‌دهی) دوباره محاسبه و به صورت جایگزین کامل همان روز ارسال می‌شوند.
+    انتظار با asyncio.sleep و خواندن‌ها با کش و ORM async است؛ بنابراین اتصال باز فید زیر ASGI
+    هیچ thread یا worker ای را اشغال نمی‌کند.
+    """
+    yield f"retry: {FEED_RETRY_MS}\n"
+    yield _sse('ready', {}, format_cursor(cursor))
+    deadline = time.monotonic() + FEED_STREAM_SECONDS
+    last_sent = time.monotonic()
+    while time.monotonic() < deadline:
+        await asyncio.sleep(FEED_POLL_SECONDS)
+        changes = await alane_changes(cursor)
+        if changes.cursor == cursor:
+            if time.monotonic() - last_sent >= FEED_KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield ': keepalive\n\n'
+            continue
+        cursor = changes.cursor
+        last_sent = time.monotonic()
+        if changes.reset:
+            yield _sse('reset', {}, format_cursor(cursor))
+            continue
+        today = timezone.localdate()
+        horizon_end = today + timedelta(days=BOOKING_HORIZON_DAYS)
+        days = {}
+        for day in sorted(d for d in changes.days if today <= d <= horizon_end):
+            day_slots = await agenerate_available_slots_for_range(day, day, service_ids, device_id, patient_user)
+            days[jalali_key(day)] = day_slots.get(jalali_key(day), [])
+        if days:
+            yield _sse('days', {'days': days}, format_cursor(cursor))
+
+async def availability_feed_api(request: HttpRequest) -> HttpResponse:
+    """
+    فید زنده تغییرات اسلات‌ها برای صفحه باز رزرو (Server-Sent Events).
+    پارامترها: service_ids[] و device_id (مانند API اسلات‌ها).
+    رویدادها: ready (مکان‌نمای اولیه)، days ({'days': {تاریخ شمسی: اسلات‌های کامل آن روز}}) و
+    reset (تغییر گسترده؛ کلاینت پنجره فعلی را دوباره می‌گیرد). هر اتصال حداکثر FEED_STREAM_SECONDS
+    باز می‌ماند و EventSource با هدر Last-Event-ID از همان مکان‌نما ادامه می‌دهد.
+    ویو async است و باید زیر ASGI (clinic_project/asgi.py) اجرا شود؛ زیر WSGI جنگو بدنه را
+    تا پایان اتصال جمع می‌کند.
+    """
+    service_ids = [sid for sid in request.GET.getlist('service_ids[]') if sid.isdigit()]
+    device_id = request.GET.get('device_id')
+    if device_id and not (device_id.isdigit() or device_id == ANY_DEVICE):
+        return JsonResponse({'error': 'Invalid device ID'}, status=400)
+    service = await Service.objects.select_related('group').filter(id__in=service_ids).order_by('pk').afirst()
+    if service is None:
+        return JsonResponse({'error': 'Invalid services'}, status=400)
+
+    device_id = _clean_device_id(device_id)
+    if not service.group.has_devices:
+        lanes = [NO_DEVICE_LANE]
+    elif device_id == ANY_DEVICE:
+        lanes = await sync_to_async(group_lanes)(service.group)
+    else:
+        lanes = [lane_key(device_id)]
+
+    event_id = request.headers.get('Last-Event-ID') or request.GET.get('cursor')
+    cursor = parse_cursor(event_id, lanes) or await acurrent_cursor(lanes)
+    patient_user, _, _ = await _aget_patient_for_booking(request)
+
+    response = StreamingHttpResponse(
+        _feed_events(cursor, service_ids, device_id, patient_user), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _services_for_group_etag(request: HttpRequest) -> Optional[str]:
+    group_id = request.GET.get('group_id')
+    if not group_id or not group_id.isdigit():
+        return None
+    return f"catalog-{catalog_version()}-{group_id}"
 
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_services_for_group_etag)
 def get_services_for_group_api(request: HttpRequest) -> JsonResponse:
     """
     API دریافت خدمات یک گروه برای نمایش در کارت‌ها.
+    ETag از نسخه کاتالوگ ساخته می‌شود؛ تا تغییر خدمات/دستگاه‌ها پاسخ 304 است.
     """
     group_id = request.GET.get('group_id')
     if not group_id or not group_id.isdigit():
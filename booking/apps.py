@@ -4,4 +4,8 @@ from django.apps import AppConfig
 class BookingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'booking'
-    verbose_name = "مدیریت نوبت‌دهی"
\ No newline at end of file
+    verbose_name = "مدیریت نوبت‌دهی"
+
+    def ready(self):
+        # اتصال سیگنال‌های همگام‌سازی بیت‌مپ اشغال
+        import booking.signals
@@ -0,0 +1,246 @@
+# booking/availability.py
+"""
+خواندن و نگهداری جدول مادی‌شده اسلات‌های آزاد (AvailabilityDay).
+API اسلات‌ها به جای محاسبه کامل، ردیف‌های روزانه را با یک کوئری بازه‌ای می‌خواند
+و فقط روزهایی که هنوز ردیف ندارند با موتور calendar_logic محاسبه و ذخیره می‌شوند.
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Union
+
+import jdatetime
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from clinic.models import Service
+from users.models import CustomUser
+from .calendar_logic import drop_elapsed_slots, generate_available_slots_for_range, resolve_target_gender
+from .holds import held_days
+from .lanes import ANY_DEVICE, lane_key
+from .models import AvailabilityDay
+
+
+def jalali_key(day: date) -> str:
+    return jdatetime.date.fromgregorian(date=day).strftime('%Y-%m-%d')
+
+
+def django_week_day(day_of_week: int) -> int:
+    """تبدیل روز هفته مدل WorkHours (۰=شنبه) به lookup week_day جنگو (۱=یکشنبه)."""
+    python_weekday = (day_of_week - 2) % 7
+    return (python_weekday + 1) % 7 + 1
+
+
+def _missing_runs(days: List[date]) -> List[List[date]]:
+    """گروه‌بندی روزهای غایب به بازه‌های پیوسته تا هر بازه با یک فراخوانی محاسبه شود."""
+    runs: List[List[date]] = []
+    for day in days:
+        if runs and (day - runs[-1][-1]).days == 1:
+            runs[-1].append(day)
+        else:
+            runs.append([day])
+    return runs
+
+
+ROWS_VERSION_TIMEOUT = 60 * 60 * 24
+
+
+def _rows_version_key(device_id: Optional[int]) -> str:
+    return f"booking:availability-rows:{lane_key(device_id)}"
+
+
+def _rows_version(device_id: Optional[int]) -> int:
+    """شمارنده اصلاح ردیف‌های یک خط؛ با شروع هر patch_lane_days بالا می‌رود."""
+    return cache.get(_rows_version_key(device_id), 0)
+
+
+def _bump_rows_version(device_id: Optional[int]) -> None:
+    key = _rows_version_key(device_id)
+    cache.add(key, 0, ROWS_VERSION_TIMEOUT)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, ROWS_VERSION_TIMEOUT)
+
+
+def services_key(service_ids: Iterable[Union[int, str]]) -> str:
+    """کلید یکتای ترکیب خدمات (مستقل از ترتیب انتخاب)."""
+    return ",".join(str(sid) for sid in sorted({int(sid) for sid in service_ids}))
+
+
+def _compute_rows(service: Service, key: str, device_id, gender: str, duration: int,
+                  days: List[date]) -> List[AvailabilityDay]:
+    rows = []
+    for run in _missing_runs(days):
+        slots_map = generate_available_slots_for_range(
+            start_date=run[0],
+            end_date=run[-1],
+            service_ids=key.split(','),
+            device_id=device_id,
+            gender_param=gender,
+            with_holds=False,
+        )
+        for day in run:
+            j_key = jalali_key(day)
+            rows.append(AvailabilityDay(
+                service=service,
+                service_ids=key,
+                service_group_id=service.group_id,
+                device_id=device_id,
+                gender=gender,
+                duration=duration,
+                date=day,
+                jalali_date=j_key,
+                slots=slots_map.get(j_key, []),
+            ))
+    return rows
+
+
+def get_available_slots(
+    start_date: date,
+    end_date: date,
+    service_ids: List[str],
+    device_id: Union[int, None],
+    patient_user: Union[CustomUser, None] = None,
+    gender_param: str = None
+) -> Dict[str, List[Dict]]:
+    """
+    معادل generate_available_slots_for_range که از جدول مادی‌شده می‌خواند.
+    خروجی همان ساختار {تاریخ شمسی: [اسلات‌ها]} است.
+    """
+    services = list(Service.objects.select_related('group').filter(id__in=service_ids).order_by('pk'))
+    if not services:
+        return {}
+    total_duration = sum(s.duration for s in services)
+    if total_duration == 0:
+        return {}
+    service = services[0]
+    if service.group.has_devices and not device_id:
+        return {}
+    lane_device_id = device_id if service.group.has_devices else None
+    gender = resolve_target_gender(patient_user, gender_param)
+    key = services_key(s.id for s in services)
+
+    if lane_device_id == ANY_DEVICE:
+        # حالت «هر دستگاهی» ترکیبی از چند خط است و در جدول روزانه ذخیره نمی‌شود
+        return generate_available_slots_for_range(
+            start_date=start_date,
+            end_date=end_date,
+            service_ids=key.split(','),
+            device_id=ANY_DEVICE,
+            gender_param=gender,
+        )
+
+    today = timezone.localdate()
+    start_date = max(start_date, today)
+    if end_date < start_date:
+        return {}
+
+    rows_qs = AvailabilityDay.objects.filter(
+        service_ids=key,
+        device_id=lane_device_id,
+        gender=gender,
+        date__range=(start_date, end_date),
+    ).only('date', 'jalali_date', 'slots')
+    rows = {row.date: row for row in rows_qs}
+
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    missing = [day for day in days if day not in rows]
+    if missing:
+        rows_version = _rows_version(lane_device_id)
+        computed = _compute_rows(service, key, lane_device_id, gender, total_duration, missing)
+        try:
+            with transaction.atomic():
+                AvailabilityDay.objects.bulk_create(computed, ignore_conflicts=True)
+        except IntegrityError:
+            pass
+        rows.update({row.date: row for row in computed})
+        if _rows_version(lane_device_id) != rows_version:
+            # نوبتی که بین محاسبه و درج commit شده، ردیف‌های هنوز درج‌نشده را اصلاح نکرده است
+            patch_lane_days(lane_device_id, missing)
+            rows.update({row.date: row for row in rows_qs.filter(date__in=missing)})
+
+    slots_map = {rows[day].jalali_date: rows[day].slots for day in days}
+    # ردیف‌ها بدون نگه‌داشت‌های موقت ذخیره می‌شوند؛ روزهای دارای نگه‌داشت فعال دوباره محاسبه می‌شوند
+    for day in held_days(lane_device_id):
+        if start_date <= day <= end_date:
+            j_key = jalali_key(day)
+            slots_map[j_key] = generate_available_slots_for_range(
+                day, day, key.split(','), lane_device_id, gender_param=gender
+            ).get(j_key, [])
+    # اسلات‌های امروز که در فاصله محاسبه تا الان گذشته‌اند حذف می‌شوند
+    return drop_elapsed_slots(slots_map)
+
+
+def patch_lane_days(device_id: Optional[int], days: Iterable[date]) -> None:
+    """
+    محاسبه مجدد ردیف‌های موجود یک خط فقط برای روزهای درگیر.
+    برای خط بدون دستگاه، ردیف‌های تمام گروه‌های بدون دستگاه (device خالی) اصلاح می‌شوند.
+    """
+    days = sorted(day for day in set(days) if day >= timezone.localdate())
+    if not days:
+        return
+    # قبل از خواندن ردیف‌ها؛ خواننده‌ای که هم‌زمان ردیف تازه درج می‌کند تغییر را می‌بیند و خودش اصلاح می‌کند
+    _bump_rows_version(device_id)
+    affected = AvailabilityDay.objects.filter(device_id=device_id, date__in=days).select_related('service')
+    keys = {}
+    for row in affected:
+        keys.setdefault((row.service_ids, row.gender), (row.service, row.duration, set()))[2].add(row.date)
+
+    for (key, gender), (service, duration, key_days) in keys.items():
+        for row in _compute_rows(service, key, device_id, gender, duration, sorted(key_days)):
+            AvailabilityDay.objects.filter(
+                service_ids=key, device_id=device_id, gender=gender, date=row.date
+            ).update(slots=row.slots, updated_at=timezone.now())
+
+
+def discard_work_hours_days(service_id: Optional[int], service_group_id: Optional[int], day_of_week: int) -> None:
+    """
+    حذف ردیف‌های روزهای هفته‌ای که ساعات کاری آن‌ها تغییر کرده است.
+    این روزها در خواندن بعدی دوباره محاسبه می‌شوند.
+    اولویت ساعات اختصاصی خدمت بر گروه برای کل هفته تعیین می‌شود (اولین ساعت اختصاصی
+    تمام روزهای گروه را کنار می‌گذارد)، پس تغییر ساعات یک خدمت تمام روزهای آینده آن را حذف می‌کند.
+    """
+    rows = AvailabilityDay.objects.filter(date__gte=timezone.localdate())
+    if service_id:
+        rows = rows.filter(service_id=service_id)
+    elif service_group_id:
+        rows = rows.filter(service_group_id=service_group_id, date__week_day=django_week_day(day_of_week))
+    else:
+        return
+    rows.delete()
+
+
+def discard_service_days(service_id: int) -> None:
+    """
+    حذف ردیف‌های آینده تمام ترکیب‌هایی که خدمت در آن‌ها هست (مثلاً بعد از تغییر مدت یا گروه خدمت).
+    کلید ترکیب رشته مرتب شناسه‌ها با ویرگول است (services_key).
+    """
+    sid = str(service_id)
+    AvailabilityDay.objects.filter(
+        Q(service_ids=sid) | Q(service_ids__startswith=f'{sid},') | Q(service_ids__endswith=f',{sid}')
+        | Q(service_ids__contains=f',{sid},'),
+        date__gte=timezone.localdate(),
+    ).delete()
+
+
+def discard_group_days(service_group_id: int) -> None:
+    """حذف ردیف‌های آینده یک گروه (مثلاً بعد از تغییر گام اسلات‌ها) تا دوباره محاسبه شوند."""
+    AvailabilityDay.objects.filter(service_group_id=service_group_id, date__gte=timezone.localdate()).delete()
+
+
+def discard_device_days(device_id: int) -> None:
+    """حذف ردیف‌های آینده یک دستگاه (مثلاً بعد از تغییر ظرفیت آن) تا دوباره محاسبه شوند."""
+    AvailabilityDay.objects.filter(device_id=device_id, date__gte=timezone.localdate()).delete()
+
+
+def discard_closure_days(service_group_id: Optional[int], device_id: Optional[int],
+                         start_date: date, end_date: date) -> None:
+    """حذف ردیف‌های آینده روزهایی که یک تعطیلی (کلینیک، گروه یا دستگاه) روی آن‌ها اثر دارد."""
+    rows = AvailabilityDay.objects.filter(date__range=(max(start_date, timezone.localdate()), end_date))
+    if device_id:
+        rows = rows.filter(device_id=device_id)
+    elif service_group_id:
+        rows = rows.filter(service_group_id=service_group_id)
+    rows.delete()
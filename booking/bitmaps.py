@@ -0,0 +1,33 @@
+# booking/bitmaps.py
+"""
+عملیات خالص روی بیت‌مپ اشغال روزانه (بیت i = دقیقه i ام روز محلی).
+این ماژول به جنگو وابسته نیست تا موتور اسلات‌ها در پروسه‌های جداگانه هم قابل اجرا باشد.
+"""
+
+from typing import List, Tuple
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def minute_mask(start_minute: int, end_minute: int) -> int:
+    """ماسک بیتی دقایق [start_minute, end_minute)."""
+    if end_minute <= start_minute:
+        return 0
+    return ((1 << (end_minute - start_minute)) - 1) << start_minute
+
+
+def busy_run_end(bitmap: int, minute: int) -> int:
+    """دقیقه پایان بلوک اشغال‌شده‌ای که از minute شروع شده (اولین دقیقه آزاد بعد از آن)."""
+    rest = bitmap >> minute
+    return minute + (rest ^ (rest + 1)).bit_length() - 1
+
+
+def bitmap_runs(bitmap: int) -> List[Tuple[int, int]]:
+    """تبدیل بیت‌مپ به لیست مرتب بلوک‌های اشغال [start, end) به دقیقه."""
+    runs = []
+    while bitmap:
+        start = (bitmap & -bitmap).bit_length() - 1
+        end = busy_run_end(bitmap, start)
+        runs.append((start, end))
+        bitmap &= ~minute_mask(start, end)
+    return runs
@@ -1,13 +1,29 @@
 # booking/calendar_logic.py
-from datetime import datetime, time, timedelta, date
-from typing import List, Dict, Union
+import asyncio
+import logging
+from datetime import datetime, timedelta, date
+from typing import Callable, Iterator, List, Dict, NamedTuple, Optional, Tuple, Union
 import jdatetime
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.utils import timezone
-from django.db.models import Q
-from clinic.models import Service, WorkHours
-from .models import Appointment
+from clinic.models import Service, ServiceGroup
+from .closures import NO_CLOSURES, ClosureCalendar, alanes_closures, closure_rows, lane_calendar, lanes_closures
+from .holds import alanes_holds, lanes_hold_masks, lanes_holds
+from .lanes import ANY_DEVICE, lane_key
+from .occupancy import MINUTES_PER_DAY, aget_day_bitmaps, get_day_bitmaps, get_lanes_day_bitmaps, local_midnight
+from .resources import groups_resource_masks, resource_masks
+from .schedule import WeeklySchedule, aget_weekly_schedule, get_weekly_schedule, get_weekly_schedules
+from .slot_engines import (
+    SLOT_ENGINES, DayPlan, FreeSlots, SlotJob, best_fit_split, run_slot_job, run_slot_jobs
+)
 from users.models import CustomUser
 
+logger = logging.getLogger(__name__)
+
+# طول هر تکه (روز) در تولید جریانی اسلات‌ها
+STREAM_CHUNK_DAYS = 7
+
 PERSIAN_WEEKDAYS = {0: "شنبه", 1: "یکشنبه", 2: "دوشنبه", 3: "سه‌شنبه", 4: "چهارشنبه", 5: "پنجشنبه", 6: "جمعه"}
 PERSIAN_MONTHS = ["فروردین", "اردیبهشت", "خرداد", "تیر", "مرداد", "شهریور", "مهر", "آبان", "آذر", "دی", "بهمن", "اسفند"]
 PERSIAN_DIGITS = {'0': '۰', '1': '۱', '2': '۲', '3': '۳', '4': '۴', '5': '۵', '6': '۶', '7': '۷', '8': '۸', '9': '۹'}
@@ -15,133 +31,623 @@ PERSIAN_DIGITS = {'0': '۰', '1': '۱', '2': '۲', '3': '۳', '4': '۴', '5': '
 def localize_digits(text: Union[str, int]) -> str:
     return "".join(PERSIAN_DIGITS.get(char, char) for char in str(text))
 
-def generate_available_slots_for_range(
-    start_date: date, 
-    end_date: date, 
-    service_ids: List[str], 
-    device_id: Union[int, None], 
+# جدول‌های از پیش ساخته‌شده دقیقه‌ی روز -> برچسب ساعت (فارسی برای نمایش، لاتین برای ISO)
+PERSIAN_TIME_LABELS = tuple(localize_digits(f"{m // 60:02d}:{m % 60:02d}") for m in range(MINUTES_PER_DAY))
+ISO_TIME_LABELS = tuple(f"{m // 60:02d}:{m % 60:02d}:00" for m in range(MINUTES_PER_DAY))
+
+class DayLabels(NamedTuple):
+    """برچسب‌های یک روز تقویم که فقط یک بار برای هر روز محاسبه می‌شوند."""
+    jalali_key: str
+    readable_prefix: str
+    iso_prefix: str
+    iso_offset: Optional[str]
+
+def day_labels(day: date) -> DayLabels:
+    """
+    کلید تاریخ شمسی، پیشوند متن خوانا ("شنبه ۵ آذر، ساعت ") و پیشوند/آفست ISO روز.
+    اگر آفست منطقه زمانی در طول روز ثابت نباشد، iso_offset خالی است.
+    """
+    j_day = jdatetime.date.fromgregorian(date=day)
+    day_start = local_midnight(day)
+    day_last_minute = day_start + timedelta(minutes=MINUTES_PER_DAY - 1)
+    iso_start = day_start.isoformat()
+    uniform_offset = day_start.utcoffset() == day_last_minute.utcoffset()
+    return DayLabels(
+        jalali_key=f"{j_day.year:04d}-{j_day.month:02d}-{j_day.day:02d}",
+        readable_prefix="{} {} {}، ساعت ".format(
+            PERSIAN_WEEKDAYS[j_day.weekday()],
+            localize_digits(j_day.day),
+            PERSIAN_MONTHS[j_day.month - 1],
+        ),
+        iso_prefix=iso_start[:11],
+        iso_offset=iso_start[19:] if uniform_offset else None,
+    )
+
+def drop_elapsed_slots(slots_map: Dict[str, List[Dict]]) -> Dict[str, List[Dict]]:
+    """حذف اسلات‌هایی که از زمان محاسبه (مثلاً در کش) تا الان گذشته‌اند."""
+    now = timezone.now()
+    today = timezone.localdate(now).isoformat()
+    result = {}
+    for date_key, slots in slots_map.items():
+        # فقط روزهای امروز و گذشته بررسی می‌شوند (در چینش فشرده اسلات‌ها به ترتیب ساعت نیستند)
+        if slots and slots[0]['start'][:10] <= today:
+            slots = [slot for slot in slots if datetime.fromisoformat(slot['end']) > now]
+        if slots:
+            result[date_key] = slots
+    return result
+
+def compact_slots_map(slots_map: Dict[str, List[Dict]]) -> Tuple[Optional[int], Dict[str, Dict]]:
+    """
+    قالب فشرده ستونی برای ارسال: برای هر روز فقط تاریخ میلادی، آفست منطقه زمانی
+    و آرایه دقیقه‌های شروع (از نیمه‌شب محلی)؛ مدت اسلات یک بار برای کل پاسخ.
+    برچسب‌ها و ISO کامل در مرورگر (booking-ui.js) ساخته می‌شوند.
+    اگر آفست در طول روز ثابت نباشد، آرایه offsets برای هر اسلات جداگانه ارسال می‌شود
+    و شناسه دستگاه تخصیص‌یافته (حالت «هر دستگاهی») در آرایه devices می‌آید.
+    """
+    duration = None
+    days = {}
+    for date_key, slots in slots_map.items():
+        if not slots:
+            continue
+        starts, offsets, devices = [], [], []
+        for slot in slots:
+            start = datetime.fromisoformat(slot['start'])
+            if duration is None:
+                duration = int((datetime.fromisoformat(slot['end']) - start).total_seconds() // 60)
+            starts.append(start.hour * 60 + start.minute)
+            offsets.append(slot['start'][19:])
+            devices.append(slot.get('device_id'))
+        day = {'date': slot['start'][:10], 'starts': starts}
+        if len(set(offsets)) == 1:
+            day['tz'] = offsets[0]
+        else:
+            day['offsets'] = offsets
+        if any(device_id is not None for device_id in devices):
+            day['devices'] = devices
+        days[date_key] = day
+    return duration, days
+
+def resolve_target_gender(patient_user: Union[CustomUser, None] = None, gender_param: str = None) -> str:
+    """تعیین جنسیت هدف برای فیلتر ساعات کاری."""
+    if gender_param in ['MALE', 'FEMALE']:
+        return gender_param
+    if patient_user and patient_user.gender:
+        return patient_user.gender
+    # پیش‌فرض برای مهمانان "بانوان" است
+    # چون اکثر خدمات کلینیک زیبایی زنانه است.
+    return 'FEMALE'
+
+class SlotRequest(NamedTuple):
+    """
+    درخواست اسلات پس از اعتبارسنجی: خدمت مرجع، خط، مدت کل، برنامه هفتگی
+    و سیاست شبکه اسلات گروه (گام و چینش فشرده).
+    lane_device_id می‌تواند ANY_DEVICE باشد (تمام دستگاه‌های گروه).
+    """
+    service: Service
+    lane_device_id: Union[int, str, None]
+    total_duration: int
+    schedule: WeeklySchedule
+    step: int
+    best_fit: bool
+
+def _resolve_slot_request(
+    service_ids: List[str],
+    device_id: Union[int, str, None],
     patient_user: Union[CustomUser, None] = None,
     gender_param: str = None
-) -> Dict[str, List[Dict]]:
-    
+) -> Optional[SlotRequest]:
     try:
         services = Service.objects.select_related('group').filter(id__in=service_ids)
-        if not services.exists(): return {}
+        if not services.exists(): return None
         total_duration = sum(s.duration for s in services)
-        if total_duration == 0: return {}
+        if total_duration == 0: return None
         service = services.first()
-        service_group = service.group
-        if service_group.has_devices and not device_id: return {}
+        if service.group.has_devices and not device_id: return None
     except Exception:
-        return {}
+        return None
 
-    # --- منطق اصلاح شده جنسیت ---
-    target_gender = 'ALL'
-    if gender_param in ['MALE', 'FEMALE']:
-        target_gender = gender_param
-    elif patient_user and patient_user.gender:
-        target_gender = patient_user.gender
-    else:
-        # تغییر مهم: پیش‌فرض برای مهمانان "بانوان" است
-        # چون اکثر خدمات کلینیک زیبایی زنانه است.
-        target_gender = 'FEMALE' 
-        
-    gender_filter = Q(gender_specific='ALL') 
-    if target_gender != 'ALL':
-        gender_filter = Q(gender_specific=target_gender) | Q(gender_specific='ALL')
-    
-    # --- ادامه کد بدون تغییر ---
-    days_diff = (end_date - start_date).days
-    weekday_range = set((start_date + timedelta(days=i)).weekday() for i in range(days_diff + 1))
-    model_weekdays = [(d + 2) % 7 for d in weekday_range]
-
-    work_hours_qs = service.work_hours.filter(day_of_week__in=model_weekdays).filter(gender_filter)
-    if not work_hours_qs.exists():
-        work_hours_qs = service.group.work_hours.filter(day_of_week__in=model_weekdays).filter(gender_filter)
-
-    work_hours_map = {}
-    for wh in work_hours_qs:
-        work_hours_map.setdefault(wh.day_of_week, []).append(wh)
-
-    aware_start_dt = timezone.make_aware(datetime.combine(start_date, time.min))
-    aware_end_dt = timezone.make_aware(datetime.combine(end_date, time.max))
-
-    booked_qs = Appointment.objects.filter(
-        start_time__lt=aware_end_dt,
-        end_time__gt=aware_start_dt,
-        status__in=['CONFIRMED', 'PENDING']
+    # برنامه هفتگی کامپایل‌شده (اولویت خدمت بر گروه، شیفت‌های ادغام‌شده به دقیقه)
+    schedule = get_weekly_schedule(service, resolve_target_gender(patient_user, gender_param))
+    return _build_slot_request(service, device_id, total_duration, schedule)
+
+async def _aresolve_slot_request(
+    service_ids: List[str],
+    device_id: Union[int, str, None],
+    patient_user: Union[CustomUser, None] = None,
+    gender_param: str = None
+) -> Optional[SlotRequest]:
+    """نسخه async از _resolve_slot_request با ORM و کش async."""
+    services = [
+        s async for s in Service.objects.select_related('group').filter(id__in=service_ids).order_by('pk')
+    ]
+    total_duration = sum(s.duration for s in services)
+    if not services or total_duration == 0: return None
+    service = services[0]
+    if service.group.has_devices and not device_id: return None
+
+    schedule = await aget_weekly_schedule(service, resolve_target_gender(patient_user, gender_param))
+    return _build_slot_request(service, device_id, total_duration, schedule)
+
+def _build_slot_request(service: Service, device_id: Union[int, str, None], total_duration: int,
+                        schedule: WeeklySchedule) -> Optional[SlotRequest]:
+    if schedule.is_empty(): return None
+    service_group = service.group
+    return SlotRequest(
+        service=service,
+        # خط نوبت: دستگاه انتخابی یا خط مشترک بدون دستگاه
+        lane_device_id=device_id if service_group.has_devices else None,
+        total_duration=total_duration,
+        schedule=schedule,
+        # گام اسلات‌ها: تنظیم گروه یا (پیش‌فرض) مدت کل خدمات
+        step=service_group.slot_step or total_duration,
+        best_fit=service_group.best_fit_slots,
     )
-    
-    if service_group.has_devices:
-        booked_qs = booked_qs.filter(selected_device_id=device_id)
-    else:
-        booked_qs = booked_qs.filter(selected_device__isnull=True)
-            
-    booked_intervals_map = {}
-    current_tz = timezone.get_current_timezone()
-    
-    for app in booked_qs:
-        local_start = timezone.localtime(app.start_time, current_tz)
-        date_key = local_start.date()
-        booked_intervals_map.setdefault(date_key, set()).add((app.start_time, app.end_time))
+
+def slot_engine_name() -> str:
+    """نام موتور انتخاب‌شده در تنظیمات؛ اگر numpy نصب نباشد به موتور مرجع برمی‌گردد."""
+    name = getattr(settings, 'BOOKING_SLOT_ENGINE', 'python')
+    if name == 'numpy':
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            logger.warning("BOOKING_SLOT_ENGINE=numpy but numpy is not installed; using the python engine.")
+            return 'python'
+    return name if name in SLOT_ENGINES else 'python'
+
+def get_slot_engine() -> Callable[..., FreeSlots]:
+    return SLOT_ENGINES[slot_engine_name()]
+
+def _slot_job(slot_request: SlotRequest, plans: List[DayPlan], lane: Optional[str] = None,
+              engine: Optional[str] = None) -> SlotJob:
+    """آداپتور ORM به هسته موتور: تبدیل درخواست اعتبارسنجی‌شده و برنامه روزها به SlotJob ساده."""
+    return SlotJob(
+        lane=lane or lane_key(slot_request.lane_device_id),
+        plans=tuple(plans),
+        duration=slot_request.total_duration,
+        step=slot_request.step,
+        best_fit=slot_request.best_fit,
+        engine=engine or slot_engine_name(),
+    )
+
+def _free_slots(slot_request: SlotRequest, plans: List[DayPlan], engine: Optional[str] = None) -> FreeSlots:
+    """اجرای موتور جاروب با گام گروه و در صورت فعال بودن، ترتیب چینش فشرده روی هر روز."""
+    return run_slot_job(_slot_job(slot_request, plans, engine=engine))
+
+def _day_plans(schedule: WeeklySchedule, start_date: date, end_date: date, now: datetime,
+               day_bitmaps: Dict[date, int], closures: ClosureCalendar = NO_CLOSURES,
+               held: Optional[Dict[date, int]] = None,
+               resources: Optional[Dict[date, int]] = None) -> List[DayPlan]:
+    """
+    برنامه روزهای کاری بازه همراه با بیت‌مپ اشغال هر روز.
+    روزهای کاملاً تعطیل با یک بررسی عضویت کنار گذاشته می‌شوند و ساعات بسته، بازه‌های
+    نگه‌داشته‌شده (held) و دقایقی که منابع لازم گروه آزاد نیستند (resources) به بیت‌مپ اضافه می‌شوند.
+    """
+    held = held or {}
+    resources = resources or {}
+    plans = []
+    current_date = start_date
+    while current_date <= end_date:
+        daily_shifts = schedule.shifts((current_date.weekday() + 2) % 7)
+        if daily_shifts and not closures.is_closed(current_date):
+            day_start = local_midnight(current_date)
+            plans.append(DayPlan(
+                day=current_date,
+                shifts=daily_shifts,
+                bitmap=closures.apply(
+                    current_date,
+                    day_bitmaps.get(current_date, 0) | held.get(current_date, 0) | resources.get(current_date, 0),
+                ),
+                # دقایق سپری‌شده از روز (فقط برای امروز مثبت است) برای حذف اسلات‌های گذشته
+                elapsed_minutes=(now - day_start).total_seconds() / 60,
+                booked=day_bitmaps.get(current_date, 0),
+            ))
+        current_date += timedelta(days=1)
+    return plans
+
+def _lane_day_plans(slot_request: SlotRequest, start_date: date, end_date: date, now: datetime,
+                    with_holds: bool = True) -> List[DayPlan]:
+    """
+    برنامه روزهای خط درخواست (بیت‌مپ‌ها از کش یا با یک کوئری برای روزهای غایب، تعطیلی‌ها با یک کوئری).
+    with_holds=False نگه‌داشت‌های موقت را نادیده می‌گیرد (برای جدول مادی‌شده که نباید آن‌ها را ذخیره کند).
+    """
+    if end_date < start_date:
+        return []
+    lane = slot_request.lane_device_id
+    day_bitmaps = get_day_bitmaps(lane, start_date, end_date)
+    closures = lanes_closures(slot_request.service.group_id, [lane], start_date, end_date)[lane]
+    held = lanes_hold_masks(lanes_holds([lane]), start_date, end_date)[lane] if with_holds else None
+    resources = resource_masks(slot_request.service.group_id, start_date, end_date)
+    return _day_plans(slot_request.schedule, start_date, end_date, now, day_bitmaps, closures, held, resources)
+
+def _render_day_slots(labels: DayLabels, day: date, slot_minutes: List[int], duration: int) -> List[Dict]:
+    """ساخت دیکشنری اسلات‌ها؛ برچسب‌ها فقط با الحاق رشته‌های از پیش ساخته‌شده تولید می‌شوند."""
+    slots = []
+    for slot_minute in slot_minutes:
+        slot_end_minute = slot_minute + duration
+        if labels.iso_offset is not None:
+            start_iso = labels.iso_prefix + ISO_TIME_LABELS[slot_minute] + labels.iso_offset
+            end_iso = labels.iso_prefix + ISO_TIME_LABELS[slot_end_minute] + labels.iso_offset
+        else:
+            day_start = local_midnight(day)
+            start_iso = (day_start + timedelta(minutes=slot_minute)).isoformat()
+            end_iso = (day_start + timedelta(minutes=slot_end_minute)).isoformat()
+        slots.append({
+            "start": start_iso,
+            "end": end_iso,
+            "readable_start": labels.readable_prefix + PERSIAN_TIME_LABELS[slot_minute]
+        })
+    return slots
+
+def _generate_any_device_slots(slot_request: SlotRequest, start_date: date, end_date: date,
+                               now: datetime) -> Dict[str, List[Dict]]:
+    """
+    حالت «هر دستگاهی»: اشغال تمام دستگاه‌های گروه یکجا خوانده می‌شود، برای هر دستگاه
+    جاروب جداگانه انجام و اجتماع اسلات‌های آزاد برگردانده می‌شود.
+    هر اسلات شناسه دستگاهی را که به آن تخصیص داده می‌شود (اولین دستگاه آزاد) در device_id دارد.
+    """
+    device_ids = list(
+        slot_request.service.group.available_devices.order_by('id').values_list('id', flat=True)
+    )
+    if not device_ids or end_date < start_date:
+        return {}
+    lanes_bitmaps = get_lanes_day_bitmaps(device_ids, start_date, end_date)
+    calendars = lanes_closures(slot_request.service.group_id, device_ids, start_date, end_date)
+    held = lanes_hold_masks(lanes_holds(device_ids), start_date, end_date)
+    resources = resource_masks(slot_request.service.group_id, start_date, end_date)
+
+    assigned: Dict[date, Dict[int, int]] = {}
+    # در چینش فشرده، اسلاتی که روی یکی از دستگاه‌ها چسبیده است به همان دستگاه تخصیص می‌یابد و اول می‌آید
+    packed: Dict[date, set] = {}
+    for device_id in device_ids:
+        plans = _day_plans(
+            slot_request.schedule, start_date, end_date, now, lanes_bitmaps[device_id], calendars[device_id],
+            held[device_id], resources,
+        )
+        job = _slot_job(slot_request, plans, lane_key(device_id))
+        plans_by_day = {plan.day: plan for plan in plans}
+        for day, slot_minutes in run_slot_job(job._replace(best_fit=False)):
+            day_assignments = assigned.setdefault(day, {})
+            day_packed = packed.setdefault(day, set())
+            if job.best_fit:
+                for slot_minute in best_fit_split(plans_by_day[day], slot_minutes, job.duration)[0]:
+                    if slot_minute not in day_packed:
+                        day_packed.add(slot_minute)
+                        day_assignments[slot_minute] = device_id
+            for slot_minute in slot_minutes:
+                day_assignments.setdefault(slot_minute, device_id)
 
     all_available_slots_map = {}
+    for day in sorted(assigned):
+        labels = day_labels(day)
+        day_packed = packed[day]
+        slot_minutes = sorted(assigned[day], key=lambda slot_minute: (slot_minute not in day_packed, slot_minute))
+        slots = _render_day_slots(labels, day, slot_minutes, slot_request.total_duration)
+        for slot, slot_minute in zip(slots, slot_minutes):
+            slot["device_id"] = assigned[day][slot_minute]
+        all_available_slots_map[labels.jalali_key] = slots
+    return all_available_slots_map
+
+def iter_available_slots(
+    start_date: date,
+    end_date: date,
+    service_ids: List[str],
+    device_id: Union[int, str, None],
+    patient_user: Union[CustomUser, None] = None,
+    gender_param: str = None,
+    chunk_days: Optional[int] = STREAM_CHUNK_DAYS,
+    with_holds: bool = True
+) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    نسخه مولد (generator): اسلات‌ها روز به روز به صورت (تاریخ شمسی، اسلات‌ها) تولید می‌شوند.
+    بیت‌مپ‌ها و جاروب در تکه‌های chunk_days روزه انجام می‌شود تا حافظه مستقل از طول بازه بماند؛
+    chunk_days=None کل بازه را یکجا پردازش می‌کند.
+    بازه‌های نگه‌داشته‌شده (booking/holds.py) اشغال حساب می‌شوند، مگر with_holds=False.
+    """
+    slot_request = _resolve_slot_request(service_ids, device_id, patient_user, gender_param)
+    if slot_request is None: return
+
     today = timezone.now().date()
     now = timezone.now()
-    
-    current_date = start_date
-    while current_date <= end_date:
-        if current_date < today:
-            current_date += timedelta(days=1)
-            continue
+    chunk_start = max(start_date, today)
+    while chunk_start <= end_date:
+        chunk_end = end_date if chunk_days is None else min(chunk_start + timedelta(days=chunk_days - 1), end_date)
+
+        if slot_request.lane_device_id == ANY_DEVICE:
+            yield from _generate_any_device_slots(slot_request, chunk_start, chunk_end, now).items()
+        else:
+            # روزهای گذشته و روزهای بدون شیفت در برنامه روزانه حذف می‌شوند
+            plans = _lane_day_plans(slot_request, chunk_start, chunk_end, now, with_holds)
+            for current_date, slot_minutes in _free_slots(slot_request, plans):
+                labels = day_labels(current_date)
+                yield labels.jalali_key, _render_day_slots(
+                    labels, current_date, slot_minutes, slot_request.total_duration
+                )
+        chunk_start = chunk_end + timedelta(days=1)
+
+def _render_free_slots(slot_request: SlotRequest, plans: List[DayPlan]) -> Dict[str, List[Dict]]:
+    """جاروب و ساخت برچسب‌ها؛ فقط CPU و بدون دسترسی به دیتابیس (قابل اجرا در thread executor)."""
+    all_available_slots_map = {}
+    for current_date, slot_minutes in _free_slots(slot_request, plans):
+        labels = day_labels(current_date)
+        all_available_slots_map[labels.jalali_key] = _render_day_slots(
+            labels, current_date, slot_minutes, slot_request.total_duration
+        )
+    return all_available_slots_map
+
+async def agenerate_available_slots_for_range(
+    start_date: date,
+    end_date: date,
+    service_ids: List[str],
+    device_id: Union[int, str, None],
+    patient_user: Union[CustomUser, None] = None,
+    gender_param: str = None
+) -> Dict[str, List[Dict]]:
+    """
+    نسخه async از generate_available_slots_for_range برای ویوهای ASGI.
+    خدمات، برنامه هفتگی و بیت‌مپ‌ها با ORM/کش async خوانده می‌شوند و جاروب CPU-bound
+    در thread executor اجرا می‌شود تا event loop آزاد بماند.
+    حالت «هر دستگاهی» از مسیر sync در یک thread اجرا می‌شود.
+    """
+    if device_id == ANY_DEVICE:
+        return await sync_to_async(generate_available_slots_for_range)(
+            start_date, end_date, service_ids, device_id, patient_user, gender_param
+        )
+    slot_request = await _aresolve_slot_request(service_ids, device_id, patient_user, gender_param)
+    if slot_request is None: return {}
+
+    today = timezone.now().date()
+    now = timezone.now()
+    start_date = max(start_date, today)
+    if end_date < start_date: return {}
 
-        our_day_of_week = (current_date.weekday() + 2) % 7
-        daily_work_hours = work_hours_map.get(our_day_of_week, [])
-        if not daily_work_hours:
-            current_date += timedelta(days=1)
+    lane = slot_request.lane_device_id
+    day_bitmaps = await aget_day_bitmaps(lane, start_date, end_date)
+    closures = (await alanes_closures(slot_request.service.group_id, [lane], start_date, end_date))[lane]
+    holds = await alanes_holds([lane])
+    held = (await sync_to_async(lanes_hold_masks)(holds, start_date, end_date))[lane] if holds[lane] else None
+    resources = await sync_to_async(resource_masks)(slot_request.service.group_id, start_date, end_date)
+    plans = _day_plans(slot_request.schedule, start_date, end_date, now, day_bitmaps, closures, held, resources)
+    return await asyncio.get_running_loop().run_in_executor(None, _render_free_slots, slot_request, plans)
+
+def generate_available_slots_for_range(
+    start_date: date, 
+    end_date: date, 
+    service_ids: List[str], 
+    device_id: Union[int, str, None], 
+    patient_user: Union[CustomUser, None] = None,
+    gender_param: str = None,
+    with_holds: bool = True
+) -> Dict[str, List[Dict]]:
+    """کل نقشه اسلات‌های بازه در یک دیکشنری (برای کش و پاسخ‌های معمولی)."""
+    return dict(iter_available_slots(
+        start_date, end_date, service_ids, device_id, patient_user, gender_param, chunk_days=None,
+        with_holds=with_holds
+    ))
+
+def next_available_slots(
+    service_ids: List[str],
+    device_id: Union[int, str, None],
+    patient_user: Union[CustomUser, None] = None,
+    gender_param: str = None,
+    limit: int = 1,
+    from_date: Optional[date] = None,
+    horizon_days: int = 365,
+    window_days: int = 7
+) -> List[Dict]:
+    """
+    اولین اسلات(های) آزاد از امروز به بعد.
+    روزها در پنجره‌های کوچک (window_days) جلو می‌روند و بیت‌مپ اشغال فقط برای همان پنجره
+    خوانده می‌شود؛ به محض پیدا شدن limit اسلات، جستجو متوقف می‌شود.
+    هر اسلات علاوه بر فیلدهای معمول، کلید تاریخ شمسی (date) را هم دارد.
+    """
+    slot_request = _resolve_slot_request(service_ids, device_id, patient_user, gender_param)
+    if slot_request is None or limit < 1: return []
+
+    today = timezone.now().date()
+    now = timezone.now()
+    window_start = max(from_date or today, today)
+    horizon_end = today + timedelta(days=horizon_days)
+
+    found: List[Dict] = []
+    while window_start <= horizon_end and len(found) < limit:
+        window_end = min(window_start + timedelta(days=window_days - 1), horizon_end)
+        if slot_request.lane_device_id == ANY_DEVICE:
+            any_device_map = _generate_any_device_slots(slot_request, window_start, window_end, now)
+            for date_key, day_slots in any_device_map.items():
+                for slot in day_slots[:limit - len(found)]:
+                    slot["date"] = date_key
+                    found.append(slot)
+            window_start = window_end + timedelta(days=1)
             continue
-            
-        booked_intervals = booked_intervals_map.get(current_date, set())
-        
-        for work_period in daily_work_hours:
-            shift_start = timezone.make_aware(datetime.combine(current_date, work_period.start_time))
-            shift_end = timezone.make_aware(datetime.combine(current_date, work_period.end_time))
-            current_slot_start = shift_start
-            
-            while True:
-                current_slot_end = current_slot_start + timedelta(minutes=total_duration)
-                if current_slot_end > shift_end: break
-                if current_slot_end <= now:
-                    current_slot_start += timedelta(minutes=total_duration)
-                    continue
-
-                is_overlapping = False
-                for (b_start, b_end) in booked_intervals:
-                    if current_slot_start < b_end and current_slot_end > b_start:
-                        is_overlapping = True
-                        break
-                        
-                if not is_overlapping:
-                    j_start = jdatetime.datetime.fromgregorian(datetime=current_slot_start)
-                    readable_string = "{} {} {}، ساعت {}".format(
-                        PERSIAN_WEEKDAYS[j_start.weekday()],
-                        localize_digits(j_start.day),
-                        PERSIAN_MONTHS[j_start.month - 1],
-                        localize_digits(j_start.strftime('%H:%M'))
+
+        plans = _lane_day_plans(slot_request, window_start, window_end, now)
+        for plan in plans:
+            # موتور مرجع روز به روز اجرا می‌شود تا بعد از رسیدن به limit ادامه ندهد
+            for day, slot_minutes in _free_slots(slot_request, [plan], 'python'):
+                labels = day_labels(day)
+                needed = limit - len(found)
+                for slot in _render_day_slots(labels, day, slot_minutes[:needed], slot_request.total_duration):
+                    slot["date"] = labels.jalali_key
+                    found.append(slot)
+            if len(found) >= limit:
+                break
+        window_start = window_end + timedelta(days=1)
+    return found
+
+def first_available_by_service(
+    service_ids: List[str],
+    patient_user: Union[CustomUser, None] = None,
+    gender_param: str = None,
+    from_date: Optional[date] = None,
+    horizon_days: int = 14
+) -> Dict[int, Optional[Dict]]:
+    """
+    اولین اسلات آزاد هر خدمت (هر خدمت جداگانه و نه ترکیبی)، مثلاً برای نشان «اولین نوبت آزاد» در لیست خدمات.
+    تعداد کوئری‌ها ثابت است: خدمات، دستگاه‌های گروه‌ها، ساعات کاری (get_weekly_schedules)،
+    تعطیلی‌ها (closure_rows)، منابع لازم گروه‌ها (groups_resource_masks) و اشغال تمام خطوط (get_lanes_day_bitmaps).
+    سپس روزها یک بار پیمایش می‌شوند و در هر روز خدماتی که هنوز اسلاتی ندارند بررسی می‌شوند؛
+    خدمات یک گروه با شیفت و مدت یکسان روی یک خط نتیجه جاروب را به اشتراک می‌گذارند.
+    برای خدمات دستگاه‌دار، زودترین اسلات بین تمام دستگاه‌های گروه (همراه با device_id) برگردانده می‌شود.
+    """
+    services = list(Service.objects.select_related('group').filter(id__in=service_ids).order_by('id'))
+    result: Dict[int, Optional[Dict]] = {service.id: None for service in services}
+    if not services:
+        return result
+
+    group_devices: Dict[int, List[int]] = {}
+    device_group_ids = {s.group_id for s in services if s.group.has_devices}
+    if device_group_ids:
+        device_links = ServiceGroup.available_devices.through.objects.filter(
+            servicegroup_id__in=device_group_ids
+        ).order_by('device_id').values_list('servicegroup_id', 'device_id')
+        for group_id, device_id in device_links:
+            group_devices.setdefault(group_id, []).append(device_id)
+
+    schedules = get_weekly_schedules(services, resolve_target_gender(patient_user, gender_param))
+    service_lanes = {
+        service.id: group_devices.get(service.group_id, []) if service.group.has_devices else [None]
+        for service in services
+        if service.duration > 0 and not schedules[service.id].is_empty()
+    }
+    if not service_lanes:
+        return result
+
+    today = timezone.now().date()
+    now = timezone.now()
+    start_date = max(from_date or today, today)
+    end_date = today + timedelta(days=horizon_days)
+    if end_date < start_date:
+        return result
+    all_lanes = sorted({lane for lanes in service_lanes.values() for lane in lanes}, key=lambda lane: lane or 0)
+    lanes_bitmaps = get_lanes_day_bitmaps(all_lanes, start_date, end_date)
+    closures = closure_rows(start_date, end_date, {s.group_id for s in services}, all_lanes)
+    held = lanes_hold_masks(lanes_holds(all_lanes), start_date, end_date)
+    resources = groups_resource_masks({s.group_id for s in services}, start_date, end_date)
+    calendars: Dict[tuple, ClosureCalendar] = {}
+
+    by_id = {service.id: service for service in services}
+    pending = list(service_lanes)
+    current_date = start_date
+    while current_date <= end_date and pending:
+        day_of_week = (current_date.weekday() + 2) % 7
+        elapsed_minutes = (now - local_midnight(current_date)).total_seconds() / 60
+        sweeps: Dict[tuple, Optional[int]] = {}
+        still_pending = []
+        for service_id in pending:
+            service = by_id[service_id]
+            daily_shifts = schedules[service_id].shifts(day_of_week)
+            best = None
+            for lane in service_lanes[service_id]:
+                calendar_key = (service.group_id, lane)
+                if calendar_key not in calendars:
+                    calendars[calendar_key] = lane_calendar(closures, service.group_id, lane, start_date, end_date)
+                calendar = calendars[calendar_key]
+                step = service.group.slot_step or service.duration
+                sweep_key = (calendar_key, daily_shifts, service.duration, step, service.group.best_fit_slots)
+                if sweep_key not in sweeps:
+                    bitmap = calendar.apply(
+                        current_date,
+                        lanes_bitmaps[lane].get(current_date, 0) | held[lane].get(current_date, 0)
+                        | resources[service.group_id].get(current_date, 0),
                     )
-                    jalali_date_key = j_start.strftime('%Y-%m-%d')
-                    
-                    slot_data = {
-                        "start": current_slot_start.isoformat(),
-                        "end": current_slot_end.isoformat(),
-                        "readable_start": readable_string
-                    }
-                    if jalali_date_key not in all_available_slots_map:
-                        all_available_slots_map[jalali_date_key] = []
-                    all_available_slots_map[jalali_date_key].append(slot_data)
-                    
-                current_slot_start += timedelta(minutes=total_duration)
+                    plan = DayPlan(current_date, daily_shifts, bitmap, elapsed_minutes,
+                                   lanes_bitmaps[lane].get(current_date, 0))
+                    free = run_slot_job(SlotJob(
+                        lane=lane_key(lane), plans=(plan,), duration=service.duration,
+                        step=step, best_fit=service.group.best_fit_slots,
+                    )) if daily_shifts and not calendar.is_closed(current_date) else []
+                    sweeps[sweep_key] = free[0][1][0] if free else None
+                slot_minute = sweeps[sweep_key]
+                if slot_minute is not None and (best is None or slot_minute < best[0]):
+                    best = (slot_minute, lane)
+            if best is None:
+                still_pending.append(service_id)
+                continue
 
+            labels = day_labels(current_date)
+            slot = _render_day_slots(labels, current_date, [best[0]], service.duration)[0]
+            slot["date"] = labels.jalali_key
+            if best[1] is not None:
+                slot["device_id"] = best[1]
+            result[service_id] = slot
+        pending = still_pending
         current_date += timedelta(days=1)
+    return result
+
+class LanePrecompute(NamedTuple):
+    """کارهای آماده جاروب برای تمام خطوط یک ترکیب خدمات (خروجی prepare_lane_jobs)."""
+    slot_request: SlotRequest
+    lanes: List[Optional[int]]
+    jobs: List[SlotJob]
+    # (خط، نسخه) کش هر خط که پیش از خواندن داده‌ها گرفته شده است
+    scopes: Dict[Optional[int], Tuple[str, str]]
+
+def prepare_lane_jobs(
+    service_ids: List[str],
+    start_date: date,
+    end_date: date,
+    gender_param: str = None
+) -> Optional[LanePrecompute]:
+    """
+    آداپتور ORM پیش‌محاسبه: داده‌های تمام خطوط یک ترکیب خدمات (هر دستگاه گروه یا خط بدون دستگاه)
+    یکجا از دیتابیس/کش خوانده و به SlotJob های مستقل تبدیل می‌شوند.
+    """
+    slot_request = _resolve_slot_request(service_ids, ANY_DEVICE, gender_param=gender_param)
+    if slot_request is None: return None
+
+    today = timezone.now().date()
+    now = timezone.now()
+    start_date = max(start_date, today)
+    if end_date < start_date: return None
+
+    if slot_request.lane_device_id == ANY_DEVICE:
+        lanes = list(slot_request.service.group.available_devices.order_by('id').values_list('id', flat=True))
+    else:
+        lanes = [None]
+    if not lanes: return None
+    # نسخه کش خطوط قبل از خواندن داده‌ها ثبت می‌شود تا نتیجه هرگز زیر نسخه‌ای تازه‌تر از داده‌اش نوشته نشود
+    from .slot_cache import slots_scope
+    scopes = {lane: slots_scope([slot_request.service], lane) for lane in lanes}
+    lanes_bitmaps = get_lanes_day_bitmaps(lanes, start_date, end_date)
+    calendars = lanes_closures(slot_request.service.group_id, lanes, start_date, end_date)
+    held = lanes_hold_masks(lanes_holds(lanes), start_date, end_date)
+    resources = resource_masks(slot_request.service.group_id, start_date, end_date)
+
+    jobs = [
+        _slot_job(
+            slot_request,
+            _day_plans(slot_request.schedule, start_date, end_date, now, lanes_bitmaps[lane], calendars[lane],
+                       held[lane], resources),
+            lane_key(lane),
+        )
+        for lane in lanes
+    ]
+    return LanePrecompute(slot_request, lanes, jobs, scopes)
+
+def render_lane_results(prepared: LanePrecompute, results: List[FreeSlots]) -> Dict[Optional[int], Dict[str, List[Dict]]]:
+    """ساخت برچسب‌های خروجی کارهای prepare_lane_jobs: {شناسه دستگاه یا None: {تاریخ شمسی: [...]}}"""
+    rendered = {}
+    for lane, free in zip(prepared.lanes, results):
+        lane_map = {}
+        for day, slot_minutes in free:
+            labels = day_labels(day)
+            lane_map[labels.jalali_key] = _render_day_slots(
+                labels, day, slot_minutes, prepared.slot_request.total_duration
+            )
+        rendered[lane] = lane_map
+    return rendered
 
-    return all_available_slots_map
\ No newline at end of file
+def precompute_lane_slots(
+    service_ids: List[str],
+    start_date: date,
+    end_date: date,
+    gender_param: str = None,
+    max_workers: Optional[int] = None
+) -> Dict[Optional[int], Dict[str, List[Dict]]]:
+    """
+    پیش‌محاسبه اسلات‌های آزاد یک ترکیب خدمات روی تمام خطوط آن.
+    جاروب خطوط در ProcessPoolExecutor و ساخت برچسب‌ها در پروسه اصلی انجام می‌شود.
+    """
+    prepared = prepare_lane_jobs(service_ids, start_date, end_date, gender_param)
+    if prepared is None: return {}
+    return render_lane_results(prepared, run_slot_jobs(prepared.jobs, max_workers))
@@ -0,0 +1,108 @@
+# booking/closures.py
+"""
+تقویم تعطیلی‌ها و توقف دستگاه‌ها (مدل Closure).
+تعطیلی‌های یک پنجره زمانی با یک کوئری خوانده و برای هر خط به یک ClosureCalendar
+تبدیل می‌شوند: مجموعه روزهای کاملاً بسته (بررسی O(1) قبل از هر کار روی اسلات‌ها)
+و ماسک دقیقه‌ای روزهایی که فقط چند ساعت بسته‌اند (OR روی بیت‌مپ اشغال).
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Union
+
+from django.db.models import Q
+
+from clinic.models import Closure
+from .bitmaps import minute_mask
+from .occupancy import _bitmaps_from_intervals, appointment_days
+
+CLOSURE_FIELDS = ('service_group_id', 'device_id', 'start_date', 'end_date', 'start_time', 'end_time')
+
+
+class ClosureCalendar(NamedTuple):
+    closed_days: FrozenSet[date]
+    day_masks: Dict[date, int]
+
+    def is_closed(self, day: date) -> bool:
+        return day in self.closed_days
+
+    def apply(self, day: date, bitmap: int) -> int:
+        """بیت‌مپ اشغال روز به همراه ساعات بسته آن روز."""
+        return bitmap | self.day_masks.get(day, 0)
+
+
+NO_CLOSURES = ClosureCalendar(frozenset(), {})
+
+
+def _to_minutes(value) -> int:
+    return value.hour * 60 + value.minute
+
+
+def _closures_qs(start_date: date, end_date: date, group_ids: Iterable[Optional[int]],
+                 device_ids: Iterable[Optional[Union[int, str]]]):
+    """تعطیلی‌های بازه که روی گروه‌ها یا دستگاه‌های داده‌شده (یا کل کلینیک) اثر دارند."""
+    scope = Q(service_group__isnull=True, device__isnull=True)
+    group_ids = [gid for gid in group_ids if gid]
+    device_ids = [did for did in device_ids if did]
+    if group_ids:
+        scope |= Q(service_group_id__in=group_ids)
+    if device_ids:
+        scope |= Q(device_id__in=device_ids)
+    return Closure.objects.filter(scope, start_date__lte=end_date, end_date__gte=start_date).values_list(*CLOSURE_FIELDS)
+
+
+def closure_rows(start_date: date, end_date: date, group_ids: Iterable[Optional[int]] = (),
+                 device_ids: Iterable[Optional[Union[int, str]]] = ()) -> List[tuple]:
+    """یک کوئری برای تمام تعطیلی‌های بازه؛ ورودی lane_calendar برای هر خط."""
+    return list(_closures_qs(start_date, end_date, group_ids, device_ids))
+
+
+def lane_calendar(rows: List[tuple], group_id: Optional[int], device_id: Optional[Union[int, str]],
+                  start_date: date, end_date: date) -> ClosureCalendar:
+    """تقویم تعطیلی یک خط (کل کلینیک + گروه + دستگاه خط) در بازه، از ردیف‌های closure_rows."""
+    closed_days: Set[date] = set()
+    day_masks: Dict[date, int] = {}
+    for row_group_id, row_device_id, first, last, start_time, end_time in rows:
+        if row_group_id and row_group_id != group_id:
+            continue
+        if row_device_id and str(row_device_id) != str(device_id):
+            continue
+        day = max(first, start_date)
+        last = min(last, end_date)
+        if start_time is None or end_time is None:
+            while day <= last:
+                closed_days.add(day)
+                day += timedelta(days=1)
+            continue
+        mask = minute_mask(_to_minutes(start_time), _to_minutes(end_time))
+        while day <= last:
+            day_masks[day] = day_masks.get(day, 0) | mask
+            day += timedelta(days=1)
+    if not closed_days and not day_masks:
+        return NO_CLOSURES
+    return ClosureCalendar(frozenset(closed_days), day_masks)
+
+
+def lanes_closures(group_id: Optional[int], device_ids: List[Optional[Union[int, str]]],
+                   start_date: date, end_date: date) -> Dict[Optional[Union[int, str]], ClosureCalendar]:
+    """تقویم تعطیلی چند خط یک گروه با یک کوئری."""
+    rows = closure_rows(start_date, end_date, [group_id], device_ids)
+    return {device_id: lane_calendar(rows, group_id, device_id, start_date, end_date) for device_id in device_ids}
+
+
+async def alanes_closures(group_id: Optional[int], device_ids: List[Optional[Union[int, str]]],
+                          start_date: date, end_date: date) -> Dict[Optional[Union[int, str]], ClosureCalendar]:
+    """نسخه async از lanes_closures."""
+    rows = [row async for row in _closures_qs(start_date, end_date, [group_id], device_ids)]
+    return {device_id: lane_calendar(rows, group_id, device_id, start_date, end_date) for device_id in device_ids}
+
+
+def closed_lanes(group_id: Optional[int], device_ids: List[Optional[int]],
+                 start_time: datetime, end_time: datetime) -> Set[Optional[int]]:
+    """خطوطی (از device_ids) که بازه [start_time, end_time) روی آن‌ها با یک تعطیلی تداخل دارد."""
+    days = appointment_days(start_time, end_time)
+    requested = _bitmaps_from_intervals([(start_time, end_time)], days)
+    calendars = lanes_closures(group_id, device_ids, days[0], days[-1])
+    return {
+        device_id for device_id, calendar in calendars.items()
+        if any(calendar.is_closed(day) or calendar.apply(day, 0) & requested[day] for day in days)
+    }
@@ -0,0 +1,137 @@
+# booking/feed.py
+"""
+فید تغییرات دسترسی‌پذیری خطوط برای صفحه‌های باز رزرو.
+برای هر خط یک دنباله شماره‌دار از رویدادها در کش نگه داشته می‌شود: روزهایی که اسلات‌های آن‌ها
+عوض شده (ثبت، لغو یا جابه‌جایی نوبت، نگه‌داشت موقت) یا رویداد reset برای تغییرهای گسترده
+(ساعات کاری، تعطیلی‌ها، سیاست اسلات گروه). API فید (SSE) از روی مکان‌نمای هر خط فقط روزهای
+تغییرکرده را دوباره محاسبه و ارسال می‌کند.
+"""
+
+import time
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from django.core.cache import cache
+
+# تعداد رویدادهای نگه‌داشته‌شده هر خط و عمر کلیدهای فید (ثانیه)
+FEED_LENGTH = 200
+FEED_TIMEOUT = 60 * 60 * 24
+FEED_LOCK_TIMEOUT = 5
+# انتظار برای قفل حداقل به اندازه عمر آن است تا قفل رهاشده یک پروسه از کار افتاده حتماً منقضی شود
+FEED_LOCK_WAIT_SECONDS = FEED_LOCK_TIMEOUT + 1
+FEED_LOCK_POLL_SECONDS = 0.02
+
+
+class LaneChanges(NamedTuple):
+    cursor: Dict[str, int]
+    days: Set[date]
+    reset: bool
+
+
+def _events_key(lane: str) -> str:
+    return f"booking:feed:{lane}"
+
+
+def _publish(lane: str, days: Optional[Iterable[date]]) -> None:
+    """
+    افزودن رویداد به فید خط؛ days=None یعنی reset (کلاینت کل پنجره را دوباره بگیرد).
+    شماره رویداد زیر همان قفل نوشتن فید تعیین می‌شود تا خواننده هرگز شکاف موقت نبیند.
+    اولین شماره از زمان جاری ساخته می‌شود تا بعد از حذف فید از کش، مکان‌نماهای قدیمی reset بگیرند.
+    اگر قفل در FEED_LOCK_WAIT_SECONDS به دست نیاید، فید بدون خواندن با یک reset تازه جایگزین می‌شود
+    (خواندن و نوشتن بدون قفل ممکن بود رویداد نویسنده هم‌زمان را گم کند).
+    """
+    payload = None if days is None else tuple(sorted({day.isoformat() for day in days}))
+    lock_key = f"{_events_key(lane)}:lock"
+    deadline = time.monotonic() + FEED_LOCK_WAIT_SECONDS
+    while not cache.add(lock_key, 1, FEED_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            cache.set(_events_key(lane), [(int(time.time() * 1000), None)], FEED_TIMEOUT)
+            return
+        time.sleep(FEED_LOCK_POLL_SECONDS)
+    try:
+        events = cache.get(_events_key(lane)) or []
+        seq = events[-1][0] + 1 if events else int(time.time() * 1000)
+        events.append((seq, payload))
+        cache.set(_events_key(lane), events[-FEED_LENGTH:], FEED_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+
+
+def publish_lane_days(lane: str, days: Iterable[date]) -> None:
+    """اعلام تغییر اسلات‌های چند روز یک خط."""
+    days = list(days)
+    if days:
+        _publish(lane, days)
+
+
+def publish_lane_reset(lanes: Iterable[str]) -> None:
+    """اعلام تغییر گسترده روی خطوط (کلاینت‌ها پنجره فعلی را کامل دوباره دریافت می‌کنند)."""
+    for lane in set(lanes):
+        _publish(lane, None)
+
+
+def current_cursor(lanes: List[str]) -> Dict[str, int]:
+    """مکان‌نمای فعلی خطوط (آخرین شماره رویداد هر خط، یا ۰ برای خط بدون رویداد)."""
+    stored = cache.get_many([_events_key(lane) for lane in lanes])
+    return {lane: (stored.get(_events_key(lane)) or [(0, None)])[-1][0] for lane in lanes}
+
+
+async def acurrent_cursor(lanes: List[str]) -> Dict[str, int]:
+    """نسخه async از current_cursor."""
+    stored = await cache.aget_many([_events_key(lane) for lane in lanes])
+    return {lane: (stored.get(_events_key(lane)) or [(0, None)])[-1][0] for lane in lanes}
+
+
+def format_cursor(cursor: Dict[str, int]) -> str:
+    return ",".join(f"{lane}:{seq}" for lane, seq in sorted(cursor.items()))
+
+
+def parse_cursor(value: Optional[str], lanes: List[str]) -> Optional[Dict[str, int]]:
+    """مکان‌نمای متنی (Last-Event-ID) برای خطوط داده‌شده؛ نامعتبر یا ناقص یعنی None."""
+    if not value:
+        return None
+    cursor = {}
+    for part in value.split(','):
+        lane, _, seq = part.rpartition(':')
+        if not seq.isdigit():
+            return None
+        cursor[lane] = int(seq)
+    if set(cursor) != set(lanes):
+        return None
+    return cursor
+
+
+def lane_changes(cursor: Dict[str, int]) -> LaneChanges:
+    """
+    رویدادهای بعد از مکان‌نما: روزهای تغییرکرده و مکان‌نمای جدید.
+    اگر رویدادی reset باشد یا رویدادهای لازم از فید خارج شده باشند (یا فید از کش حذف شده باشد)، reset=True است.
+    """
+    return _changes_since(cursor, cache.get_many([_events_key(lane) for lane in cursor]))
+
+
+async def alane_changes(cursor: Dict[str, int]) -> LaneChanges:
+    """نسخه async از lane_changes (برای حلقه فید زیر ASGI)."""
+    return _changes_since(cursor, await cache.aget_many([_events_key(lane) for lane in cursor]))
+
+
+def _changes_since(cursor: Dict[str, int], stored: dict) -> LaneChanges:
+    lanes = list(cursor)
+    new_cursor, days, reset = {}, set(), False
+    for lane in lanes:
+        since = cursor[lane]
+        events = stored.get(_events_key(lane)) or []
+        latest = events[-1][0] if events else 0
+        new_cursor[lane] = latest
+        if latest == since:
+            continue
+        if latest < since or (since and events[0][0] > since + 1):
+            reset = True
+            continue
+        for seq, event_days in events:
+            if seq <= since:
+                continue
+            if event_days is None:
+                reset = True
+            else:
+                days.update(date.fromisoformat(day) for day in event_days)
+    return LaneChanges(new_cursor, days, reset)
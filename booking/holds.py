@@ -0,0 +1,272 @@
+# booking/holds.py
+"""
+نگه‌داشت موقت اسلات‌ها (slot hold).
+وقتی بیمار روی یک اسلات کلیک می‌کند، آن بازه برای چند دقیقه روی خط (دستگاه یا خط بدون دستگاه)
+در کش رزرو موقت می‌شود. موتور اسلات‌ها بازه‌های نگه‌داشته‌شده را مثل نوبت اشغال در نظر می‌گیرد
+و ویو ثبت نوبت، بازه‌ای را که کاربر دیگری نگه داشته رد می‌کند؛ بنابراین بیشتر تداخل‌ها قبل از
+رسیدن به تراکنش select_for_update حل می‌شوند.
+
+خطوطی که ظرفیت موازی دارند (Device.capacity یا BOOKING_NO_DEVICE_CAPACITY) با نگه‌داشت پر نمی‌شوند
+مگر نگه‌داشت‌ها همراه نوبت‌های ثبت‌شده به ظرفیت خط برسند (همان sweep line بیت‌مپ اشغال).
+
+ساختار کش: برای هر خط یک دیکشنری {توکن: (شروع، پایان، زمان انقضا)} و برای هر توکن، خط آن.
+"""
+
+import hashlib
+import secrets
+import time
+from datetime import date, datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from django.core.cache import cache
+
+from .closures import closed_lanes
+from .feed import publish_lane_days
+from .lanes import lane_key
+from .intervals import saturated_intervals
+from .occupancy import (
+    _bitmaps_from_intervals, _lane_intervals_qs, appointment_days, get_lanes_day_bitmaps, lane_capacities
+)
+
+# عمر هر نگه‌داشت (ثانیه)
+HOLD_SECONDS = 60 * 5
+HOLD_LOCK_TIMEOUT = 5
+HOLD_LOCK_WAIT_SECONDS = 1.0
+HOLD_LOCK_POLL_SECONDS = 0.02
+
+Hold = Tuple[datetime, datetime, float]
+Interval = Tuple[datetime, datetime]
+
+
+class SlotHold(NamedTuple):
+    token: str
+    device_id: Optional[int]
+    start_time: datetime
+    end_time: datetime
+    expires_at: float
+
+
+def _holds_key(lane: str) -> str:
+    return f"booking:holds:{lane}"
+
+
+def _token_key(token: str) -> str:
+    return f"booking:hold-token:{token}"
+
+
+def _active(holds: Optional[Dict[str, Hold]], now: float) -> Dict[str, Hold]:
+    return {token: hold for token, hold in (holds or {}).items() if hold[2] > now}
+
+
+def lanes_holds(device_ids: Iterable[Optional[Union[int, str]]]) -> Dict[Optional[Union[int, str]], Dict[str, Hold]]:
+    """نگه‌داشت‌های فعال چند خط با یک get_many."""
+    device_ids = list(device_ids)
+    keys = {_holds_key(lane_key(device_id)): device_id for device_id in device_ids}
+    cached = cache.get_many(list(keys))
+    now = time.time()
+    return {device_id: _active(cached.get(key), now) for key, device_id in keys.items()}
+
+
+async def alanes_holds(device_ids: Iterable[Optional[Union[int, str]]]) -> Dict[Optional[Union[int, str]], Dict[str, Hold]]:
+    """نسخه async از lanes_holds."""
+    device_ids = list(device_ids)
+    keys = {_holds_key(lane_key(device_id)): device_id for device_id in device_ids}
+    cached = await cache.aget_many(list(keys))
+    now = time.time()
+    return {device_id: _active(cached.get(key), now) for key, device_id in keys.items()}
+
+
+def holds_version(holds: Dict[str, Hold]) -> str:
+    """
+    اثر انگشت نگه‌داشت‌های فعال یک خط برای کلید کش و ETag اسلات‌ها.
+    با ثبت، جابه‌جایی (همان توکن روی بازه دیگر)، آزادسازی یا انقضای هر نگه‌داشت عوض می‌شود،
+    پس نقشه‌های کش‌شده بدون حذف صریح کهنه نمی‌مانند.
+    """
+    if not holds:
+        return '0'
+    parts = sorted(
+        f"{token}:{start.isoformat()}:{end.isoformat()}" for token, (start, end, _) in holds.items()
+    )
+    return hashlib.md5(",".join(parts).encode()).hexdigest()[:8]
+
+
+def lanes_holds_versions(lanes: List[str]) -> Dict[str, str]:
+    """اثر انگشت نگه‌داشت‌های چند خط (بر اساس کلید خط) با یک get_many."""
+    keys = {_holds_key(lane): lane for lane in lanes}
+    cached = cache.get_many(list(keys))
+    now = time.time()
+    return {lane: holds_version(_active(cached.get(key), now)) for key, lane in keys.items()}
+
+
+def hold_masks(holds: Dict[str, Hold], start_date: date, end_date: date,
+               device_id: Optional[Union[int, str]] = None, capacity: int = 1) -> Dict[date, int]:
+    """
+    ماسک دقیقه‌ای نگه‌داشت‌ها در روزهای بازه (برای OR روی بیت‌مپ اشغال).
+    با capacity بیشتر از یک، نوبت‌های خط device_id در همان روزها هم شمرده می‌شوند و فقط
+    دقایقی که نوبت‌ها و نگه‌داشت‌ها با هم به ظرفیت رسیده‌اند بسته می‌شوند.
+    """
+    days = sorted({
+        day for start, end, _ in holds.values() for day in appointment_days(start, end)
+        if start_date <= day <= end_date
+    })
+    if not days:
+        return {}
+    intervals = [(start, end) for start, end, _ in holds.values()]
+    if capacity > 1:
+        intervals.extend(_lane_intervals_qs(device_id, days))
+    return _bitmaps_from_intervals(intervals, days, capacity)
+
+
+def lanes_hold_masks(holds: Dict[Optional[Union[int, str]], Dict[str, Hold]], start_date: date,
+                     end_date: date) -> Dict[Optional[Union[int, str]], Dict[date, int]]:
+    """ماسک نگه‌داشت‌های چند خط؛ ظرفیت فقط برای خطوط دارای نگه‌داشت (از کش) خوانده می‌شود."""
+    capacities = lane_capacities([device_id for device_id, lane_holds in holds.items() if lane_holds])
+    return {
+        device_id: hold_masks(lane_holds, start_date, end_date, device_id, capacities[device_id]) if lane_holds else {}
+        for device_id, lane_holds in holds.items()
+    }
+
+
+def held_days(device_id: Optional[Union[int, str]]) -> List[date]:
+    """روزهایی که روی یک خط نگه‌داشت فعال دارند."""
+    holds = lanes_holds([device_id])[device_id]
+    return sorted({day for start, end, _ in holds.values() for day in appointment_days(start, end)})
+
+
+def _others(holds: Dict[str, Hold], start_time: datetime, end_time: datetime,
+            token: Optional[str]) -> List[Interval]:
+    """بازه‌های هم‌پوشان نگه‌داشت‌های توکن‌های دیگر."""
+    return [
+        (start, end) for other, (start, end, _) in holds.items()
+        if other != token and start < end_time and end > start_time
+    ]
+
+
+def _seat_taken(intervals: List[Interval], start_time: datetime, end_time: datetime, capacity: int) -> bool:
+    """آیا نوبت‌ها و نگه‌داشت‌ها جایی در [start_time, end_time) به ظرفیت هم‌زمان خط می‌رسند."""
+    overlapping = [(start, end) for start, end in intervals if start < end_time and end > start_time]
+    if len(overlapping) < capacity:
+        return False
+    return any(start < end_time and end > start_time for start, end in saturated_intervals(overlapping, capacity))
+
+
+def _lane_booked(device_id: Optional[int], start_time: datetime, end_time: datetime) -> List[Interval]:
+    """بازه نوبت‌های فعال خط در روزهای بازه (فقط برای خطوط با ظرفیت بیشتر از یک لازم است)."""
+    return list(_lane_intervals_qs(device_id, appointment_days(start_time, end_time)))
+
+
+def held_by_others(device_ids: List[Optional[int]], start_time: datetime, end_time: datetime,
+                   token: Optional[str] = None,
+                   booked: Optional[Dict[Optional[int], List[Interval]]] = None) -> set:
+    """
+    خطوطی (از device_ids) که نگه‌داشت توکن‌های دیگر همراه نوبت‌های ثبت‌شده، ظرفیت آن‌ها را
+    در بازه پر کرده است. booked بازه نوبت‌های هر خط است اگر فراخوان آن‌ها را دارد؛ وگرنه فقط برای
+    خطوطی که نگه‌داشت هم‌پوشان و ظرفیت بیشتر از یک دارند خوانده می‌شود.
+    """
+    held = {
+        device_id: intervals for device_id, holds in lanes_holds(device_ids).items()
+        if (intervals := _others(holds, start_time, end_time, token))
+    }
+    if not held:
+        return set()
+    capacities = lane_capacities(held)
+    taken = set()
+    for device_id, intervals in held.items():
+        capacity = capacities[device_id]
+        if capacity > 1:
+            lane_booked = booked.get(device_id, []) if booked is not None else _lane_booked(
+                device_id, start_time, end_time
+            )
+            intervals = intervals + list(lane_booked)
+        if _seat_taken(intervals, start_time, end_time, capacity):
+            taken.add(device_id)
+    return taken
+
+
+def _with_lane_lock(lane: str, update) -> bool:
+    """اجرای update روی دیکشنری نگه‌داشت‌های خط زیر یک قفل کوتاه کش (cache.add)."""
+    lock_key = f"{_holds_key(lane)}:lock"
+    deadline = time.monotonic() + HOLD_LOCK_WAIT_SECONDS
+    while not cache.add(lock_key, 1, HOLD_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(HOLD_LOCK_POLL_SECONDS)
+    try:
+        now = time.time()
+        holds = _active(cache.get(_holds_key(lane)), now)
+        if update(holds) is False:
+            return False
+        if holds:
+            timeout = max(expires_at for _, _, expires_at in holds.values()) - now
+            cache.set(_holds_key(lane), holds, int(timeout) + 1)
+        else:
+            cache.delete(_holds_key(lane))
+        return True
+    finally:
+        cache.delete(lock_key)
+
+
+def release_hold(token: Optional[str]) -> None:
+    """آزادسازی نگه‌داشت یک توکن (مثلاً بعد از ثبت نوبت یا انتخاب اسلات دیگر)."""
+    if not token:
+        return
+    lane = cache.get(_token_key(token))
+    if lane is None:
+        return
+    released = []
+    _with_lane_lock(lane, lambda holds: released.append(holds.pop(token, None)))
+    cache.delete(_token_key(token))
+    if released and released[0] is not None:
+        start_time, end_time, _ = released[0]
+        publish_lane_days(lane, appointment_days(start_time, end_time))
+
+
+def place_hold(device_id: Optional[int], start_time: datetime, end_time: datetime,
+               token: Optional[str] = None) -> Optional[SlotHold]:
+    """
+    نگه‌داشت بازه روی یک خط به مدت HOLD_SECONDS.
+    اگر همان توکن قبلاً اسلات دیگری را نگه داشته باشد، آن نگه‌داشت آزاد می‌شود.
+    اگر نگه‌داشت توکن‌های دیگر (همراه نوبت‌های ثبت‌شده روی خطوط با ظرفیت بیشتر از یک) ظرفیت خط را
+    در بازه پر کرده باشند (یا قفل خط در دسترس نباشد) None برمی‌گرداند.
+    بررسی پر بودن خط فقط با نوبت‌ها و تعطیلی‌ها بر عهده فراخوان است.
+    """
+    token = token or secrets.token_urlsafe(16)
+    lane = lane_key(device_id)
+    previous_lane = cache.get(_token_key(token))
+    if previous_lane is not None and previous_lane != lane:
+        release_hold(token)
+
+    expires_at = time.time() + HOLD_SECONDS
+    capacity = lane_capacities([device_id])[device_id]
+    booked = _lane_booked(device_id, start_time, end_time) if capacity > 1 else []
+
+    def update(holds):
+        if _seat_taken(_others(holds, start_time, end_time, token) + booked, start_time, end_time, capacity):
+            return False
+        holds[token] = (start_time, end_time, expires_at)
+
+    if not _with_lane_lock(lane, update):
+        return None
+    cache.set(_token_key(token), lane, HOLD_SECONDS)
+    publish_lane_days(lane, appointment_days(start_time, end_time))
+    return SlotHold(token, device_id, start_time, end_time, expires_at)
+
+
+def hold_first_free_lane(group_id: Optional[int], device_ids: List[Optional[int]], start_time: datetime,
+                         end_time: datetime, token: Optional[str] = None) -> Optional[SlotHold]:
+    """
+    نگه‌داشت بازه روی اولین خط آزاد از device_ids (به ترتیب).
+    اشغال از بیت‌مپ‌های کش‌شده و تعطیلی‌ها با یک کوئری بررسی می‌شود؛ بنابراین کلیک روی اسلاتی
+    که در این فاصله رزرو شده، همین‌جا و بدون تراکنش رد می‌شود.
+    """
+    days = appointment_days(start_time, end_time)
+    requested = _bitmaps_from_intervals([(start_time, end_time)], days)
+    lanes_bitmaps = get_lanes_day_bitmaps(device_ids, days[0], days[-1])
+    closed = closed_lanes(group_id, device_ids, start_time, end_time)
+    for device_id in device_ids:
+        if device_id in closed or any(lanes_bitmaps[device_id].get(day, 0) & requested[day] for day in days):
+            continue
+        hold = place_hold(device_id, start_time, end_time, token)
+        if hold is not None:
+            return hold
+    return None
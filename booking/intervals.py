@@ -0,0 +1,94 @@
+# booking/intervals.py
+"""
+ساختارهای کمکی برای کار با بازه‌های زمانی مرتب.
+بازه‌ها یک بار ادغام و مرتب می‌شوند و اشتراک، تفاضل و اشباع ظرفیت
+با پیمایش خطی یا sweep line روی همین لیست‌های مرتب محاسبه می‌شود.
+"""
+
+from typing import Any, Iterable, List, Tuple
+
+Interval = Tuple[Any, Any]
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """
+    ادغام بازه‌های هم‌پوشان یا چسبیده به هم.
+    خروجی لیستی مرتب از بازه‌های مجزا است. مقادیر می‌توانند datetime یا عدد (دقیقه) باشند.
+    """
+    merged: List[list] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def intersect_intervals(first: List[Interval], second: List[Interval]) -> List[Interval]:
+    """
+    اشتراک دو لیست مرتب از بازه‌های مجزا با ادغام خطی (دو اشاره‌گر) در O(n + m).
+    """
+    result: List[Interval] = []
+    i = j = 0
+    while i < len(first) and j < len(second):
+        start = max(first[i][0], second[j][0])
+        end = min(first[i][1], second[j][1])
+        if start < end:
+            result.append((start, end))
+        if first[i][1] < second[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def subtract_intervals(intervals: List[Interval], removed: List[Interval]) -> List[Interval]:
+    """
+    حذف بازه‌های removed از intervals (هر دو مرتب و مجزا) با یک پیمایش خطی.
+    """
+    result: List[Interval] = []
+    j = 0
+    for start, end in intervals:
+        while j < len(removed) and removed[j][1] <= start:
+            j += 1
+        k = j
+        while k < len(removed) and removed[k][0] < end:
+            if removed[k][0] > start:
+                result.append((start, removed[k][0]))
+            start = max(start, removed[k][1])
+            k += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def saturated_intervals(intervals: Iterable[Interval], capacity: int = 1) -> List[Interval]:
+    """
+    بازه‌هایی که در آن‌ها حداقل capacity بازه هم‌زمان باز است (خط با ظرفیت موازی پر است).
+    با sweep line روی رویدادهای مرتب شروع/پایان در O(n log n)؛ در هر لحظه پایان‌ها قبل از
+    شروع‌ها شمرده می‌شوند تا بازه‌های نیم‌باز چسبیده هم‌پوشان حساب نشوند.
+    برای capacity=1 همان merge_intervals است.
+    """
+    if capacity <= 1:
+        return merge_intervals(intervals)
+    events = []
+    for start, end in intervals:
+        if end > start:
+            events.append((start, 1))
+            events.append((end, -1))
+    events.sort()
+
+    saturated: List[Interval] = []
+    active = 0
+    opened = None
+    for moment, delta in events:
+        active += delta
+        if delta > 0 and active == capacity:
+            opened = moment
+        elif delta < 0 and active == capacity - 1:
+            if moment > opened:
+                saturated.append((opened, moment))
+            opened = None
+    return merge_intervals(saturated)
+
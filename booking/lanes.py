@@ -0,0 +1,25 @@
+# booking/lanes.py
+"""
+مفهوم «خط نوبت‌دهی» (Lane).
+هر دستگاه یک خط مستقل دارد و تمام خدمات بدون دستگاه یک خط مشترک دارند؛
+دو نوبت فقط وقتی با هم تداخل دارند که روی یک خط باشند.
+"""
+
+from typing import Optional, Union
+
+NO_DEVICE_LANE = 'none'
+
+# مقدار device_id برای حالت «هر دستگاهی» در گروه‌های دارای دستگاه
+ANY_DEVICE = 'any'
+
+
+def lane_key(device_id: Optional[Union[int, str]]) -> str:
+    """کلید متنی خط برای استفاده در کش و ایندکس‌ها."""
+    return f"device-{device_id}" if device_id else NO_DEVICE_LANE
+
+
+def filter_lane(queryset, device_id: Optional[Union[int, str]]):
+    """محدود کردن کوئری نوبت‌ها به یک خط."""
+    if device_id:
+        return queryset.filter(selected_device_id=device_id)
+    return queryset.filter(selected_device__isnull=True)
@@ -0,0 +1,203 @@
+# booking/management/commands/benchmark_slots.py
+"""
+بنچمارک تکرارپذیر generate_available_slots_for_range روی داده‌های مصنوعی.
+برای هر تعداد دستگاه یک کلینیک مصنوعی ساخته می‌شود (۳ شیفت در روز، ۰ تا N نوبت تصادفی
+برای هر دستگاه در هر روز با seed ثابت) و API برای افق‌های مختلف، یک بار روی یک دستگاه
+و یک بار در حالت «هر دستگاهی» اجرا می‌شود. زمان اجرا، تعداد کوئری‌ها و اوج حافظه
+(tracemalloc) گزارش و با baseline ذخیره‌شده مقایسه می‌شود.
+
+تمام داده‌ها داخل یک تراکنش ساخته و در پایان rollback می‌شوند و کش‌ها در یک LocMemCache
+جداگانه نگه داشته می‌شوند، پس اجرای آن روی دیتابیس توسعه بی‌خطر است:
+
+    python manage.py benchmark_slots --save-baseline
+    python manage.py benchmark_slots --check
+"""
+
+import json
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from datetime import time as dt_time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from booking.calendar_logic import generate_available_slots_for_range, slot_engine_name
+from booking.lanes import ANY_DEVICE
+from booking.models import Appointment
+from clinic.models import Device, Service, ServiceGroup, WorkHours
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'slots_baseline.json'
+SHIFTS = ((8, 12), (13, 17), (18, 22))
+APPOINTMENT_MINUTES = (5, 10, 15, 30, 45, 60)
+SERVICE_DURATION = 30
+BULK_BATCH_SIZE = 2000
+
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'booking-benchmark',
+    }
+}
+
+
+class _Rollback(Exception):
+    """برای برگرداندن تراکنش داده‌های مصنوعی در پایان بنچمارک."""
+
+
+class Command(BaseCommand):
+    help = "بنچمارک موتور اسلات روی داده‌های مصنوعی و مقایسه با baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, nargs='+', default=[1, 5, 20],
+                            help="تعداد دستگاه‌های کلینیک مصنوعی (۱ تا ۲۰)")
+        parser.add_argument('--horizons', type=int, nargs='+', default=[7, 30, 90, 365],
+                            help="افق‌های زمانی (روز)")
+        parser.add_argument('--max-appointments', type=int, default=100,
+                            help="حداکثر تعداد نوبت هر دستگاه در هر روز")
+        parser.add_argument('--repeat', type=int, default=3, help="تعداد تکرار هر سناریو (بهترین زمان گزارش می‌شود)")
+        parser.add_argument('--seed', type=int, default=1404)
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help="مسیر فایل baseline")
+        parser.add_argument('--save-baseline', action='store_true', help="ذخیره نتایج این اجرا به عنوان baseline")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="حداکثر کندی مجاز نسبت به baseline (۰٫۲ یعنی ۲۰٪)")
+        parser.add_argument('--check', action='store_true', help="در صورت پسرفت نسبت به baseline خطا بده")
+
+    def _build_clinic(self, devices_count, days, max_appointments, rng):
+        """ساخت گروه، خدمت، شیفت‌ها و نوبت‌های مصنوعی؛ خروجی (شناسه خدمت، شناسه دستگاه اول)."""
+        group = ServiceGroup.objects.create(name=f'Benchmark {devices_count}', has_devices=True)
+        devices = Device.objects.bulk_create([Device(name=f'Benchmark device {i + 1}') for i in range(devices_count)])
+        group.available_devices.add(*devices)
+        service = Service.objects.create(
+            group=group, name='Benchmark service', description='', duration=SERVICE_DURATION, price=0
+        )
+        WorkHours.objects.bulk_create([
+            WorkHours(service_group=group, day_of_week=day_of_week,
+                      start_time=dt_time(start), end_time=dt_time(end))
+            for day_of_week in range(7) for start, end in SHIFTS
+        ])
+
+        today = timezone.localdate()
+        appointments = []
+        for device in devices:
+            for offset in range(days):
+                day = today + timedelta(days=offset)
+                for _ in range(rng.randint(0, max_appointments)):
+                    shift_start, shift_end = rng.choice(SHIFTS)
+                    minutes = rng.choice(APPOINTMENT_MINUTES)
+                    start_minute = rng.randrange(shift_start * 60, shift_end * 60 - minutes + 1, 5)
+                    start = timezone.make_aware(datetime.combine(day, dt_time.min)) + timedelta(minutes=start_minute)
+                    appointments.append(Appointment(
+                        # کد رهگیری قطعی تا در حجم بالا تصادم تصادفی رخ ندهد
+                        tracking_code=f'BM{len(appointments):08d}',
+                        start_time=start, end_time=start + timedelta(minutes=minutes),
+                        status='CONFIRMED', selected_device=device,
+                    ))
+        Appointment.objects.bulk_create(appointments, batch_size=BULK_BATCH_SIZE)
+        return service.id, devices[0].id, len(appointments)
+
+    def _measure(self, start_date, end_date, service_id, device_id, repeat):
+        """بهترین زمان دیوار (کش سرد)، تعداد کوئری و اوج حافظه یک سناریو."""
+        args = (start_date, end_date, [str(service_id)], device_id)
+        best = None
+        for _ in range(max(repeat, 1)):
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                slots_map = generate_available_slots_for_range(*args, gender_param='FEMALE')
+                elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        # اوج حافظه در یک اجرای جداگانه، چون tracemalloc خودش زمان را بالا می‌برد
+        cache.clear()
+        tracemalloc.start()
+        try:
+            generate_available_slots_for_range(*args, gender_param='FEMALE')
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'wall_ms': round(best * 1000, 2),
+            'queries': len(queries),
+            'peak_kib': round(peak / 1024, 1),
+            'slots': sum(len(slots) for slots in slots_map.values()),
+        }
+
+    def _run_scenarios(self, options):
+        rng = random.Random(options['seed'])
+        horizons = sorted(set(max(h, 1) for h in options['horizons']))
+        today = timezone.localdate()
+        results = {}
+        for devices_count in sorted(set(min(max(d, 1), 20) for d in options['devices'])):
+            built = time.perf_counter()
+            service_id, device_id, appointments = self._build_clinic(
+                devices_count, horizons[-1], max(options['max_appointments'], 0), rng
+            )
+            self.stdout.write(
+                f"{devices_count} دستگاه: {appointments} نوبت مصنوعی در {time.perf_counter() - built:.2f} ثانیه ساخته شد"
+            )
+            for horizon in horizons:
+                end_date = today + timedelta(days=horizon - 1)
+                for mode, lane in (('device', device_id), ('any', ANY_DEVICE)):
+                    name = f"devices={devices_count} horizon={horizon} mode={mode}"
+                    results[name] = self._measure(today, end_date, service_id, lane, options['repeat'])
+        return results
+
+    def _report(self, results, baseline, tolerance):
+        """چاپ نتایج و مقایسه با baseline؛ خروجی فهرست سناریوهای دچار پسرفت."""
+        regressions = []
+        for name, result in results.items():
+            line = (f"{name:<40} {result['wall_ms']:>10.2f} ms {result['queries']:>5} queries "
+                    f"{result['peak_kib']:>10.1f} KiB {result['slots']:>7} slots")
+            previous = baseline.get(name)
+            if previous:
+                change = (result['wall_ms'] - previous['wall_ms']) / previous['wall_ms'] if previous['wall_ms'] else 0
+                line += (f"  | زمان {change:+.0%}، کوئری {result['queries'] - previous['queries']:+d}، "
+                         f"حافظه {result['peak_kib'] - previous['peak_kib']:+.1f} KiB")
+                if change > tolerance or result['queries'] > previous['queries']:
+                    regressions.append(name)
+                    self.stdout.write(self.style.ERROR(line))
+                    continue
+            self.stdout.write(line)
+        return regressions
+
+    def handle(self, *args, **options):
+        baseline_path = Path(options['baseline'])
+        baseline = {}
+        if baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text(encoding='utf-8')).get('results', {})
+        elif options['check']:
+            raise CommandError(f"فایل baseline پیدا نشد: {baseline_path}")
+
+        engine = slot_engine_name()
+        self.stdout.write(f"موتور اسلات: {engine}")
+        results = {}
+        with override_settings(CACHES=BENCHMARK_CACHES):
+            try:
+                with transaction.atomic():
+                    results = self._run_scenarios(options)
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+        regressions = self._report(results, baseline, options['tolerance'])
+
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(
+                {'engine': engine, 'seed': options['seed'], 'results': results}, indent=2, ensure_ascii=False
+            ), encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f"baseline در {baseline_path} ذخیره شد."))
+
+        if regressions:
+            message = f"{len(regressions)} سناریو نسبت به baseline کندتر شده یا کوئری بیشتری دارد."
+            if options['check']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
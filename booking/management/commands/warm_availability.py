@@ -0,0 +1,92 @@
+# booking/management/commands/warm_availability.py
+"""
+گرم کردن کش اسلات‌ها برای N روز آینده.
+برای هر خدمت (و ترکیب‌های پرتکرار چندخدمتی)، هر جنسیت و هر خط (دستگاه یا خط بدون دستگاه)
+اسلات‌های آزاد یکجا و به صورت موازی در ProcessPoolExecutor محاسبه می‌شوند و برای پنجره‌های
+ماهانه‌ای که تقویم رزرو درخواست می‌کند در کش نوشته می‌شوند.
+مناسب اجرا بعد از هر deploy و به صورت دوره‌ای با cron:
+
+    python manage.py warm_availability --days 62 --workers 4
+"""
+
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from booking.api_views import BOOKING_HORIZON_DAYS, month_windows
+from booking.availability import jalali_key
+from booking.calendar_logic import prepare_lane_jobs, render_lane_results
+from booking.models import Appointment
+from booking.slot_cache import set_cached_slots
+from booking.slot_engines import run_slot_jobs
+from clinic.models import Service
+
+GENDERS = ('FEMALE', 'MALE')
+
+
+class Command(BaseCommand):
+    help = "محاسبه موازی اسلات‌های آزاد روزهای آینده و پر کردن کش اسلات‌ها"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=62, help="تعداد روزهای آینده (حداکثر افق نوبت‌دهی)")
+        parser.add_argument('--workers', type=int, default=None, help="تعداد پروسه‌ها (پیش‌فرض: تعداد هسته‌ها)")
+        parser.add_argument('--combos', type=int, default=20,
+                            help="تعداد ترکیب‌های چندخدمتی پرتکرار ۹۰ روز اخیر که گرم می‌شوند")
+
+    def _service_combos(self, limit):
+        """هر خدمت به تنهایی به همراه پرتکرارترین ترکیب‌های چندخدمتی نوبت‌های اخیر."""
+        combos = [(service.id,) for service in Service.objects.order_by('id')]
+        if limit <= 0:
+            return combos
+
+        appointment_services = {}
+        recent = Appointment.services.through.objects.filter(
+            appointment__start_time__gte=timezone.now() - timedelta(days=90)
+        ).values_list('appointment_id', 'service_id')
+        for appointment_id, service_id in recent:
+            appointment_services.setdefault(appointment_id, set()).add(service_id)
+        counts = Counter(tuple(sorted(ids)) for ids in appointment_services.values() if len(ids) > 1)
+        return combos + [combo for combo, _ in counts.most_common(limit)]
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        today = timezone.localdate()
+        end_date = today + timedelta(days=min(max(options['days'], 1), BOOKING_HORIZON_DAYS) - 1)
+        windows = month_windows(today, end_date)
+
+        prepared_list = []
+        for combo in self._service_combos(options['combos']):
+            for gender in GENDERS:
+                prepared = prepare_lane_jobs([str(sid) for sid in combo], today, end_date, gender)
+                if prepared is not None:
+                    prepared_list.append((combo, gender, prepared))
+        loaded = time.perf_counter()
+
+        # تمام خطوط تمام ترکیب‌ها در یک ProcessPoolExecutor جاروب می‌شوند
+        all_jobs = [job for _, _, prepared in prepared_list for job in prepared.jobs]
+        results = iter(run_slot_jobs(all_jobs, options['workers']))
+        swept = time.perf_counter()
+
+        services_by_id = Service.objects.select_related('group').in_bulk()
+        entries = 0
+        for combo, gender, prepared in prepared_list:
+            lane_results = render_lane_results(prepared, [next(results) for _ in prepared.jobs])
+            services = [services_by_id[sid] for sid in combo]
+            for device_id, slots_map in lane_results.items():
+                for window_start, window_end in windows:
+                    first_key, last_key = jalali_key(window_start), jalali_key(window_end)
+                    window_map = {key: slots for key, slots in slots_map.items() if first_key <= key <= last_key}
+                    set_cached_slots(services, device_id, gender, window_start, window_end, window_map,
+                                     scope=prepared.scopes[device_id])
+                    entries += 1
+
+        finished = time.perf_counter()
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(prepared_list)} ترکیب خدمت/جنسیت، {len(all_jobs)} خط و {entries} کلید کش برای "
+            f"{(end_date - today).days + 1} روز در {finished - started:.2f} ثانیه گرم شد "
+            f"(خواندن داده‌ها {loaded - started:.2f}، جاروب {swept - loaded:.2f}، "
+            f"برچسب‌ها و کش {finished - swept:.2f})."
+        ))
@@ -5,7 +5,7 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from clinic.models import DiscountCode, Device
+from clinic.models import DiscountCode, Device, Resource
 
 def generate_tracking_code():
     """تولید یک کد رهگیری ۸ رقمی شامل حروف و اعداد"""
@@ -58,6 +58,13 @@ class Appointment(models.Model):
         blank=True,
         verbose_name=_("دستگاه انتخابی")
     )
+    resources = models.ManyToManyField(
+        Resource,
+        blank=True,
+        related_name='appointments',
+        verbose_name=_("منابع رزروشده"),
+        help_text=_("پزشک، اپراتور یا اتاق‌هایی که این نوبت اشغال می‌کند.")
+    )
 
     start_time = models.DateTimeField(verbose_name=_("زمان شروع"), db_index=True)
     end_time = models.DateTimeField(verbose_name=_("زمان پایان"), db_index=True)
@@ -127,4 +134,62 @@ class Appointment(models.Model):
 
     def get_services_display(self):
         return ", ".join([s.name for s in self.services.all()])
-    get_services_display.short_description = _("خدمات")
\ No newline at end of file
+    get_services_display.short_description = _("خدمات")
+
+class AvailabilityDay(models.Model):
+    """
+    جدول مادی‌شده (Materialized) اسلات‌های آزاد.
+    هر ردیف اسلات‌های آزاد یک روز را برای یک ترکیب (خدمات انتخابی، دستگاه، جنسیت) نگه می‌دارد.
+    با تغییر نوبت‌ها یا ساعات کاری فقط ردیف‌های روزهای درگیر اصلاح می‌شوند
+    (booking/availability.py و booking/signals.py).
+    """
+    service = models.ForeignKey(
+        'clinic.Service',
+        on_delete=models.CASCADE,
+        related_name='availability_days',
+        verbose_name=_("خدمت مرجع"),
+        help_text=_("اولین خدمت ترکیب که ساعات کاری از آن خوانده می‌شود.")
+    )
+    service_ids = models.CharField(max_length=255, verbose_name=_("شناسه خدمات ترکیب"))
+    service_group = models.ForeignKey(
+        'clinic.ServiceGroup',
+        on_delete=models.CASCADE,
+        related_name='availability_days',
+        verbose_name=_("گروه خدمت")
+    )
+    device = models.ForeignKey(
+        Device,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name=_("دستگاه")
+    )
+    gender = models.CharField(max_length=10, verbose_name=_("جنسیت"))
+    duration = models.PositiveIntegerField(verbose_name=_("مدت کل (دقیقه)"))
+    date = models.DateField(verbose_name=_("تاریخ"))
+    jalali_date = models.CharField(max_length=10, verbose_name=_("تاریخ شمسی"))
+    slots = models.JSONField(default=list, verbose_name=_("اسلات‌های آزاد"))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("آخرین محاسبه"))
+
+    class Meta:
+        verbose_name = _("ظرفیت روزانه")
+        verbose_name_plural = _("ظرفیت‌های روزانه")
+        constraints = [
+            models.UniqueConstraint(
+                fields=['service_ids', 'device', 'gender', 'date'],
+                name='unique_availability_day'
+            ),
+            # NULL ها در قید بالا متمایز شمرده می‌شوند؛ خط بدون دستگاه قید جزئی جداگانه دارد
+            # تا درج‌های هم‌زمان (bulk_create با ignore_conflicts) ردیف تکراری نسازند
+            models.UniqueConstraint(
+                fields=['service_ids', 'gender', 'date'],
+                condition=models.Q(device__isnull=True),
+                name='unique_availability_day_no_device'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['device', 'date'], name='availability_lane_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.service_ids}/{self.device_id or '-'}/{self.gender} @ {self.date}"
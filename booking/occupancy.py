@@ -0,0 +1,261 @@
+# booking/occupancy.py
+"""
+ذخیره‌ساز اشغال روزانه خطوط نوبت‌دهی به صورت بیت‌مپ.
+برای هر (خط، روز) یک عدد صحیح نگه داشته می‌شود که بیت i آن یعنی دقیقه i ام روز
+(به وقت محلی) رزرو شده است. بیت‌مپ‌ها در کش نگهداری می‌شوند و با تغییر نوبت‌ها
+(سیگنال‌های booking/signals.py) به‌روز می‌شوند، بنابراین API اسلات‌ها دیگر
+برای هر درخواست جدول نوبت‌ها را اسکن نمی‌کند.
+
+خطوطی که ظرفیت موازی دارند (Device.capacity یا BOOKING_NO_DEVICE_CAPACITY) فقط دقایقی را
+اشغال علامت می‌زنند که تعداد نوبت‌های هم‌زمان به ظرفیت رسیده باشد؛ بنابراین موتور اسلات‌ها
+بدون تغییر همان بیت‌مپ را مصرف می‌کند.
+"""
+
+import math
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from clinic.models import Device
+from .bitmaps import MINUTES_PER_DAY, minute_mask
+from .intervals import saturated_intervals
+from .lanes import filter_lane, lane_key
+from .models import Appointment
+
+ACTIVE_STATUSES = ('PENDING', 'CONFIRMED')
+CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# تعداد روزهای آینده‌ای که با تغییر ظرفیت یک خط از کش حذف می‌شوند (بیشتر از افق نوبت‌دهی)
+INVALIDATION_HORIZON_DAYS = 400
+
+
+def _cache_key(lane: str, day: date) -> str:
+    return f"booking:occupancy:{lane}:{day.isoformat()}"
+
+
+def _capacity_key(lane: str) -> str:
+    return f"booking:capacity:{lane}"
+
+
+def no_device_capacity() -> int:
+    """ظرفیت هم‌زمان خط مشترک خدمات بدون دستگاه."""
+    return max(1, int(getattr(settings, 'BOOKING_NO_DEVICE_CAPACITY', 1)))
+
+
+def lane_capacities(device_ids: Iterable[Optional[Union[int, str]]]) -> Dict[Optional[Union[int, str]], int]:
+    """
+    ظرفیت هم‌زمان چند خط: ظرفیت دستگاه‌ها از کش (و در صورت نبود، با یک کوئری) و
+    برای خط بدون دستگاه از تنظیمات.
+    """
+    capacities = {}
+    keys = {}
+    for device_id in device_ids:
+        if device_id:
+            keys[_capacity_key(lane_key(device_id))] = device_id
+        else:
+            capacities[device_id] = no_device_capacity()
+    if not keys:
+        return capacities
+
+    cached = cache.get_many(list(keys))
+    for key, device_id in keys.items():
+        if key in cached:
+            capacities[device_id] = cached[key]
+    missing = [device_id for device_id in keys.values() if device_id not in capacities]
+    if missing:
+        found = {
+            str(pk): capacity
+            for pk, capacity in Device.objects.filter(id__in=missing).values_list('id', 'capacity')
+        }
+        for device_id in missing:
+            capacities[device_id] = found.get(str(device_id), 1)
+        cache.set_many({
+            _capacity_key(lane_key(device_id)): capacities[device_id] for device_id in missing
+        }, CACHE_TIMEOUT)
+    return capacities
+
+
+async def alane_capacity(device_id: Optional[Union[int, str]]) -> int:
+    """نسخه async ظرفیت یک خط."""
+    if not device_id:
+        return no_device_capacity()
+    key = _capacity_key(lane_key(device_id))
+    capacity = await cache.aget(key)
+    if capacity is None:
+        device = await Device.objects.filter(id=device_id).values_list('capacity', flat=True).afirst()
+        capacity = device or 1
+        await cache.aset(key, capacity, CACHE_TIMEOUT)
+    return capacity
+
+
+def local_midnight(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def appointment_days(start_time: datetime, end_time: datetime) -> List[date]:
+    """روزهای محلی که یک نوبت روی آن‌ها اثر می‌گذارد."""
+    first = timezone.localtime(start_time).date()
+    last = timezone.localtime(end_time - timedelta(microseconds=1)).date()
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def _bitmaps_from_intervals(intervals: Iterable[Tuple[datetime, datetime]], days: Iterable[date],
+                            capacity: int = 1) -> Dict[date, int]:
+    """
+    تبدیل بازه‌های نوبت به بیت‌مپ روزانه.
+    شروع به دقیقه پایین و پایان به دقیقه بالا گرد می‌شود تا هیچ تداخلی از دست نرود.
+    با capacity بیشتر از یک، فقط دقایقی که capacity نوبت هم‌زمان دارند علامت می‌خورند.
+    """
+    bitmaps = {day: 0 for day in days}
+    if not bitmaps:
+        return bitmaps
+
+    per_day: Dict[date, List[Tuple[int, int]]] = {}
+    for start_time, end_time in intervals:
+        for day in appointment_days(start_time, end_time):
+            if day not in bitmaps:
+                continue
+            midnight = local_midnight(day)
+            start_minute = max(0, math.floor((start_time - midnight).total_seconds() / 60))
+            end_minute = min(MINUTES_PER_DAY, math.ceil((end_time - midnight).total_seconds() / 60))
+            if end_minute > start_minute:
+                per_day.setdefault(day, []).append((start_minute, end_minute))
+
+    for day, minutes in per_day.items():
+        bitmap = 0
+        for start_minute, end_minute in saturated_intervals(minutes, capacity):
+            bitmap |= minute_mask(start_minute, end_minute)
+        bitmaps[day] = bitmap
+    return bitmaps
+
+
+def _lane_intervals_qs(device_id: Optional[Union[int, str]], days: List[date]):
+    """کوئری بازه‌های (شروع، پایان) نوبت‌های فعال یک خط در روزهای داده‌شده."""
+    window_start = local_midnight(min(days))
+    window_end = local_midnight(max(days) + timedelta(days=1))
+    return filter_lane(
+        Appointment.objects.filter(
+            start_time__lt=window_end,
+            end_time__gt=window_start,
+            status__in=ACTIVE_STATUSES,
+        ),
+        device_id,
+    ).values_list('start_time', 'end_time')
+
+
+def build_day_bitmaps(device_id: Optional[Union[int, str]], days: List[date]) -> Dict[date, int]:
+    """ساخت بیت‌مپ روزها مستقیماً از جدول نوبت‌ها (با یک کوئری برای کل بازه)."""
+    if not days:
+        return {}
+    capacity = lane_capacities([device_id])[device_id]
+    return _bitmaps_from_intervals(_lane_intervals_qs(device_id, days), days, capacity)
+
+
+def get_day_bitmaps(device_id: Optional[Union[int, str]], start_date: date, end_date: date) -> Dict[date, int]:
+    """
+    بیت‌مپ اشغال روزهای [start_date, end_date] یک خط.
+    روزهای موجود در کش مستقیماً خوانده می‌شوند و فقط روزهای غایب از دیتابیس ساخته می‌شوند.
+    """
+    return get_lanes_day_bitmaps([device_id], start_date, end_date)[device_id]
+
+
+def get_lanes_day_bitmaps(device_ids: List[Optional[Union[int, str]]], start_date: date,
+                          end_date: date) -> Dict[Optional[Union[int, str]], Dict[date, int]]:
+    """
+    بیت‌مپ اشغال چند خط به صورت یکجا: یک get_many روی کش و حداکثر یک کوئری
+    برای تمام (خط، روز)های غایب.
+    """
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    keys = {
+        _cache_key(lane_key(device_id), day): (device_id, day)
+        for device_id in device_ids for day in days
+    }
+    cached = cache.get_many(list(keys))
+
+    bitmaps = {device_id: {} for device_id in device_ids}
+    for key, value in cached.items():
+        device_id, day = keys[key]
+        bitmaps[device_id][day] = value
+
+    missing = {
+        device_id: [day for day in days if day not in bitmaps[device_id]]
+        for device_id in device_ids
+    }
+    missing = {device_id: lane_days for device_id, lane_days in missing.items() if lane_days}
+    if not missing:
+        return bitmaps
+
+    if len(missing) == 1:
+        (device_id, lane_days), = missing.items()
+        built = {device_id: build_day_bitmaps(device_id, lane_days)}
+    else:
+        all_days = sorted({day for lane_days in missing.values() for day in lane_days})
+        window_start = local_midnight(all_days[0])
+        window_end = local_midnight(all_days[-1] + timedelta(days=1))
+        intervals = {device_id: [] for device_id in missing}
+        booked_qs = Appointment.objects.filter(
+            start_time__lt=window_end,
+            end_time__gt=window_start,
+            status__in=ACTIVE_STATUSES,
+            selected_device_id__in=[device_id for device_id in missing if device_id],
+        ).values_list('selected_device_id', 'start_time', 'end_time')
+        for device_id, start_time, end_time in booked_qs:
+            intervals.setdefault(device_id, []).append((start_time, end_time))
+        if None in missing:
+            intervals[None] = list(filter_lane(
+                Appointment.objects.filter(
+                    start_time__lt=window_end, end_time__gt=window_start, status__in=ACTIVE_STATUSES
+                ),
+                None,
+            ).values_list('start_time', 'end_time'))
+        capacities = lane_capacities(missing)
+        built = {
+            device_id: _bitmaps_from_intervals(intervals.get(device_id, []), lane_days, capacities[device_id])
+            for device_id, lane_days in missing.items()
+        }
+
+    cache.set_many({
+        _cache_key(lane_key(device_id), day): bitmap
+        for device_id, lane_bitmaps in built.items() for day, bitmap in lane_bitmaps.items()
+    }, CACHE_TIMEOUT)
+    for device_id, lane_bitmaps in built.items():
+        bitmaps[device_id].update(lane_bitmaps)
+    return bitmaps
+
+
+def invalidate_days(device_id: Optional[Union[int, str]], days: Iterable[date]) -> None:
+    lane = lane_key(device_id)
+    cache.delete_many([_cache_key(lane, day) for day in days])
+
+
+def invalidate_lane(device_id: Optional[Union[int, str]]) -> None:
+    """حذف ظرفیت کش‌شده و بیت‌مپ روزهای آینده یک خط (مثلاً بعد از تغییر ظرفیت دستگاه)."""
+    today = timezone.localdate()
+    invalidate_days(device_id, (today + timedelta(days=i) for i in range(INVALIDATION_HORIZON_DAYS)))
+    cache.delete(_capacity_key(lane_key(device_id)))
+
+
+def refresh_days(device_id: Optional[Union[int, str]], days: Iterable[date]) -> None:
+    """بازسازی بیت‌مپ روزهای مشخص‌شده از روی دیتابیس و ذخیره در کش."""
+    lane = lane_key(device_id)
+    built = build_day_bitmaps(device_id, sorted(set(days)))
+    cache.set_many({_cache_key(lane, day): bitmap for day, bitmap in built.items()}, CACHE_TIMEOUT)
+
+
+async def aget_day_bitmaps(device_id: Optional[Union[int, str]], start_date: date, end_date: date) -> Dict[date, int]:
+    """نسخه async از get_day_bitmaps برای ویوهای ASGI (کش async و ORM async)."""
+    lane = lane_key(device_id)
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    keys = {_cache_key(lane, day): day for day in days}
+    cached = await cache.aget_many(list(keys))
+    bitmaps = {keys[key]: value for key, value in cached.items()}
+
+    missing = [day for day in days if day not in bitmaps]
+    if missing:
+        intervals = [interval async for interval in _lane_intervals_qs(device_id, missing)]
+        built = _bitmaps_from_intervals(intervals, missing, await alane_capacity(device_id))
+        await cache.aset_many({_cache_key(lane, day): bitmap for day, bitmap in built.items()}, CACHE_TIMEOUT)
+        bitmaps.update(built)
+    return bitmaps
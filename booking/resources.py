@@ -0,0 +1,152 @@
+# booking/resources.py
+"""
+منابع مشترک نوبت‌دهی (پزشک/اپراتور و اتاق، مدل Resource).
+گروهی که منابع لازم دارد فقط وقتی اسلات دارد که تمام آن منابع هم‌زمان آزاد باشند.
+برای هر منبع و هر روز لیست مرتب بازه‌های آزاد (ساعات حضور منهای نوبت‌های منبع) ساخته
+و لیست‌های تمام منابع گروه با ادغام خطی (intersect_intervals) اشتراک گرفته می‌شوند؛
+بنابراین هزینه با تعداد منابع جمع می‌شود و نه ضرب. نتیجه به صورت ماسک دقایق بسته
+روی بیت‌مپ اشغال خط OR می‌شود تا شبکه اسلات‌ها و موتورهای جاروب دست نخورند.
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.core.cache import cache
+
+from clinic.models import ResourceWorkHours, ServiceGroup
+from .bitmaps import MINUTES_PER_DAY, bitmap_runs, minute_mask
+from .intervals import intersect_intervals, subtract_intervals
+from .models import Appointment
+from .occupancy import ACTIVE_STATUSES, _bitmaps_from_intervals, local_midnight
+
+RESOURCE_CONFIG_KEY = 'booking:resource-config'
+RESOURCE_CONFIG_TIMEOUT = 60 * 60 * 24
+FULL_DAY = ((0, MINUTES_PER_DAY),)
+FULL_DAY_MASK = minute_mask(0, MINUTES_PER_DAY)
+
+Shifts = Tuple[Tuple[int, int], ...]
+
+
+class ResourceConfig(NamedTuple):
+    """منابع لازم هر گروه و ساعات حضور هفتگی هر منبع (روز ۰=شنبه) به دقیقه."""
+    group_resources: Dict[int, Tuple[int, ...]]
+    weekly_hours: Dict[int, Dict[int, Shifts]]
+
+
+def _to_minutes(value) -> int:
+    return value.hour * 60 + value.minute
+
+
+def _merged(shifts: Iterable[Tuple[int, int]]) -> Shifts:
+    merged = []
+    for start, end in sorted(shifts):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return tuple((start, end) for start, end in merged)
+
+
+def resource_config() -> ResourceConfig:
+    """
+    پیکربندی منابع تمام گروه‌ها از کش؛ در صورت نبود با یک کوئری (و اگر منبعی تعریف شده، یک کوئری دیگر).
+    سیگنال‌ها با هر تغییر منابع لازم گروه‌ها یا ساعات حضور، کلید را حذف می‌کنند.
+    """
+    config = cache.get(RESOURCE_CONFIG_KEY)
+    if config is not None:
+        return config
+
+    group_resources: Dict[int, List[int]] = {}
+    links = ServiceGroup.required_resources.through.objects.order_by('resource_id').values_list(
+        'servicegroup_id', 'resource_id'
+    )
+    for group_id, resource_id in links:
+        group_resources.setdefault(group_id, []).append(resource_id)
+
+    weekly_hours: Dict[int, Dict[int, List[Tuple[int, int]]]] = {}
+    if group_resources:
+        rows = ResourceWorkHours.objects.values_list('resource_id', 'day_of_week', 'start_time', 'end_time')
+        for resource_id, day_of_week, start_time, end_time in rows:
+            start, end = _to_minutes(start_time), _to_minutes(end_time)
+            if end > start:
+                weekly_hours.setdefault(resource_id, {}).setdefault(day_of_week, []).append((start, end))
+
+    config = ResourceConfig(
+        group_resources={group_id: tuple(ids) for group_id, ids in group_resources.items()},
+        weekly_hours={
+            resource_id: {day: _merged(shifts) for day, shifts in days.items()}
+            for resource_id, days in weekly_hours.items()
+        },
+    )
+    cache.set(RESOURCE_CONFIG_KEY, config, RESOURCE_CONFIG_TIMEOUT)
+    return config
+
+
+def invalidate_resource_config() -> None:
+    cache.delete(RESOURCE_CONFIG_KEY)
+
+
+def required_resources(group_id: Optional[int]) -> Tuple[int, ...]:
+    """شناسه منابعی که هر نوبت گروه لازم دارد."""
+    return resource_config().group_resources.get(group_id, ())
+
+
+def _resource_busy(resource_ids: List[int], days: List[date]) -> Dict[int, Dict[date, int]]:
+    """بیت‌مپ اشغال روزانه هر منبع از نوبت‌های فعال آن (یک کوئری برای کل بازه)."""
+    window_start = local_midnight(days[0])
+    window_end = local_midnight(days[-1] + timedelta(days=1))
+    intervals: Dict[int, list] = {resource_id: [] for resource_id in resource_ids}
+    booked = Appointment.resources.through.objects.filter(
+        appointment__start_time__lt=window_end,
+        appointment__end_time__gt=window_start,
+        resource_id__in=resource_ids,
+        appointment__status__in=ACTIVE_STATUSES,
+    ).values_list('resource_id', 'appointment__start_time', 'appointment__end_time')
+    for resource_id, start_time, end_time in booked:
+        intervals[resource_id].append((start_time, end_time))
+    return {resource_id: _bitmaps_from_intervals(intervals[resource_id], days) for resource_id in resource_ids}
+
+
+def groups_resource_masks(group_ids: Iterable[Optional[int]], start_date: date,
+                          end_date: date) -> Dict[Optional[int], Dict[date, int]]:
+    """
+    ماسک دقایق بسته هر روز برای هر گروه: دقایقی که حداقل یکی از منابع لازم گروه آزاد نیست.
+    برای گروه‌های بدون منبع دیکشنری خالی است و هیچ کوئری اضافه‌ای اجرا نمی‌شود.
+    """
+    config = resource_config()
+    group_ids = list(group_ids)
+    masks: Dict[Optional[int], Dict[date, int]] = {group_id: {} for group_id in group_ids}
+    resource_ids = sorted({rid for group_id in group_ids for rid in config.group_resources.get(group_id, ())})
+    if not resource_ids or end_date < start_date:
+        return masks
+
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    busy = _resource_busy(resource_ids, days)
+    for day in days:
+        day_of_week = (day.weekday() + 2) % 7
+        free: Dict[int, List[Tuple[int, int]]] = {}
+        for resource_id in resource_ids:
+            hours = config.weekly_hours.get(resource_id)
+            # منبع بدون ساعات حضور محدودیت ساعتی ندارد
+            shifts = list(hours.get(day_of_week, ())) if hours is not None else list(FULL_DAY)
+            free[resource_id] = subtract_intervals(shifts, bitmap_runs(busy[resource_id][day]))
+        for group_id in group_ids:
+            group_resources = config.group_resources.get(group_id)
+            if not group_resources:
+                continue
+            window = free[group_resources[0]]
+            for resource_id in group_resources[1:]:
+                window = intersect_intervals(window, free[resource_id])
+            open_mask = 0
+            for start, end in window:
+                open_mask |= minute_mask(start, end)
+            closed_mask = FULL_DAY_MASK & ~open_mask
+            if closed_mask:
+                masks[group_id][day] = closed_mask
+    return masks
+
+
+def resource_masks(group_id: Optional[int], start_date: date, end_date: date) -> Dict[date, int]:
+    """ماسک دقایق بسته روزهای بازه برای یک گروه."""
+    return groups_resource_masks([group_id], start_date, end_date)[group_id]
+
@@ -0,0 +1,222 @@
+# booking/schedule.py
+"""
+برنامه هفتگی کامپایل‌شده (WeeklySchedule) برای هر (خدمت، جنسیت).
+اولویت ساعات کاری اختصاصی خدمت بر ساعات کاری گروه، ادغام شیفت‌های تکراری یا هم‌پوشان
+و تبدیل ساعت‌ها به دقیقه از نیمه‌شب، فقط یک بار انجام می‌شود.
+نتیجه در حافظه هر پروسه و در کش مشترک نگهداری می‌شود و با تغییر WorkHours
+(از طریق سیگنال‌ها) با بالا رفتن نسخه بی‌اعتبار می‌شود.
+"""
+
+import time
+from typing import Dict, Iterable, NamedTuple, Tuple
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from clinic.models import Service, WorkHours
+
+Shift = Tuple[int, int]
+
+SCHEDULE_VERSION_KEY = 'booking:schedule-version'
+SCHEDULE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# کش داخل پروسه: (service_id, gender) -> (نسخه، برنامه)
+_local_schedules: Dict[Tuple[int, str], Tuple[int, 'WeeklySchedule']] = {}
+
+
+class WeeklySchedule(NamedTuple):
+    """
+    برنامه تغییرناپذیر هفتگی.
+    days[i] شیفت‌های روز i مدل WorkHours (۰=شنبه) به صورت (دقیقه شروع، دقیقه پایان) است.
+    """
+    service_id: int
+    gender: str
+    days: Tuple[Tuple[Shift, ...], ...]
+
+    def shifts(self, day_of_week: int) -> Tuple[Shift, ...]:
+        return self.days[day_of_week]
+
+    def is_empty(self) -> bool:
+        return not any(self.days)
+
+
+def _merge_shifts(shifts: Iterable[Shift]) -> Tuple[Shift, ...]:
+    """
+    ادغام شیفت‌های تکراری یا هم‌پوشان.
+    شیفت‌های پشت‌سرهم (پایان یکی = شروع دیگری) جدا می‌مانند تا شبکه اسلات هر شیفت حفظ شود.
+    """
+    merged = []
+    for start, end in sorted(set(shifts)):
+        if merged and start < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return tuple((start, end) for start, end in merged)
+
+
+def _to_minutes(value) -> int:
+    return value.hour * 60 + value.minute
+
+
+def _gender_filter(gender: str) -> Q:
+    if gender == 'ALL':
+        return Q(gender_specific='ALL')
+    return Q(gender_specific=gender) | Q(gender_specific='ALL')
+
+
+def _schedule_from_rows(service_id: int, gender: str, rows) -> WeeklySchedule:
+    per_day = {day: [] for day in range(7)}
+    for day_of_week, start_time, end_time in rows:
+        start, end = _to_minutes(start_time), _to_minutes(end_time)
+        if end > start:
+            per_day[day_of_week].append((start, end))
+
+    return WeeklySchedule(
+        service_id=service_id,
+        gender=gender,
+        days=tuple(_merge_shifts(per_day[day]) for day in range(7)),
+    )
+
+
+def _work_hours_rows(gender: str, **scope):
+    return WorkHours.objects.filter(**scope).filter(_gender_filter(gender)).values_list(
+        'day_of_week', 'start_time', 'end_time'
+    )
+
+
+def compile_schedule(service: Service, gender: str) -> WeeklySchedule:
+    """
+    ساخت برنامه هفتگی از دیتابیس.
+    اگر خدمت برای این جنسیت ساعات کاری اختصاصی داشته باشد همان استفاده می‌شود،
+    در غیر این صورت ساعات کاری گروه.
+    """
+    rows = list(_work_hours_rows(gender, service_id=service.id))
+    if not rows:
+        rows = list(_work_hours_rows(gender, service_group_id=service.group_id))
+    return _schedule_from_rows(service.id, gender, rows)
+
+
+async def acompile_schedule(service: Service, gender: str) -> WeeklySchedule:
+    """نسخه async از compile_schedule."""
+    rows = [row async for row in _work_hours_rows(gender, service_id=service.id)]
+    if not rows:
+        rows = [row async for row in _work_hours_rows(gender, service_group_id=service.group_id)]
+    return _schedule_from_rows(service.id, gender, rows)
+
+
+def compile_schedules(services: Iterable[Service], gender: str) -> Dict[int, WeeklySchedule]:
+    """
+    نسخه دسته‌ای compile_schedule: ساعات کاری تمام خدمات و گروه‌هایشان با یک کوئری خوانده می‌شود.
+    """
+    services = list(services)
+    if not services:
+        return {}
+    service_rows: Dict[int, list] = {}
+    group_rows: Dict[int, list] = {}
+    rows = WorkHours.objects.filter(
+        Q(service_id__in=[s.id for s in services]) | Q(service_group_id__in={s.group_id for s in services})
+    ).filter(_gender_filter(gender)).values_list(
+        'service_id', 'service_group_id', 'day_of_week', 'start_time', 'end_time'
+    )
+    for service_id, group_id, day_of_week, start_time, end_time in rows:
+        if service_id is not None:
+            service_rows.setdefault(service_id, []).append((day_of_week, start_time, end_time))
+        if group_id is not None:
+            group_rows.setdefault(group_id, []).append((day_of_week, start_time, end_time))
+
+    return {
+        s.id: _schedule_from_rows(s.id, gender, service_rows.get(s.id) or group_rows.get(s.group_id, []))
+        for s in services
+    }
+
+
+def _schedule_version() -> int:
+    version = cache.get(SCHEDULE_VERSION_KEY)
+    if version is None:
+        cache.add(SCHEDULE_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(SCHEDULE_VERSION_KEY)
+    return version
+
+
+async def _aschedule_version() -> int:
+    version = await cache.aget(SCHEDULE_VERSION_KEY)
+    if version is None:
+        await cache.aadd(SCHEDULE_VERSION_KEY, int(time.time() * 1000), None)
+        version = await cache.aget(SCHEDULE_VERSION_KEY)
+    return version
+
+
+def invalidate_schedules() -> None:
+    """بی‌اعتبار کردن تمام برنامه‌های کامپایل‌شده (در همه پروسه‌ها)."""
+    try:
+        cache.incr(SCHEDULE_VERSION_KEY)
+    except ValueError:
+        cache.set(SCHEDULE_VERSION_KEY, int(time.time() * 1000), None)
+
+
+def get_weekly_schedule(service: Service, gender: str) -> WeeklySchedule:
+    """برنامه هفتگی (خدمت، جنسیت) از کش پروسه، کش مشترک یا در نهایت دیتابیس."""
+    version = _schedule_version()
+    local_key = (service.id, gender)
+    local = _local_schedules.get(local_key)
+    if local and local[0] == version:
+        return local[1]
+
+    cache_key = f"booking:schedule:v{version}:{service.id}:{gender}"
+    schedule = cache.get(cache_key)
+    if schedule is None:
+        schedule = compile_schedule(service, gender)
+        cache.set(cache_key, schedule, SCHEDULE_CACHE_TIMEOUT)
+    _local_schedules[local_key] = (version, schedule)
+    return schedule
+
+
+def get_weekly_schedules(services: Iterable[Service], gender: str) -> Dict[int, WeeklySchedule]:
+    """
+    برنامه هفتگی چند خدمت به صورت یکجا: یک get_many روی کش مشترک
+    و حداکثر یک کوئری برای خدماتی که در هیچ کشی نیستند.
+    """
+    version = _schedule_version()
+    schedules: Dict[int, WeeklySchedule] = {}
+    pending = []
+    for service in services:
+        local = _local_schedules.get((service.id, gender))
+        if local and local[0] == version:
+            schedules[service.id] = local[1]
+        else:
+            pending.append(service)
+    if not pending:
+        return schedules
+
+    cache_keys = {f"booking:schedule:v{version}:{s.id}:{gender}": s for s in pending}
+    for key, schedule in cache.get_many(list(cache_keys)).items():
+        schedules[cache_keys[key].id] = schedule
+    missing = [s for s in pending if s.id not in schedules]
+
+    compiled = compile_schedules(missing, gender)
+    if compiled:
+        cache.set_many({
+            f"booking:schedule:v{version}:{service_id}:{gender}": schedule
+            for service_id, schedule in compiled.items()
+        }, SCHEDULE_CACHE_TIMEOUT)
+    schedules.update(compiled)
+    for service in pending:
+        _local_schedules[(service.id, gender)] = (version, schedules[service.id])
+    return schedules
+
+
+async def aget_weekly_schedule(service: Service, gender: str) -> WeeklySchedule:
+    """نسخه async از get_weekly_schedule (کش پروسه، کش مشترک و ORM async)."""
+    version = await _aschedule_version()
+    local_key = (service.id, gender)
+    local = _local_schedules.get(local_key)
+    if local and local[0] == version:
+        return local[1]
+
+    cache_key = f"booking:schedule:v{version}:{service.id}:{gender}"
+    schedule = await cache.aget(cache_key)
+    if schedule is None:
+        schedule = await acompile_schedule(service, gender)
+        await cache.aset(cache_key, schedule, SCHEDULE_CACHE_TIMEOUT)
+    _local_schedules[local_key] = (version, schedule)
+    return schedule
@@ -0,0 +1,385 @@
+# booking/signals.py
+"""
+سیگنال‌های همگام‌سازی داده‌های مشتق‌شده از نوبت‌ها و ساعات کاری
+(بیت‌مپ اشغال، جدول مادی‌شده اسلات‌های آزاد، نسخه کش خطوط و نسخه کاتالوگ)
+و همچنین تعطیلی‌ها، توقف دستگاه‌ها، ظرفیت هم‌زمان دستگاه‌ها و منابع (پزشک و اتاق).
+هر تغییر در وضعیت، زمان یا دستگاه نوبت، روزهای قبلی و جدید آن را به‌روز می‌کند؛
+این شامل ثبت نوبت، تایید پرداخت، لغو و تکمیل در تمام ویوها و پنل ادمین است.
+"""
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, pre_delete, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from clinic.models import Closure, Device, Resource, ResourceWorkHours, Service, ServiceGroup, WorkHours
+from .availability import (
+    discard_closure_days, discard_device_days, discard_group_days, discard_service_days, discard_work_hours_days,
+    patch_lane_days,
+)
+from .feed import publish_lane_days, publish_lane_reset
+from .lanes import NO_DEVICE_LANE, lane_key
+from .models import Appointment
+from .occupancy import appointment_days, invalidate_days, invalidate_lane, refresh_days
+from .resources import invalidate_resource_config, resource_config
+from .schedule import invalidate_schedules
+from .slot_cache import bump_catalog_version, bump_lane_version, group_lanes
+
+TRACKED_FIELDS = {'status', 'start_time', 'end_time', 'selected_device'}
+
+
+def _footprint(device_id, start_time, end_time):
+    """(دستگاه، روزها) که یک نوبت در بیت‌مپ‌ها اشغال می‌کند."""
+    if not (start_time and end_time):
+        return None
+    return device_id, tuple(appointment_days(start_time, end_time))
+
+
+def _refresh_lane(device_id, days):
+    refresh_days(device_id, days)
+    patch_lane_days(device_id, days)
+    bump_lane_version(lane_key(device_id))
+    publish_lane_days(lane_key(device_id), days)
+
+
+def _sync_lane_days(*footprints):
+    """
+    کلیدهای کش بیت‌مپ بلافاصله حذف می‌شوند و بعد از commit تراکنش دوباره ساخته می‌شوند؛
+    ردیف‌های جدول مادی‌شده هم بعد از commit فقط برای همان روزها اصلاح می‌شوند و روزها در فید خط اعلام می‌شوند.
+    نسخه خط هم قبل و هم بعد از commit بالا می‌رود تا نتیجه‌ای که در این فاصله کش شده باقی نماند.
+    اگر تراکنش rollback شود، هیچ‌کدام وضعیت اشتباه را نگه نمی‌دارند.
+    """
+    lanes = {}
+    for footprint in footprints:
+        if footprint:
+            device_id, days = footprint
+            lanes.setdefault(device_id, set()).update(days)
+
+    for device_id, days in lanes.items():
+        invalidate_days(device_id, days)
+        bump_lane_version(lane_key(device_id))
+        transaction.on_commit(lambda d=device_id, ds=days: _refresh_lane(d, ds))
+
+
+def _resource_footprints(resource_ids, *footprints):
+    """
+    (خط، روزها) برای تمام خطوط گروه‌هایی که یکی از منابع نوبت را لازم دارند؛
+    نوبتی که پزشک یا اتاق را اشغال می‌کند، اسلات‌های گروه‌های دیگر همان منبع را هم عوض می‌کند.
+    """
+    resource_ids = set(resource_ids)
+    days = {day for footprint in footprints if footprint for day in footprint[1]}
+    if not resource_ids or not days:
+        return []
+    group_ids = [
+        group_id for group_id, required in resource_config().group_resources.items()
+        if resource_ids.intersection(required)
+    ]
+    lanes = set()
+    for group in ServiceGroup.objects.filter(id__in=group_ids):
+        if group.has_devices:
+            lanes.update(group.available_devices.values_list('id', flat=True))
+        else:
+            lanes.add(None)
+    return [(device_id, tuple(days)) for device_id in lanes]
+
+
+def _appointment_resource_ids(instance):
+    """منابع نوبت (فقط اگر گروهی منبع لازم داشته باشد کوئری زده می‌شود)."""
+    if not instance.pk or not resource_config().group_resources:
+        return []
+    return list(instance.resources.values_list('id', flat=True))
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_previous_footprint(sender, instance, update_fields=None, **kwargs):
+    instance._previous_footprint = None
+    if update_fields is not None and not (TRACKED_FIELDS & set(update_fields)):
+        return
+    if instance.pk:
+        previous = sender.objects.filter(pk=instance.pk).values_list(
+            'selected_device_id', 'start_time', 'end_time'
+        ).first()
+        if previous:
+            instance._previous_footprint = _footprint(*previous)
+
+
+@receiver(post_save, sender=Appointment)
+def sync_lane_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not (TRACKED_FIELDS & set(update_fields)):
+        return
+    previous = getattr(instance, '_previous_footprint', None)
+    current = _footprint(instance.selected_device_id, instance.start_time, instance.end_time)
+    resource_ids = [] if created else _appointment_resource_ids(instance)
+    _sync_lane_days(previous, current, *_resource_footprints(resource_ids, previous, current))
+
+
+@receiver(pre_delete, sender=Appointment)
+def remember_resources_on_delete(sender, instance, **kwargs):
+    instance._resource_ids = _appointment_resource_ids(instance)
+
+
+@receiver(post_delete, sender=Appointment)
+def sync_lane_on_delete(sender, instance, **kwargs):
+    current = _footprint(instance.selected_device_id, instance.start_time, instance.end_time)
+    _sync_lane_days(current, *_resource_footprints(getattr(instance, '_resource_ids', []), current))
+
+
+@receiver(m2m_changed, sender=Appointment.resources.through)
+def sync_appointment_resources(sender, instance, action, reverse, pk_set, **kwargs):
+    """رزرو یا آزادسازی منابع یک نوبت، روزهای آن را روی خطوط گروه‌های همان منابع به‌روز می‌کند."""
+    if reverse:
+        return
+    if action == 'pre_clear':
+        instance._cleared_resource_ids = list(instance.resources.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    resource_ids = pk_set if action != 'post_clear' else getattr(instance, '_cleared_resource_ids', [])
+    current = _footprint(instance.selected_device_id, instance.start_time, instance.end_time)
+    _sync_lane_days(*_resource_footprints(resource_ids or [], current))
+
+
+# --- ساعات کاری (شامل ذخیره FormSet در پنل پذیرش) ---
+
+@receiver(pre_save, sender=WorkHours)
+def remember_previous_work_hours(sender, instance, **kwargs):
+    instance._previous_scope = None
+    if instance.pk:
+        previous = sender.objects.filter(pk=instance.pk).values_list(
+            'service_id', 'service_group_id', 'day_of_week'
+        ).first()
+        if previous:
+            instance._previous_scope = previous
+
+
+@receiver(post_save, sender=WorkHours)
+@receiver(post_delete, sender=WorkHours)
+def sync_work_hours(sender, instance, **kwargs):
+    scopes = {
+        getattr(instance, '_previous_scope', None),
+        (instance.service_id, instance.service_group_id, instance.day_of_week),
+    }
+    group_ids = set()
+    for scope in scopes:
+        if scope:
+            discard_work_hours_days(*scope)
+            service_id, service_group_id, _ = scope
+            group_ids.add(service_group_id)
+            if service_id:
+                group_ids.add(
+                    ServiceGroup.objects.filter(services__id=service_id).values_list('id', flat=True).first()
+                )
+
+    lanes = set()
+    for group in ServiceGroup.objects.filter(id__in=[gid for gid in group_ids if gid]):
+        lanes.update(group_lanes(group))
+
+    def invalidate():
+        # برنامه‌های هفتگی کامپایل‌شده و نقشه‌های کش‌شده خطوط گروه‌های درگیر بی‌اعتبار می‌شوند
+        invalidate_schedules()
+        for lane in lanes:
+            bump_lane_version(lane)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+    transaction.on_commit(lambda: publish_lane_reset(lanes))
+
+
+CLOSURE_SCOPE_FIELDS = ('service_group_id', 'device_id', 'start_date', 'end_date')
+
+
+@receiver(pre_save, sender=Closure)
+def remember_previous_closure(sender, instance, **kwargs):
+    instance._previous_scope = None
+    if instance.pk:
+        instance._previous_scope = sender.objects.filter(pk=instance.pk).values_list(*CLOSURE_SCOPE_FIELDS).first()
+
+
+@receiver(post_save, sender=Closure)
+@receiver(post_delete, sender=Closure)
+def sync_closure(sender, instance, **kwargs):
+    """تعطیلی جدید، ویرایش‌شده یا حذف‌شده روزهای قبلی و جدید خطوط درگیر را دوباره محاسبه می‌کند."""
+    scopes = {
+        getattr(instance, '_previous_scope', None),
+        tuple(getattr(instance, field) for field in CLOSURE_SCOPE_FIELDS),
+    }
+    lanes = set()
+    for scope in scopes:
+        if not scope:
+            continue
+        service_group_id, device_id, start_date, end_date = scope
+        discard_closure_days(service_group_id, device_id, start_date, end_date)
+        if device_id:
+            lanes.add(lane_key(device_id))
+        elif service_group_id:
+            # در حذف آبشاری گروه، خود گروه دیگر وجود ندارد
+            service_group = ServiceGroup.objects.filter(pk=service_group_id).first()
+            if service_group:
+                lanes.update(group_lanes(service_group))
+        else:
+            lanes.add(NO_DEVICE_LANE)
+            lanes.update(lane_key(device_id) for device_id in Device.objects.values_list('id', flat=True))
+
+    def invalidate():
+        for lane in lanes:
+            bump_lane_version(lane)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+    transaction.on_commit(lambda: publish_lane_reset(lanes))
+
+
+@receiver(pre_save, sender=Device)
+def remember_previous_capacity(sender, instance, **kwargs):
+    instance._previous_capacity = None
+    if instance.pk:
+        instance._previous_capacity = sender.objects.filter(pk=instance.pk).values_list('capacity', flat=True).first()
+
+
+@receiver(post_save, sender=Device)
+def sync_device_capacity(sender, instance, created, **kwargs):
+    """تغییر ظرفیت دستگاه، بیت‌مپ اشغال و اسلات‌های تمام روزهای آینده خط آن را عوض می‌کند."""
+    if created or getattr(instance, '_previous_capacity', None) == instance.capacity:
+        return
+    discard_device_days(instance.pk)
+    lanes = [lane_key(instance.pk)]
+
+    def invalidate():
+        invalidate_lane(instance.pk)
+        bump_lane_version(lanes[0])
+
+    invalidate()
+    transaction.on_commit(invalidate)
+    transaction.on_commit(lambda: publish_lane_reset(lanes))
+
+
+# --- منابع (پزشک/اپراتور و اتاق) ---
+
+def _sync_resource_groups(group_ids):
+    """تغییر منابع لازم یا ساعات حضور: ردیف‌ها، نقشه‌های کش‌شده و فید تمام خطوط گروه‌ها از نو."""
+    invalidate_resource_config()
+    lanes = set()
+    for group in ServiceGroup.objects.filter(id__in=[gid for gid in group_ids if gid]):
+        discard_group_days(group.pk)
+        lanes.update(group_lanes(group))
+
+    def invalidate():
+        invalidate_resource_config()
+        for lane in lanes:
+            bump_lane_version(lane)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+    transaction.on_commit(lambda: publish_lane_reset(lanes))
+
+
+def _resource_group_ids(resource_id):
+    return list(ServiceGroup.objects.filter(required_resources=resource_id).values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=ServiceGroup.required_resources.through)
+def sync_required_resources(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance._cleared_group_ids = (
+            [instance.pk] if not reverse else list(instance.service_groups.values_list('id', flat=True))
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        group_ids = [instance.pk]
+    elif action == 'post_clear':
+        group_ids = getattr(instance, '_cleared_group_ids', [])
+    else:
+        group_ids = list(pk_set or [])
+    _sync_resource_groups(group_ids)
+
+
+@receiver(post_save, sender=ResourceWorkHours)
+@receiver(post_delete, sender=ResourceWorkHours)
+def sync_resource_work_hours(sender, instance, **kwargs):
+    _sync_resource_groups(_resource_group_ids(instance.resource_id))
+
+
+@receiver(pre_delete, sender=Resource)
+def remember_resource_groups(sender, instance, **kwargs):
+    instance._group_ids = _resource_group_ids(instance.pk)
+
+
+@receiver(post_delete, sender=Resource)
+def sync_deleted_resource(sender, instance, **kwargs):
+    _sync_resource_groups(getattr(instance, '_group_ids', []))
+
+
+SLOT_POLICY_FIELDS = ('slot_step', 'best_fit_slots')
+
+
+@receiver(pre_save, sender=ServiceGroup)
+def remember_previous_slot_policy(sender, instance, **kwargs):
+    previous = None
+    if instance.pk:
+        previous = ServiceGroup.objects.filter(pk=instance.pk).values_list(*SLOT_POLICY_FIELDS).first()
+    instance._previous_slot_policy = previous
+
+
+@receiver(post_save, sender=ServiceGroup)
+def sync_slot_policy(sender, instance, created, **kwargs):
+    """تغییر گام اسلات یا چینش فشرده، شبکه اسلات تمام خطوط گروه را عوض می‌کند."""
+    current = tuple(getattr(instance, field) for field in SLOT_POLICY_FIELDS)
+    if created or getattr(instance, '_previous_slot_policy', None) == current:
+        return
+    discard_group_days(instance.pk)
+    lanes = group_lanes(instance)
+
+    def invalidate():
+        for lane in lanes:
+            bump_lane_version(lane)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+    transaction.on_commit(lambda: publish_lane_reset(lanes))
+
+
+SERVICE_SLOT_FIELDS = ('duration', 'group_id')
+
+
+@receiver(pre_save, sender=Service)
+def remember_previous_service_slots(sender, instance, **kwargs):
+    previous = None
+    if instance.pk:
+        previous = Service.objects.filter(pk=instance.pk).values_list(*SERVICE_SLOT_FIELDS).first()
+    instance._previous_service_slots = previous
+
+
+@receiver(post_save, sender=Service)
+def sync_service_slots(sender, instance, created, **kwargs):
+    """تغییر مدت یا گروه خدمت، اسلات‌های تمام ترکیب‌های شامل آن را در گروه قبلی و جدید عوض می‌کند."""
+    previous = getattr(instance, '_previous_service_slots', None)
+    current = tuple(getattr(instance, field) for field in SERVICE_SLOT_FIELDS)
+    if created or previous is None or previous == current:
+        return
+    discard_service_days(instance.pk)
+    lanes = set()
+    for group in ServiceGroup.objects.filter(id__in={previous[1], current[1]}):
+        lanes.update(group_lanes(group))
+
+    def invalidate():
+        for lane in lanes:
+            bump_lane_version(lane)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+    transaction.on_commit(lambda: publish_lane_reset(lanes))
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=ServiceGroup)
+@receiver(post_delete, sender=ServiceGroup)
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+@receiver(m2m_changed, sender=ServiceGroup.available_devices.through)
+def sync_catalog(sender, **kwargs):
+    """هر تغییر خدمات، گروه‌ها یا دستگاه‌های گروه، ETag کاتالوگ و اسلات‌ها را عوض می‌کند."""
+    if kwargs.get('action', 'post_').startswith('post_'):
+        bump_catalog_version()
+        transaction.on_commit(bump_catalog_version)
@@ -0,0 +1,291 @@
+# booking/slot_cache.py
+"""
+کش نسخه‌دار نقشه اسلات‌ها.
+کلید کش شامل خط (دستگاه یا خط بدون دستگاه)، خدمت مرجع، مدت کل، جنسیت، پنجره زمانی
+و «نسخه خط» است. هر تغییر نوبت روی یک خط یا تغییر ساعات کاری گروه‌های آن خط، نسخه را
+یک واحد بالا می‌برد؛ در نتیجه کلیدهای قبلی خودبه‌خود بی‌اعتبار می‌شوند و خطوط دیگر دست نمی‌خورند.
+"""
+
+import asyncio
+import hashlib
+import time
+from datetime import date
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from clinic.models import Service, ServiceGroup
+from users.models import CustomUser
+from .calendar_logic import (
+    agenerate_available_slots_for_range, drop_elapsed_slots, generate_available_slots_for_range,
+    resolve_target_gender
+)
+from .holds import alanes_holds, holds_version, lanes_holds_versions
+from .lanes import ANY_DEVICE, NO_DEVICE_LANE, lane_key
+
+SLOTS_CACHE_TIMEOUT = 60 * 10
+VERSION_CACHE_TIMEOUT = None
+CATALOG_VERSION_KEY = 'booking:catalog-version'
+# ادغام محاسبه‌های هم‌زمان: عمر قفل، حداکثر انتظار و فاصله بررسی کلید نتیجه (ثانیه)
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30
+SINGLE_FLIGHT_WAIT_SECONDS = 3.0
+SINGLE_FLIGHT_POLL_SECONDS = 0.05
+# ETag اسلات‌ها در هر بازه هم عوض می‌شود تا اسلات‌های سپری‌شده در پاسخ 304 باقی نمانند
+ETAG_TIME_BUCKET_SECONDS = 60
+
+
+def _version_key(lane: str) -> str:
+    return f"booking:lane-version:{lane}"
+
+
+def _current_version(key: str) -> int:
+    """
+    مقدار اولیه نسخه از زمان جاری ساخته می‌شود تا اگر کلید نسخه از کش
+    حذف شد، نسخه جدید با کلیدهای قدیمی باقی‌مانده برخورد نکند.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), VERSION_CACHE_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+async def _acurrent_version(key: str) -> int:
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, int(time.time() * 1000), VERSION_CACHE_TIMEOUT)
+        version = await cache.aget(key)
+    return version
+
+
+def _bump_version(key: str) -> None:
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), VERSION_CACHE_TIMEOUT)
+
+
+def lane_version(lane: str) -> int:
+    """نسخه فعلی خط."""
+    return _current_version(_version_key(lane))
+
+
+def bump_lane_version(lane: str) -> None:
+    _bump_version(_version_key(lane))
+
+
+def catalog_version() -> int:
+    """نسخه کاتالوگ (خدمات، گروه‌ها و دستگاه‌ها) که با هر تغییر آن‌ها بالا می‌رود."""
+    return _current_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version() -> None:
+    _bump_version(CATALOG_VERSION_KEY)
+
+
+def group_lanes(service_group: ServiceGroup) -> List[str]:
+    """خطوطی که ساعات کاری یک گروه روی آن‌ها اثر دارد."""
+    if service_group.has_devices:
+        return [lane_key(device_id) for device_id in service_group.available_devices.values_list('id', flat=True)]
+    return [NO_DEVICE_LANE]
+
+
+def slots_scope(services: List[Service], device_id: Union[int, str, None]) -> Tuple[str, str]:
+    """
+    (خط، نسخه) کش برای خدمات انتخابی؛ نسخه «هر دستگاهی» از نسخه تمام خطوط گروه ساخته می‌شود.
+    اثر انگشت نگه‌داشت‌های فعال هر خط هم در نسخه است تا انقضای نگه‌داشت‌ها نقشه کش‌شده را کهنه نکند.
+    """
+    service = services[0]
+    if service.group.has_devices and device_id == ANY_DEVICE:
+        lane = f"any-{service.group_id}"
+        lanes = group_lanes(service.group)
+    else:
+        lane = lane_key(device_id if service.group.has_devices else None)
+        lanes = [lane]
+    holds = lanes_holds_versions(lanes)
+    version = "-".join(f"{lane_version(scope_lane)}h{holds[scope_lane]}" for scope_lane in lanes)
+    return lane, version
+
+
+def slots_etag(
+    start_date: date,
+    end_date: date,
+    service_ids: List[str],
+    device_id: Union[int, str, None],
+    patient_user: Union[CustomUser, None] = None,
+    gender_param: str = None,
+    variant: str = '',
+) -> Optional[str]:
+    """
+    ETag پاسخ اسلات‌ها بدون اجرای موتور: نسخه خط (نوبت‌ها و ساعات کاری)، نسخه کاتالوگ،
+    پارامترهای درخواست و بازه زمانی جاری. variant برای تفکیک قالب‌های پاسخ است.
+    """
+    services = list(Service.objects.select_related('group').filter(id__in=service_ids).order_by('pk'))
+    if not services:
+        return None
+    lane, version = slots_scope(services, device_id)
+    raw = "{}:v{}:c{}:{}:{}:{}:{}:{}:{}".format(
+        lane, version, catalog_version(), ",".join(str(s.id) for s in services),
+        resolve_target_gender(patient_user, gender_param),
+        start_date.isoformat(), end_date.isoformat(),
+        int(time.time() // ETAG_TIME_BUCKET_SECONDS), variant,
+    )
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def _single_flight(cache_key: str, compute: Callable[[], Dict[str, List[Dict]]]) -> Dict[str, List[Dict]]:
+    """
+    ادغام محاسبه‌های هم‌زمان یکسان (single-flight): فقط پروسه‌ای که قفل کش را بگیرد محاسبه می‌کند
+    و نتیجه را در کلید نتیجه می‌نویسد؛ بقیه حداکثر SINGLE_FLIGHT_WAIT_SECONDS منتظر همان نتیجه می‌مانند.
+    اگر نتیجه نرسید (مثلاً پروسه صاحب قفل از کار افتاد)، خودشان محاسبه می‌کنند.
+    """
+    lock_key = f"{cache_key}:lock"
+    if not cache.add(lock_key, 1, SINGLE_FLIGHT_LOCK_TIMEOUT):
+        deadline = time.monotonic() + SINGLE_FLIGHT_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(SINGLE_FLIGHT_POLL_SECONDS)
+            slots_map = cache.get(cache_key)
+            if slots_map is not None:
+                return slots_map
+            if cache.get(lock_key) is None:
+                break
+        slots_map = compute()
+        cache.set(cache_key, slots_map, SLOTS_CACHE_TIMEOUT)
+        return slots_map
+
+    try:
+        slots_map = compute()
+        cache.set(cache_key, slots_map, SLOTS_CACHE_TIMEOUT)
+        return slots_map
+    finally:
+        cache.delete(lock_key)
+
+
+def _format_slots_key(lane: str, version, services: List[Service], gender: str,
+                      start_date: date, end_date: date) -> str:
+    return "booking:slots:{}:v{}:{}:{}:{}:{}:{}".format(
+        lane, version, services[0].id, sum(s.duration for s in services), gender,
+        start_date.isoformat(), end_date.isoformat()
+    )
+
+
+def _slots_cache_key(services: List[Service], device_id: Union[int, str, None], gender: str,
+                     start_date: date, end_date: date) -> str:
+    lane, version = slots_scope(services, device_id)
+    return _format_slots_key(lane, version, services, gender, start_date, end_date)
+
+
+def set_cached_slots(services: List[Service], device_id: Union[int, str, None], gender: str,
+                     start_date: date, end_date: date, slots_map: Dict[str, List[Dict]],
+                     scope: Optional[Tuple[str, str]] = None) -> None:
+    """
+    نوشتن نقشه از پیش محاسبه‌شده یک پنجره در کش (مثلاً توسط دستور warm_availability).
+    scope (خط، نسخه) باید پیش از خواندن داده‌های محاسبه گرفته شده باشد؛ وگرنه تغییری که در
+    فاصله محاسبه رخ داده زیر کلید جدید با نقشه کهنه نوشته می‌شود.
+    """
+    lane, version = scope or slots_scope(services, device_id)
+    cache.set(_format_slots_key(lane, version, services, gender, start_date, end_date), slots_map, SLOTS_CACHE_TIMEOUT)
+
+
+def get_cached_slots(
+    start_date: date,
+    end_date: date,
+    service_ids: List[str],
+    device_id: Union[int, str, None],
+    patient_user: Union[CustomUser, None] = None,
+    gender_param: str = None,
+    compute: Callable[..., Dict[str, List[Dict]]] = generate_available_slots_for_range,
+) -> Dict[str, List[Dict]]:
+    """
+    لایه کش دور تابع محاسبه اسلات‌ها (پیش‌فرض generate_available_slots_for_range).
+    خروجی و پارامترها همان تابع محاسبه است. در صورت نبود کش، درخواست‌های هم‌زمان
+    یکسان فقط یک بار محاسبه می‌شوند (_single_flight).
+    """
+    services = list(Service.objects.select_related('group').filter(id__in=service_ids).order_by('pk'))
+    if not services:
+        return {}
+    service = services[0]
+    if service.group.has_devices and not device_id:
+        return {}
+    gender = resolve_target_gender(patient_user, gender_param)
+
+    cache_key = _slots_cache_key(services, device_id, gender, start_date, end_date)
+    slots_map = cache.get(cache_key)
+    if slots_map is None:
+        slots_map = _single_flight(cache_key, lambda: compute(
+            start_date=start_date,
+            end_date=end_date,
+            service_ids=[str(s.id) for s in services],
+            device_id=device_id,
+            gender_param=gender,
+        ))
+    return drop_elapsed_slots(slots_map)
+
+
+async def _asingle_flight(cache_key: str, compute: Callable[[], Awaitable[Dict[str, List[Dict]]]]) -> Dict[str, List[Dict]]:
+    """نسخه async از _single_flight؛ انتظار با asyncio.sleep انجام می‌شود و event loop را نگه نمی‌دارد."""
+    lock_key = f"{cache_key}:lock"
+    if not await cache.aadd(lock_key, 1, SINGLE_FLIGHT_LOCK_TIMEOUT):
+        deadline = time.monotonic() + SINGLE_FLIGHT_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(SINGLE_FLIGHT_POLL_SECONDS)
+            slots_map = await cache.aget(cache_key)
+            if slots_map is not None:
+                return slots_map
+            if await cache.aget(lock_key) is None:
+                break
+        slots_map = await compute()
+        await cache.aset(cache_key, slots_map, SLOTS_CACHE_TIMEOUT)
+        return slots_map
+
+    try:
+        slots_map = await compute()
+        await cache.aset(cache_key, slots_map, SLOTS_CACHE_TIMEOUT)
+        return slots_map
+    finally:
+        await cache.adelete(lock_key)
+
+
+async def aget_cached_slots(
+    start_date: date,
+    end_date: date,
+    service_ids: List[str],
+    device_id: Union[int, str, None],
+    patient_user: Union[CustomUser, None] = None,
+    gender_param: str = None,
+) -> Dict[str, List[Dict]]:
+    """
+    نسخه async از get_cached_slots روی agenerate_available_slots_for_range.
+    کلید کش با مسیر sync یکی است، پس دو مسیر نتیجه‌های یکدیگر را استفاده می‌کنند.
+    حالت «هر دستگاهی» (نسخه ترکیبی چند خط) از مسیر sync در یک thread اجرا می‌شود.
+    """
+    if device_id == ANY_DEVICE:
+        return await sync_to_async(get_cached_slots)(
+            start_date, end_date, service_ids, device_id, patient_user, gender_param
+        )
+    services = [
+        s async for s in Service.objects.select_related('group').filter(id__in=service_ids).order_by('pk')
+    ]
+    if not services:
+        return {}
+    service = services[0]
+    if service.group.has_devices and not device_id:
+        return {}
+    gender = resolve_target_gender(patient_user, gender_param)
+
+    lane_device_id = device_id if service.group.has_devices else None
+    lane = lane_key(lane_device_id)
+    holds = (await alanes_holds([lane_device_id]))[lane_device_id]
+    version = f"{await _acurrent_version(_version_key(lane))}h{holds_version(holds)}"
+    cache_key = _format_slots_key(lane, version, services, gender, start_date, end_date)
+    slots_map = await cache.aget(cache_key)
+    if slots_map is None:
+        slots_map = await _asingle_flight(cache_key, lambda: agenerate_available_slots_for_range(
+            start_date=start_date,
+            end_date=end_date,
+            service_ids=[str(s.id) for s in services],
+            device_id=device_id,
+            gender_param=gender,
+        ))
+    return drop_elapsed_slots(slots_map)
@@ -0,0 +1,196 @@
+# booking/slot_engines.py
+"""
+موتورهای جاروب اسلات (Slot Sweep Engines).
+ورودی هر موتور لیستی از «برنامه روز» است: (تاریخ، شیفت‌ها به دقیقه، بیت‌مپ اشغال، دقایق سپری‌شده)
+و خروجی برای هر روز لیست دقیقه‌های شروع اسلات‌های آزاد است (با گام step، پیش‌فرض برابر مدت). ساخت برچسب‌ها و دسترسی به
+دیتابیس بیرون از این ماژول (calendar_logic) انجام می‌شود.
+
+- python: حلقه مرجع (پیش‌فرض).
+- numpy: نسخه برداری‌شده برای بازه‌های طولانی؛ خروجی آن باید دقیقاً با مرجع یکسان باشد.
+انتخاب موتور بر اساس تنظیم BOOKING_SLOT_ENGINE در calendar_logic (آداپتور ORM) انجام می‌شود.
+این ماژول و هسته آن (SlotJob و run_slot_job) هیچ وابستگی به Django ندارد و در ProcessPoolExecutor قابل اجراست.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .bitmaps import MINUTES_PER_DAY, bitmap_runs, busy_run_end, minute_mask
+
+
+class DayPlan(NamedTuple):
+    day: date
+    shifts: Tuple[Tuple[int, int], ...]
+    bitmap: int
+    elapsed_minutes: float
+    # فقط اشغال نوبت‌های ثبت‌شده (بدون نگه‌داشت، تعطیلی و ماسک منابع) برای چینش فشرده
+    booked: int = 0
+
+
+FreeSlots = List[Tuple[date, List[int]]]
+
+
+def python_free_slots(plans: List[DayPlan], duration: int, step: Optional[int] = None) -> FreeSlots:
+    """
+    موتور مرجع: جاروب شبکه اسلات هر شیفت با تست ماسک بیتی و پرش از بلوک‌های اشغال.
+    شروع اسلات‌ها هر step دقیقه یک بار است (پیش‌فرض: برابر مدت).
+    """
+    step = step or duration
+    result = []
+    for plan in plans:
+        bitmap = plan.bitmap
+        starts = []
+        for shift_start_minute, shift_end_minute in plan.shifts:
+            slot_minute = shift_start_minute
+            while True:
+                slot_end_minute = slot_minute + duration
+                if slot_end_minute > shift_end_minute: break
+                if slot_end_minute <= plan.elapsed_minutes:
+                    slot_minute += step
+                    continue
+
+                busy = bitmap & minute_mask(slot_minute, slot_end_minute)
+                if busy:
+                    # تمام اسلات‌های شبکه که قبل از پایان این بلوک شروع شوند با آن تداخل دارند؛
+                    # پس مستقیماً به اولین اسلات بعد از بلوک می‌پریم.
+                    block_end = busy_run_end(bitmap, busy.bit_length() - 1)
+                    steps = -(-(block_end - slot_minute) // step)
+                    slot_minute += step * max(steps, 1)
+                    continue
+
+                starts.append(slot_minute)
+                slot_minute += step
+        if starts:
+            result.append((plan.day, starts))
+    return result
+
+
+def numpy_free_slots(plans: List[DayPlan], duration: int, step: Optional[int] = None) -> FreeSlots:
+    """
+    موتور برداری: تمام شیفت‌ها و رزروهای کل بازه به دقیقه از ابتدای بازه (epoch minutes)
+    تبدیل می‌شوند، اسلات‌های کاندید با arange ساخته و تداخل‌ها با searchsorted رد می‌شوند.
+    """
+    import numpy as np
+
+    if not plans:
+        return []
+    step = step or duration
+
+    shift_bases, shift_counts, shift_days = [], [], []
+    busy_starts, busy_ends = [], []
+    elapsed = np.empty(len(plans), dtype=np.float64)
+    for index, plan in enumerate(plans):
+        offset = index * MINUTES_PER_DAY
+        elapsed[index] = plan.elapsed_minutes
+        for shift_start_minute, shift_end_minute in plan.shifts:
+            shift_length = shift_end_minute - shift_start_minute
+            count = (shift_length - duration) // step + 1 if shift_length >= duration else 0
+            if count > 0:
+                shift_bases.append(offset + shift_start_minute)
+                shift_counts.append(count)
+                shift_days.append(index)
+        for run_start, run_end in bitmap_runs(plan.bitmap):
+            busy_starts.append(offset + run_start)
+            busy_ends.append(offset + run_end)
+
+    if not shift_bases:
+        return []
+
+    counts = np.asarray(shift_counts, dtype=np.int64)
+    total = int(counts.sum())
+    first_index = np.repeat(np.cumsum(counts) - counts, counts)
+    starts = np.repeat(np.asarray(shift_bases, dtype=np.int64), counts) + (np.arange(total) - first_index) * step
+    ends = starts + duration
+    day_index = np.repeat(np.asarray(shift_days, dtype=np.int64), counts)
+
+    # اسلات‌هایی که پایانشان گذشته است
+    keep = (ends - day_index * MINUTES_PER_DAY) > elapsed[day_index]
+
+    if busy_starts:
+        # بلوک‌های اشغال مرتب و مجزا هستند: اولین بلوکی که پایانش بعد از شروع اسلات است
+        b_starts = np.asarray(busy_starts, dtype=np.int64)
+        b_ends = np.asarray(busy_ends, dtype=np.int64)
+        idx = np.searchsorted(b_ends, starts, side='right')
+        has_next = idx < len(b_starts)
+        overlaps = np.zeros(total, dtype=bool)
+        overlaps[has_next] = b_starts[idx[has_next]] < ends[has_next]
+        keep &= ~overlaps
+
+    result = []
+    kept_days = day_index[keep]
+    kept_minutes = (starts - day_index * MINUTES_PER_DAY)[keep]
+    if not len(kept_days):
+        return result
+    boundaries = np.flatnonzero(np.diff(kept_days)) + 1
+    for day_group, minute_group in zip(np.split(kept_days, boundaries), np.split(kept_minutes, boundaries)):
+        result.append((plans[int(day_group[0])].day, minute_group.tolist()))
+    return result
+
+
+def best_fit_split(plan: DayPlan, starts: List[int], duration: int) -> Tuple[List[int], List[int]]:
+    """
+    تفکیک اسلات‌ها به چسبیده (به یک نوبت ثبت‌شده یا ابتدا/انتهای شیفت) و بقیه.
+    مجاورت فقط با بیت‌مپ نوبت‌ها (plan.booked) سنجیده می‌شود، نه نگه‌داشت‌ها، تعطیلی‌ها یا منابع.
+    """
+    shift_starts = {shift_start for shift_start, _ in plan.shifts}
+    shift_ends = {shift_end for _, shift_end in plan.shifts}
+    booked = plan.booked
+    packed, rest = [], []
+    for slot_minute in starts:
+        if (slot_minute in shift_starts
+                or slot_minute + duration in shift_ends
+                or (slot_minute > 0 and (booked >> (slot_minute - 1)) & 1)
+                or (slot_minute + duration < MINUTES_PER_DAY and (booked >> (slot_minute + duration)) & 1)):
+            packed.append(slot_minute)
+        else:
+            rest.append(slot_minute)
+    return packed, rest
+
+
+def best_fit_order(plan: DayPlan, starts: List[int], duration: int) -> List[int]:
+    """
+    حالت چینش فشرده: اسلات‌های چسبیده اول پیشنهاد می‌شوند تا فاصله‌های کوچک بلااستفاده
+    بین نوبت‌ها ایجاد نشود؛ بقیه اسلات‌های آزاد حذف نمی‌شوند و بعد از آن‌ها می‌آیند.
+    """
+    packed, rest = best_fit_split(plan, starts, duration)
+    return packed + rest
+
+
+SLOT_ENGINES: Dict[str, Callable[..., FreeSlots]] = {
+    'python': python_free_slots,
+    'numpy': numpy_free_slots,
+}
+
+
+class SlotJob(NamedTuple):
+    """
+    ورودی کامل و مستقل از ORM محاسبه اسلات‌های آزاد یک خط.
+    فقط شامل داده‌های ساده است تا بتوان آن را به ProcessPoolExecutor فرستاد.
+    """
+    lane: str
+    plans: Tuple[DayPlan, ...]
+    duration: int
+    step: int
+    best_fit: bool = False
+    engine: str = 'python'
+
+
+def run_slot_job(job: SlotJob) -> FreeSlots:
+    """هسته خالص موتور: جاروب شبکه اسلات‌ها و در صورت نیاز ترتیب چینش فشرده."""
+    free = SLOT_ENGINES[job.engine](list(job.plans), job.duration, job.step)
+    if not job.best_fit:
+        return free
+    plans_by_day = {plan.day: plan for plan in job.plans}
+    return [(day, best_fit_order(plans_by_day[day], starts, job.duration)) for day, starts in free]
+
+
+def run_slot_jobs(jobs: Iterable[SlotJob], max_workers: Optional[int] = None) -> List[FreeSlots]:
+    """
+    اجرای موازی چند SlotJob (مثلاً تمام خطوط یک گروه) در ProcessPoolExecutor.
+    با max_workers=1 یا یک کار، بدون ساخت پروسه و به ترتیب اجرا می‌شود. ترتیب خروجی با ورودی یکسان است.
+    """
+    jobs = list(jobs)
+    if len(jobs) < 2 or max_workers == 1:
+        return [run_slot_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run_slot_job, jobs))
@@ -1,10 +1,42 @@
 # booking/tests.py
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
 from django.utils import timezone
-from datetime import timedelta
+import importlib.util
+import io
+import json
+import random
+import tempfile
+from unittest import mock, skipUnless
+from datetime import date, datetime, time, timedelta
+import jdatetime
 from users.models import CustomUser
-from clinic.models import Service, ServiceGroup
-from .models import Appointment
+from clinic.models import Closure, Device, Resource, ResourceWorkHours, Service, ServiceGroup, WorkHours
+from .models import Appointment, AvailabilityDay
+from .intervals import intersect_intervals, saturated_intervals, subtract_intervals
+from .closures import closed_lanes
+from .feed import current_cursor, format_cursor, lane_changes, publish_lane_days
+from .holds import HOLD_SECONDS, held_by_others, place_hold
+from .lanes import ANY_DEVICE
+from .calendar_logic import (
+    PERSIAN_MONTHS, PERSIAN_WEEKDAYS, generate_available_slots_for_range, localize_digits,
+    first_available_by_service, next_available_slots, precompute_lane_slots, slot_engine_name
+)
+from .availability import get_available_slots, jalali_key
+from .api_views import MAX_WINDOW_DAYS, month_windows
+from .slot_cache import _slots_cache_key, get_cached_slots
+from .schedule import get_weekly_schedule
+from .slot_engines import DayPlan, SlotJob, numpy_free_slots, python_free_slots, run_slot_job, run_slot_jobs
+from .bitmaps import busy_run_end, minute_mask
+from .occupancy import get_day_bitmaps
+
+
+async def _read_stream(response) -> bytes:
+    return b''.join([chunk async for chunk in response.streaming_content])
+
 
 class AppointmentModelTest(TestCase):
     def setUp(self):
@@ -35,4 +67,770 @@ class AppointmentModelTest(TestCase):
         
         self.assertEqual(appointment.patient.username, 'testpatient')
         self.assertEqual(appointment.status, 'PENDING')
-        self.assertIn('Laser', appointment.get_services_display())
\ No newline at end of file
+        self.assertIn('Laser', appointment.get_services_display())
+
+class IntervalsTest(SimpleTestCase):
+    def test_saturated_intervals_sweep(self):
+        """فقط بازه‌هایی که به ظرفیت هم‌زمان رسیده‌اند برمی‌گردند؛ بازه‌های چسبیده هم‌پوشان نیستند"""
+        intervals = [(0, 30), (10, 40), (30, 60), (20, 25)]
+        self.assertEqual(saturated_intervals(intervals, 1), [(0, 60)])
+        self.assertEqual(saturated_intervals(intervals, 2), [(10, 40)])
+        self.assertEqual(saturated_intervals(intervals, 3), [(20, 25)])
+        self.assertEqual(saturated_intervals([(0, 30), (30, 60)], 2), [])
+
+    def test_linear_intersect_and_subtract(self):
+        self.assertEqual(intersect_intervals([(0, 10), (20, 30)], [(5, 25), (28, 40)]), [(5, 10), (20, 25), (28, 30)])
+        self.assertEqual(
+            subtract_intervals([(0, 100), (200, 300)], [(10, 20), (90, 210), (290, 400)]),
+            [(0, 10), (20, 90), (210, 290)],
+        )
+
+
+class OccupancyBitmapTest(TestCase):
+    def test_mask_and_run_end(self):
+        bitmap = minute_mask(600, 660) | minute_mask(700, 720)
+        self.assertTrue(bitmap & minute_mask(650, 680))
+        self.assertFalse(bitmap & minute_mask(660, 700))
+        self.assertEqual(busy_run_end(bitmap, 610), 660)
+        self.assertEqual(busy_run_end(bitmap, 700), 720)
+
+
+
+
+class SlotEngineParityTest(TestCase):
+    @skipUnless(importlib.util.find_spec('numpy'), "numpy نصب نیست")
+    def test_numpy_engine_matches_reference(self):
+        """موتور numpy باید دقیقاً همان خروجی حلقه مرجع پایتون را بدهد"""
+        rng = random.Random(42)
+        plans = []
+        for i in range(60):
+            bitmap = 0
+            for _ in range(rng.randint(0, 12)):
+                start = rng.randint(480, 1320)
+                bitmap |= minute_mask(start, start + rng.choice([15, 30, 45, 60, 90]))
+            plans.append(DayPlan(
+                day=date(2030, 1, 1) + timedelta(days=i),
+                shifts=((540, 780), (840, 1080), (1100, 1300)),
+                bitmap=bitmap,
+                elapsed_minutes=rng.choice([-600.0, 700.5]) if i == 0 else -i * 1440.0,
+            ))
+        for duration, step in ((20, None), (30, None), (45, None), (75, None), (30, 10), (45, 15), (60, 20)):
+            self.assertEqual(numpy_free_slots(plans, duration, step), python_free_slots(plans, duration, step))
+
+    def test_unknown_engine_falls_back_to_reference(self):
+        """انتخاب موتور از تنظیمات در calendar_logic است؛ نام ناشناخته به موتور مرجع برمی‌گردد"""
+        with override_settings(BOOKING_SLOT_ENGINE='fortran'):
+            self.assertEqual(slot_engine_name(), 'python')
+
+class SlotJobTest(SimpleTestCase):
+    """هسته موتور بدون دیتابیس تست می‌شود"""
+
+    def _job(self, lane, bitmap, booked=None):
+        plan = DayPlan(day=date(2030, 1, 5), shifts=((600, 720),), bitmap=bitmap, elapsed_minutes=-1.0,
+                       booked=bitmap if booked is None else booked)
+        return SlotJob(lane=lane, plans=(plan,), duration=30, step=15)
+
+    def test_process_pool_matches_sequential_run(self):
+        jobs = [self._job('device-1', minute_mask(600, 615)), self._job('device-2', 0)]
+        self.assertEqual(run_slot_jobs(jobs, max_workers=2), [run_slot_job(job) for job in jobs])
+        self.assertEqual(run_slot_job(jobs[0]), [(date(2030, 1, 5), [615, 630, 645, 660, 675, 690])])
+        self.assertEqual(
+            run_slot_job(jobs[0]._replace(best_fit=True)), [(date(2030, 1, 5), [615, 690, 630, 645, 660, 675])]
+        )
+
+    def test_best_fit_adjacency_ignores_holds(self):
+        """بازه نگه‌داشته‌شده (فقط در bitmap) اسلات کناری را چسبیده حساب نمی‌کند"""
+        job = self._job('device-1', minute_mask(600, 615), booked=0)._replace(best_fit=True)
+        self.assertEqual(run_slot_job(job), [(date(2030, 1, 5), [690, 615, 630, 645, 660, 675])])
+
+class WeeklyScheduleTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = ServiceGroup.objects.create(name='Laser')
+        self.service = Service.objects.create(group=self.group, name='Full body', duration=60, price=900000)
+        WorkHours.objects.create(service_group=self.group, day_of_week=0, start_time=time(9, 0), end_time=time(13, 0))
+
+    def test_service_hours_take_precedence_and_merge(self):
+        """ساعات اختصاصی خدمت بر گروه مقدم است و شیفت‌های هم‌پوشان ادغام می‌شوند"""
+        self.assertEqual(get_weekly_schedule(self.service, 'FEMALE').shifts(0), ((540, 780),))
+
+        WorkHours.objects.create(service=self.service, day_of_week=0, start_time=time(10, 0), end_time=time(12, 0))
+        WorkHours.objects.create(service=self.service, day_of_week=0, start_time=time(11, 0), end_time=time(14, 0))
+        WorkHours.objects.create(service=self.service, day_of_week=0, start_time=time(16, 0), end_time=time(18, 0),
+                                 gender_specific='MALE')
+        schedule = get_weekly_schedule(self.service, 'FEMALE')
+        self.assertEqual(schedule.shifts(0), ((600, 840),))
+        self.assertEqual(get_weekly_schedule(self.service, 'MALE').shifts(0), ((600, 840), (960, 1080)))
+
+class SlotGenerationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = ServiceGroup.objects.create(name='Skin')
+        self.service = Service.objects.create(
+            group=self.group,
+            name='Facial',
+            duration=30,
+            price=300000
+        )
+        # یک روز مشخص در آینده با شیفت ۱۰ تا ۱۲
+        self.day = timezone.localdate() + timedelta(days=7)
+        WorkHours.objects.create(
+            service_group=self.group,
+            day_of_week=(self.day.weekday() + 2) % 7,
+            start_time=time(10, 0),
+            end_time=time(12, 0),
+        )
+
+    def _book(self, start_hour, start_minute, minutes):
+        start = timezone.make_aware(datetime.combine(self.day, time(start_hour, start_minute)))
+        return Appointment.objects.create(
+            start_time=start,
+            end_time=start + timedelta(minutes=minutes),
+            status='CONFIRMED',
+        )
+
+    def _slot_starts(self):
+        slots_map = generate_available_slots_for_range(
+            self.day, self.day, [str(self.service.id)], None, gender_param='FEMALE'
+        )
+        return [
+            timezone.localtime(datetime.fromisoformat(slot['start'])).strftime('%H:%M')
+            for slots in slots_map.values() for slot in slots
+        ]
+
+    def test_free_day_yields_full_grid(self):
+        self.assertEqual(self._slot_starts(), ['10:00', '10:30', '11:00', '11:30'])
+
+    def test_booked_block_is_skipped(self):
+        """اسلات‌های هم‌پوشان با نوبت‌های ثبت‌شده حذف می‌شوند"""
+        self._book(10, 15, 60)
+        self.assertEqual(self._slot_starts(), ['11:30'])
+
+    def test_bitmap_follows_appointment_status(self):
+        """لغو نوبت باید بیت‌مپ کش‌شده روز را به‌روز کند"""
+        appointment = self._book(10, 0, 30)
+        self.assertEqual(self._slot_starts(), ['10:30', '11:00', '11:30'])
+        self.assertTrue(get_day_bitmaps(None, self.day, self.day)[self.day])
+
+        appointment.status = 'CANCELED'
+        appointment.save(update_fields=['status'])
+        self.assertEqual(self._slot_starts(), ['10:00', '10:30', '11:00', '11:30'])
+
+    def test_materialized_rows_are_patched(self):
+        """ردیف روز در جدول مادی‌شده بعد از ثبت نوبت فقط برای همان روز اصلاح می‌شود"""
+        service_ids = [str(self.service.id)]
+        first = get_available_slots(self.day, self.day, service_ids, None, gender_param='FEMALE')
+        self.assertEqual(len(next(iter(first.values()))), 4)
+        self.assertEqual(AvailabilityDay.objects.filter(date=self.day).count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._book(11, 0, 30)
+        row = AvailabilityDay.objects.get(date=self.day)
+        self.assertEqual(len(row.slots), 3)
+        second = get_available_slots(self.day, self.day, service_ids, None, gender_param='FEMALE')
+        self.assertEqual(len(next(iter(second.values()))), 3)
+
+
+    def test_no_device_rows_are_unique(self):
+        """درج هم‌زمان ردیف خط بدون دستگاه (device خالی) ردیف تکراری نمی‌سازد"""
+        service_ids = [str(self.service.id)]
+        get_available_slots(self.day, self.day, service_ids, None, gender_param='FEMALE')
+        row = AvailabilityDay.objects.get(date=self.day)
+        row.pk = None
+        AvailabilityDay.objects.bulk_create([row], ignore_conflicts=True)
+        self.assertEqual(AvailabilityDay.objects.filter(date=self.day, device__isnull=True).count(), 1)
+
+    def test_booking_during_row_computation_is_not_lost(self):
+        """نوبتی که بین محاسبه و درج ردیف commit می‌شود، در ردیف ذخیره‌شده اعمال می‌شود"""
+        from . import availability
+        compute_rows = availability._compute_rows
+        raced = []
+
+        def racing_compute(*args):
+            rows = compute_rows(*args)
+            if not raced:
+                raced.append(True)
+                with self.captureOnCommitCallbacks(execute=True):
+                    self._book(10, 0, 30)
+            return rows
+
+        service_ids = [str(self.service.id)]
+        ten = timezone.make_aware(datetime.combine(self.day, time(10, 0))).isoformat()
+        with mock.patch('booking.availability._compute_rows', side_effect=racing_compute):
+            get_available_slots(self.day, self.day, service_ids, None, gender_param='FEMALE')
+        slots = get_available_slots(self.day, self.day, service_ids, None, gender_param='FEMALE')
+        self.assertNotIn(ten, [slot['start'] for slot in slots[jalali_key(self.day)]])
+
+    def test_service_changes_discard_materialized_rows(self):
+        """تغییر مدت خدمت یا ساعات اختصاصی آن در هر روز هفته، ردیف‌های آینده خدمت را از نو می‌سازد"""
+        service_ids = [str(self.service.id)]
+        get_available_slots(self.day, self.day, service_ids, None, gender_param='FEMALE')
+        self.service.duration = 60
+        self.service.save()
+        self.assertFalse(AvailabilityDay.objects.filter(service=self.service).exists())
+        slots = get_available_slots(self.day, self.day, service_ids, None, gender_param='FEMALE')
+        self.assertEqual(len(slots[jalali_key(self.day)]), 2)
+
+        # ساعات اختصاصی در روز دیگری از هفته، ساعات گروه را برای تمام هفته کنار می‌گذارد
+        WorkHours.objects.create(
+            service=self.service,
+            day_of_week=(self.day.weekday() + 3) % 7,
+            start_time=time(10, 0),
+            end_time=time(12, 0),
+        )
+        slots = get_available_slots(self.day, self.day, service_ids, None, gender_param='FEMALE')
+        self.assertEqual(slots.get(jalali_key(self.day), []), [])
+
+    def test_versioned_cache_hit_and_lane_invalidation(self):
+        """درخواست تکراری از کش خوانده می‌شود و ثبت نوبت فقط نسخه همان خط را عوض می‌کند"""
+        service_ids = [str(self.service.id)]
+        first = get_cached_slots(self.day, self.day, service_ids, None, gender_param='FEMALE')
+        with self.assertNumQueries(1):
+            self.assertEqual(get_cached_slots(self.day, self.day, service_ids, None, gender_param='FEMALE'), first)
+
+        self._book(10, 0, 30)
+        after = get_cached_slots(self.day, self.day, service_ids, None, gender_param='FEMALE')
+        self.assertEqual(len(next(iter(after.values()))), 3)
+
+    def test_precomputed_labels_match_jdatetime(self):
+        """برچسب‌های از پیش ساخته‌شده با خروجی مستقیم jdatetime یکسان است"""
+        slots_map = generate_available_slots_for_range(
+            self.day, self.day, [str(self.service.id)], None, gender_param='FEMALE'
+        )
+        slot_start = timezone.make_aware(datetime.combine(self.day, time(10, 30)))
+        j_start = jdatetime.datetime.fromgregorian(datetime=slot_start)
+        slot = slots_map[j_start.strftime('%Y-%m-%d')][1]
+        self.assertEqual(slot['start'], slot_start.isoformat())
+        self.assertEqual(slot['end'], (slot_start + timedelta(minutes=30)).isoformat())
+        self.assertEqual(slot['readable_start'], "{} {} {}، ساعت {}".format(
+            PERSIAN_WEEKDAYS[j_start.weekday()],
+            localize_digits(j_start.day),
+            PERSIAN_MONTHS[j_start.month - 1],
+            localize_digits(j_start.strftime('%H:%M'))
+        ))
+
+    def test_next_available_stops_at_limit(self):
+        """نزدیک‌ترین اسلات‌ها به ترتیب و فقط به تعداد limit برگردانده می‌شوند"""
+        self._book(10, 0, 30)
+        slots = next_available_slots(
+            [str(self.service.id)], None, gender_param='FEMALE', limit=2, from_date=self.day
+        )
+        self.assertEqual(
+            [timezone.localtime(datetime.fromisoformat(slot['start'])).strftime('%H:%M') for slot in slots],
+            ['10:30', '11:00']
+        )
+        self.assertEqual(slots[0]['date'], jalali_key(self.day))
+
+    def test_slot_step_and_best_fit(self):
+        """گام گروه فاصله‌های کوچک را قابل رزرو می‌کند و چینش فشرده اسلات‌های چسبیده را اول پیشنهاد می‌دهد"""
+        self.group.slot_step = 15
+        self.group.save()
+        self._book(10, 0, 15)
+        self.assertEqual(self._slot_starts(), ['10:15', '10:30', '10:45', '11:00', '11:15', '11:30'])
+
+        self.group.best_fit_slots = True
+        self.group.save()
+        self.assertEqual(self._slot_starts(), ['10:15', '11:30', '10:30', '10:45', '11:00', '11:15'])
+
+    def test_precompute_matches_generator(self):
+        """پیش‌محاسبه خطوط با همان نتیجه مولد اسلات‌ها برای خط بدون دستگاه"""
+        self._book(11, 0, 30)
+        precomputed = precompute_lane_slots([str(self.service.id)], self.day, self.day, gender_param='FEMALE')
+        self.assertEqual(
+            precomputed,
+            {None: generate_available_slots_for_range(self.day, self.day, [str(self.service.id)], None)}
+        )
+
+    def test_warm_availability_fills_slot_cache(self):
+        """بعد از گرم کردن، API پنجره ماهانه را بدون محاسبه مجدد از کش می‌خواند"""
+        self._book(10, 0, 30)
+        call_command('warm_availability', days=10, workers=1, stdout=io.StringIO())
+
+        window_start, window_end = next(
+            (start, end) for start, end in month_windows(timezone.localdate(), timezone.localdate() + timedelta(days=9))
+            if start <= self.day <= end
+        )
+        compute = mock.Mock(return_value={})
+        slots_map = get_cached_slots(
+            window_start, window_end, [str(self.service.id)], None, gender_param='FEMALE', compute=compute
+        )
+        compute.assert_not_called()
+        self.assertEqual(
+            [slot['start'] for slot in slots_map[jalali_key(self.day)]],
+            [slot['start'] for slot in generate_available_slots_for_range(
+                self.day, self.day, [str(self.service.id)], None)[jalali_key(self.day)]]
+        )
+
+    def test_warm_availability_ignores_bookings_made_during_sweep(self):
+        """نوبتی که در میانه جاروب ثبت می‌شود نباید نقشه کهنه را زیر نسخه جدید خط در کش بنشاند"""
+        from booking.management.commands import warm_availability
+
+        def sweep_with_booking(jobs, workers=None):
+            results = run_slot_jobs(jobs, workers)
+            self._book(10, 0, 30)
+            return results
+
+        with mock.patch.object(warm_availability, 'run_slot_jobs', side_effect=sweep_with_booking):
+            call_command('warm_availability', days=10, workers=1, stdout=io.StringIO())
+
+        window_start, window_end = next(
+            (start, end) for start, end in month_windows(timezone.localdate(), timezone.localdate() + timedelta(days=9))
+            if start <= self.day <= end
+        )
+        slots_map = get_cached_slots(window_start, window_end, [str(self.service.id)], None, gender_param='FEMALE')
+        self.assertNotIn('10:00', [
+            timezone.localtime(datetime.fromisoformat(slot['start'])).strftime('%H:%M')
+            for slot in slots_map[jalali_key(self.day)]
+        ])
+
+    def test_benchmark_slots_rolls_back_and_compares_baseline(self):
+        """بنچمارک داده مصنوعی را برمی‌گرداند و اجرای دوم با baseline ذخیره‌شده مقایسه می‌شود"""
+        appointments = Appointment.objects.count()
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline = f'{tmp}/baseline.json'
+            options = dict(devices=[2], horizons=[3], max_appointments=5, repeat=1, baseline=baseline)
+            call_command('benchmark_slots', save_baseline=True, stdout=io.StringIO(), **options)
+            with open(baseline, encoding='utf-8') as f:
+                results = json.load(f)['results']
+            self.assertEqual(set(results), {'devices=2 horizon=3 mode=device', 'devices=2 horizon=3 mode=any'})
+            self.assertGreater(results['devices=2 horizon=3 mode=any']['queries'], 0)
+
+            out = io.StringIO()
+            call_command('benchmark_slots', tolerance=100, stdout=out, **options)
+            self.assertIn('کوئری +0', out.getvalue())
+        self.assertEqual(Appointment.objects.count(), appointments)
+        self.assertFalse(ServiceGroup.objects.filter(name__startswith='Benchmark').exists())
+
+    def test_any_device_assigns_free_device(self):
+        """در حالت «هر دستگاهی» هر اسلات به اولین دستگاه آزاد نسبت داده می‌شود"""
+        first, second = Device.objects.create(name='Laser A'), Device.objects.create(name='Laser B')
+        self.group.has_devices = True
+        self.group.save()
+        self.group.available_devices.add(first, second)
+        start = timezone.make_aware(datetime.combine(self.day, time(10, 0)))
+        Appointment.objects.create(
+            start_time=start, end_time=start + timedelta(minutes=60),
+            status='CONFIRMED', selected_device=first,
+        )
+        slots_map = generate_available_slots_for_range(
+            self.day, self.day, [str(self.service.id)], ANY_DEVICE, gender_param='FEMALE'
+        )
+        assigned = {
+            timezone.localtime(datetime.fromisoformat(slot['start'])).strftime('%H:%M'): slot['device_id']
+            for slots in slots_map.values() for slot in slots
+        }
+        self.assertEqual(assigned, {
+            '10:00': second.id, '10:30': second.id, '11:00': first.id, '11:30': first.id,
+        })
+
+    def test_closures_skip_days_and_hours(self):
+        """تعطیلی ساعتی گروه ساعات بسته را حذف می‌کند و تعطیلی کل روز کلینیک روز را کنار می‌گذارد"""
+        service_ids = [str(self.service.id)]
+        self.assertEqual(len(get_available_slots(self.day, self.day, service_ids, None)[jalali_key(self.day)]), 4)
+
+        Closure.objects.create(title='Maintenance', start_date=self.day, end_date=self.day,
+                               start_time=time(10, 15), end_time=time(11, 0), service_group=self.group)
+        self.assertEqual(self._slot_starts(), ['11:00', '11:30'])
+        self.assertEqual(
+            [slot['start'] for slot in get_available_slots(self.day, self.day, service_ids, None)[jalali_key(self.day)]],
+            [slot['start'] for slot in generate_available_slots_for_range(self.day, self.day, service_ids, None)[jalali_key(self.day)]]
+        )
+
+        Closure.objects.create(title='Holiday', start_date=self.day - timedelta(days=1), end_date=self.day)
+        self.assertEqual(self._slot_starts(), [])
+        self.assertIsNone(first_available_by_service(
+            service_ids, gender_param='FEMALE', from_date=self.day, horizon_days=7)[self.service.id])
+
+    def test_device_downtime_excludes_device(self):
+        """دستگاه در حال سرویس در حالت «هر دستگاهی» و در ثبت نوبت کنار گذاشته می‌شود"""
+        first, second = Device.objects.create(name='Laser A'), Device.objects.create(name='Laser B')
+        self.group.has_devices = True
+        self.group.save()
+        self.group.available_devices.add(first, second)
+        Closure.objects.create(title='Service', start_date=self.day, end_date=self.day, device=second)
+
+        slots_map = generate_available_slots_for_range(
+            self.day, self.day, [str(self.service.id)], ANY_DEVICE, gender_param='FEMALE'
+        )
+        self.assertEqual({slot['device_id'] for slot in slots_map[jalali_key(self.day)]}, {first.id})
+        self.assertEqual(generate_available_slots_for_range(
+            self.day, self.day, [str(self.service.id)], second.id, gender_param='FEMALE'), {})
+
+        start = timezone.make_aware(datetime.combine(self.day, time(10, 0)))
+        self.assertEqual(closed_lanes(self.group.id, [first.id, second.id], start, start + timedelta(minutes=30)),
+                         {second.id})
+
+    def test_device_capacity_allows_parallel_bookings(self):
+        """دستگاه با ظرفیت ۲ تا دو نوبت هم‌زمان اسلات را نشان می‌دهد و ثبت نوبت سوم رد می‌شود"""
+        device = Device.objects.create(name='Laser', capacity=2)
+        self.group.has_devices = True
+        self.group.save()
+        self.group.available_devices.add(device)
+        slot = timezone.make_aware(datetime.combine(self.day, time(10, 0))).isoformat()
+        booking = {'services[]': [self.service.id], 'slot': slot, 'device_id': device.id,
+                   'guest_first_name': 'Sara', 'guest_last_name': 'Ahmadi', 'guest_phone': '09120000000'}
+
+        def device_starts():
+            slots_map = generate_available_slots_for_range(
+                self.day, self.day, [str(self.service.id)], device.id, gender_param='FEMALE'
+            )
+            return [slot['start'] for slot in slots_map.get(jalali_key(self.day), [])]
+
+        for expected_count in (1, 2, 2):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('booking:create_booking'), booking)
+            self.assertEqual(Appointment.objects.filter(selected_device=device).count(), expected_count)
+            self.assertEqual(slot in device_starts(), expected_count < 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            device.capacity = 3
+            device.save()
+        self.assertIn(slot, device_starts())
+
+    def test_holds_count_against_device_capacity(self):
+        """نگه‌داشت‌ها همراه نوبت‌ها تا ظرفیت دستگاه شمرده می‌شوند؛ یک نگه‌داشت دستگاه دوظرفیتی را پر نمی‌کند"""
+        device = Device.objects.create(name='Laser', capacity=2)
+        self.group.has_devices = True
+        self.group.save()
+        self.group.available_devices.add(device)
+        start = timezone.make_aware(datetime.combine(self.day, time(10, 0)))
+        end = start + timedelta(minutes=30)
+
+        def device_starts():
+            slots_map = generate_available_slots_for_range(
+                self.day, self.day, [str(self.service.id)], device.id, gender_param='FEMALE'
+            )
+            return [slot['start'] for slot in slots_map.get(jalali_key(self.day), [])]
+
+        self.assertIsNotNone(place_hold(device.id, start, end, 'first'))
+        self.assertIn(start.isoformat(), device_starts())
+        self.assertEqual(held_by_others([device.id], start, end, 'other'), set())
+
+        Appointment.objects.create(start_time=start, end_time=end, status='CONFIRMED', selected_device=device)
+        self.assertNotIn(start.isoformat(), device_starts())
+        self.assertEqual(held_by_others([device.id], start, end, 'other'), {device.id})
+        self.assertEqual(held_by_others([device.id], start, end, 'first'), set())
+        self.assertIsNone(place_hold(device.id, start, end, 'other'))
+
+    def test_shared_practitioner_limits_every_group(self):
+        """اسلات‌ها اشتراک ساعات حضور و زمان‌های آزاد پزشک مشترک است و نوبت یک گروه، گروه دیگر را هم می‌بندد"""
+        practitioner = Resource.objects.create(name='Dr. Karimi', kind=Resource.Kind.PRACTITIONER)
+        ResourceWorkHours.objects.create(
+            resource=practitioner, day_of_week=(self.day.weekday() + 2) % 7,
+            start_time=time(10, 0), end_time=time(11, 0),
+        )
+        self.group.required_resources.add(practitioner)
+        device = Device.objects.create(name='Laser')
+        laser_group = ServiceGroup.objects.create(name='Laser', has_devices=True)
+        laser_group.available_devices.add(device)
+        laser_group.required_resources.add(practitioner)
+        laser = Service.objects.create(group=laser_group, name='Laser', duration=30, price=400000)
+        WorkHours.objects.create(service_group=laser_group, day_of_week=(self.day.weekday() + 2) % 7,
+                                 start_time=time(10, 0), end_time=time(12, 0))
+
+        def cached_starts():
+            slots_map = get_cached_slots(self.day, self.day, [str(self.service.id)], None, gender_param='FEMALE',
+                                         compute=get_available_slots)
+            return [timezone.localtime(datetime.fromisoformat(slot['start'])).strftime('%H:%M')
+                    for slot in slots_map.get(jalali_key(self.day), [])]
+
+        self.assertEqual(cached_starts(), ['10:00', '10:30'])
+
+        slot = timezone.make_aware(datetime.combine(self.day, time(10, 0))).isoformat()
+        guest = {'slot': slot, 'guest_first_name': 'Sara', 'guest_last_name': 'Ahmadi', 'guest_phone': '09120000000'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('booking:create_booking'),
+                             {**guest, 'services[]': [laser.id], 'device_id': device.id})
+        appointment = Appointment.objects.get()
+        self.assertEqual(list(appointment.resources.all()), [practitioner])
+        self.assertEqual(cached_starts(), ['10:30'])
+
+        # پزشک مشغول است، پس خط بدون دستگاه هم در همین زمان نوبت نمی‌گیرد
+        self.client.post(reverse('booking:create_booking'), {**guest, 'services[]': [self.service.id]})
+        self.assertEqual(Appointment.objects.count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.status = 'CANCELED'
+            appointment.save(update_fields=['status'])
+        self.assertEqual(cached_starts(), ['10:00', '10:30'])
+
+    def test_batch_first_available_per_service(self):
+        """اولین اسلات آزاد چند خدمت با تعداد ثابتی کوئری محاسبه می‌شود"""
+        long_service = Service.objects.create(group=self.group, name='Peel', duration=60, price=500000)
+        empty_group = ServiceGroup.objects.create(name='Hair')
+        closed_service = Service.objects.create(group=empty_group, name='Cut', duration=30, price=100000)
+        self._book(10, 0, 30)
+
+        # خدمات، ساعات کاری، تعطیلی‌ها، پیکربندی منابع (کش سرد) و نوبت‌های تمام خطوط
+        with self.assertNumQueries(5):
+            first_slots = first_available_by_service(
+                [str(self.service.id), str(long_service.id), str(closed_service.id)],
+                gender_param='FEMALE', from_date=self.day,
+            )
+        starts = {
+            service_id: timezone.localtime(datetime.fromisoformat(slot['start'])).strftime('%H:%M')
+            for service_id, slot in first_slots.items() if slot
+        }
+        self.assertEqual(starts, {self.service.id: '10:30', long_service.id: '11:00'})
+        self.assertIsNone(first_slots[closed_service.id])
+        self.assertEqual(first_slots[self.service.id]['date'], jalali_key(self.day))
+
+    def test_compact_format_matches_full_format(self):
+        """قالب فشرده همان اسلات‌های قالب کامل را با دقیقه شروع و یک مدت مشترک می‌فرستد"""
+        self._book(10, 30, 30)
+        params = {
+            'service_ids[]': [self.service.id],
+            'from': jalali_key(self.day),
+            'to': jalali_key(self.day),
+        }
+        url = reverse('booking:all_available_slots')
+        full = self.client.get(url, params).json()
+        compact = self.client.get(url, params, HTTP_ACCEPT='application/vnd.booking.compact+json').json()
+
+        day = compact['days'][jalali_key(self.day)]
+        self.assertEqual(compact['duration'], 30)
+        self.assertEqual(day['starts'], [600, 660, 690])
+        self.assertEqual(day['date'], self.day.isoformat())
+        self.assertEqual(
+            [f"{day['date']}T{m // 60:02d}:{m % 60:02d}:00{day['tz']}" for m in day['starts']],
+            [slot['start'] for slot in full['slots'][jalali_key(self.day)]]
+        )
+        self.assertNotIn('slots', compact)
+
+    def test_concurrent_misses_wait_for_single_computation(self):
+        """وقتی پروسه دیگری قفل محاسبه را دارد، منتظر نتیجه او می‌ماند و خودش محاسبه نمی‌کند"""
+        services = [self.service]
+        cache_key = _slots_cache_key(services, None, 'FEMALE', self.day, self.day)
+        cache.add(f"{cache_key}:lock", 1)
+        computed = {jalali_key(self.day): [{'start': '2099-01-01T10:00:00+03:30', 'end': '2099-01-01T10:30:00+03:30'}]}
+        compute = mock.Mock(return_value={})
+
+        # پروسه صاحب قفل در حین انتظار نتیجه را می‌نویسد
+        with mock.patch('booking.slot_cache.time.sleep', side_effect=lambda _: cache.set(cache_key, computed)):
+            slots_map = get_cached_slots(
+                self.day, self.day, [str(self.service.id)], None, gender_param='FEMALE', compute=compute
+            )
+        compute.assert_not_called()
+        self.assertEqual(slots_map, computed)
+
+    def test_async_api_matches_sync_api(self):
+        """نسخه async همان پاسخ نسخه sync را برمی‌گرداند"""
+        self._book(10, 30, 30)
+        params = {'service_ids[]': [self.service.id], 'from': jalali_key(self.day), 'to': jalali_key(self.day)}
+        sync_data = self.client.get(reverse('booking:all_available_slots'), params).json()
+        cache.clear()
+        async_data = async_to_sync(self.async_client.get)(reverse('booking:all_available_slots_async'), params).json()
+        self.assertEqual(async_data, sync_data)
+        self.assertEqual(len(async_data['slots'][jalali_key(self.day)]), 3)
+
+    def test_slot_hold_blocks_others_until_booked(self):
+        """اسلات نگه‌داشته‌شده برای بقیه اشغال است، نگه‌دارنده می‌تواند رزرو کند و انقضا آن را آزاد می‌کند"""
+        service_ids = [str(self.service.id)]
+        slot = timezone.make_aware(datetime.combine(self.day, time(10, 0))).isoformat()
+
+        def cached_starts():
+            slots_map = get_cached_slots(self.day, self.day, service_ids, None, gender_param='FEMALE',
+                                         compute=get_available_slots)
+            return [s['start'] for s in slots_map[jalali_key(self.day)]]
+
+        self.assertEqual(len(cached_starts()), 4)
+        hold_url = reverse('booking:slot_hold')
+        held = self.client.post(hold_url, {'slot': slot, 'services[]': service_ids}).json()
+        self.assertEqual(held['status'], 'success')
+        self.assertNotIn(slot, cached_starts())
+        self.assertEqual(self.client_class().post(hold_url, {'slot': slot, 'services[]': service_ids}).status_code, 409)
+
+        booking = {'services[]': service_ids, 'slot': slot, 'guest_first_name': 'Sara',
+                   'guest_last_name': 'Ahmadi', 'guest_phone': '09120000000'}
+        self.client.post(reverse('booking:create_booking'), {**booking, 'hold_token': 'someone-else'})
+        self.assertFalse(Appointment.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('booking:create_booking'), {**booking, 'hold_token': held['token']})
+        self.assertEqual(Appointment.objects.count(), 1)
+
+        # نگه‌داشت بعد از ثبت آزاد شده و اسلات حالا به خاطر خود نوبت اشغال است
+        self.assertFalse(held_by_others([None], datetime.fromisoformat(slot),
+                                        datetime.fromisoformat(slot) + timedelta(minutes=30)))
+        second = timezone.make_aware(datetime.combine(self.day, time(11, 0)))
+        place_hold(None, second, second + timedelta(minutes=30), 'expiring')
+        self.assertNotIn(second.isoformat(), cached_starts())
+        with mock.patch('booking.holds.time.time', return_value=datetime.now().timestamp() + HOLD_SECONDS + 1):
+            self.assertEqual(held_by_others([None], second, second + timedelta(minutes=30)), set())
+
+    def test_slot_hold_accepts_only_offered_slots_one_per_session(self):
+        """فقط شروع اسلات‌های آزاد داخل افق پذیرفته می‌شود و هر session یک نگه‌داشت دارد"""
+        service_ids = [str(self.service.id)]
+        hold_url = reverse('booking:slot_hold')
+
+        def at(day, hour, minute):
+            return timezone.make_aware(datetime.combine(day, time(hour, minute))).isoformat()
+
+        for slot in (at(self.day, 10, 7), at(self.day, 13, 0), at(self.day + timedelta(days=3000), 10, 0)):
+            response = self.client.post(hold_url, {'slot': slot, 'services[]': service_ids})
+            self.assertIn(response.status_code, (400, 409))
+        self.assertEqual(held_by_others([None], *(datetime.fromisoformat(at(self.day, h, 0)) for h in (10, 12))),
+                         set())
+
+        first = self.client.post(hold_url, {'slot': at(self.day, 10, 0), 'services[]': service_ids}).json()
+        second = self.client.post(hold_url, {'slot': at(self.day, 11, 0), 'services[]': service_ids}).json()
+        self.assertEqual(first['token'], second['token'])
+        ten = datetime.fromisoformat(at(self.day, 10, 0))
+        self.assertEqual(held_by_others([None], ten, ten + timedelta(minutes=30)), set())
+        eleven = datetime.fromisoformat(at(self.day, 11, 0))
+        self.assertEqual(held_by_others([None], eleven, eleven + timedelta(minutes=30)), {None})
+
+    def test_rehold_with_same_token_refreshes_cached_slots(self):
+        """جابه‌جایی نگه‌داشت با همان توکن، کلید کش اسلات‌ها را عوض می‌کند"""
+        service_ids = [str(self.service.id)]
+        first = timezone.make_aware(datetime.combine(self.day, time(10, 0)))
+        second = timezone.make_aware(datetime.combine(self.day, time(11, 0)))
+
+        def cached_starts():
+            slots_map = get_cached_slots(self.day, self.day, service_ids, None, gender_param='FEMALE',
+                                         compute=get_available_slots)
+            return [s['start'] for s in slots_map[jalali_key(self.day)]]
+
+        place_hold(None, first, first + timedelta(minutes=30), 'same-token')
+        self.assertNotIn(first.isoformat(), cached_starts())
+        place_hold(None, second, second + timedelta(minutes=30), 'same-token')
+        starts = cached_starts()
+        self.assertIn(first.isoformat(), starts)
+        self.assertNotIn(second.isoformat(), starts)
+
+    def test_availability_feed_sends_changed_days(self):
+        """فید فقط روز تغییرکرده را با اسلات‌های جدیدش می‌فرستد و تغییر ساعات کاری reset است"""
+        cursor = current_cursor(['none'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self._book(10, 0, 30)
+
+        with mock.patch('booking.api_views.FEED_STREAM_SECONDS', 0.05), \
+                mock.patch('booking.api_views.FEED_POLL_SECONDS', 0.01):
+            response = async_to_sync(self.async_client.get)(
+                reverse('booking:availability_feed'), {'service_ids[]': [self.service.id]},
+                headers={'Last-Event-ID': format_cursor(cursor)},
+            )
+            body = async_to_sync(_read_stream)(response).decode()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        event = body.split('event: days\n')[1].split('\n\n')[0]
+        days = json.loads(event.split('data: ', 1)[1])['days']
+        self.assertEqual(list(days), [jalali_key(self.day)])
+        self.assertNotIn(
+            timezone.make_aware(datetime.combine(self.day, time(10, 0))).isoformat(),
+            [slot['start'] for slot in days[jalali_key(self.day)]],
+        )
+
+        cursor = current_cursor(['none'])
+        with self.captureOnCommitCallbacks(execute=True):
+            WorkHours.objects.filter(service_group=self.group).update(end_time=time(13, 0))
+            WorkHours.objects.filter(service_group=self.group).first().save()
+        self.assertTrue(lane_changes(cursor).reset)
+
+        # قفل گرفته‌شده فید: به جای نوشتن بدون قفل، reset منتشر می‌شود
+        cursor = current_cursor(['none'])
+        cache.add('booking:feed:none:lock', 1, 5)
+        with mock.patch('booking.feed.FEED_LOCK_WAIT_SECONDS', 0.05):
+            publish_lane_days('none', [self.day])
+        self.assertTrue(lane_changes(cursor).reset)
+
+    def test_conditional_get_returns_not_modified(self):
+        """با ETag فعلی پاسخ 304 است و بعد از ثبت نوبت روی همان خط دوباره 200"""
+        url = reverse('booking:all_available_slots')
+        params = {'service_ids[]': [self.service.id], 'from': jalali_key(self.day), 'to': jalali_key(self.day)}
+        # ثابت نگه‌داشتن بازه زمانی ETag در طول تست
+        with mock.patch('booking.slot_cache.time.time', return_value=1_800_000_000.0):
+            etag = self.client.get(url, params)['ETag']
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                self._book(10, 0, 30)
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_services_for_group_etag_follows_catalog(self):
+        url = reverse('booking:get_services_for_group')
+        etag = self.client.get(url, {'group_id': self.group.id})['ETag']
+        self.assertEqual(self.client.get(url, {'group_id': self.group.id}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.service.price = 350000
+        self.service.save()
+        self.assertEqual(self.client.get(url, {'group_id': self.group.id}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_streaming_response_matches_regular_response(self):
+        """پاسخ جریانی روز به روز نوشته می‌شود و همان اسلات‌های پاسخ معمولی را دارد"""
+        self._book(11, 0, 30)
+        params = {'service_ids[]': [self.service.id], 'to': jalali_key(self.day + timedelta(days=14))}
+        response = async_to_sync(self.async_client.get)(reverse('booking:all_available_slots_stream'), params)
+        self.assertTrue(response.is_async)
+        streamed = json.loads(async_to_sync(_read_stream)(response))
+
+        expected = generate_available_slots_for_range(
+            timezone.localdate(), self.day + timedelta(days=14), [str(self.service.id)], None
+        )
+        self.assertEqual(streamed['slots'], expected)
+        self.assertEqual(streamed['to'], jalali_key(self.day + timedelta(days=14)))
+
+        compact = json.loads(async_to_sync(_read_stream)(async_to_sync(self.async_client.get)(
+            reverse('booking:all_available_slots_stream'), {**params, 'format': 'compact'}
+        )))
+        self.assertEqual(compact['duration'], 30)
+        self.assertEqual(compact['days'][jalali_key(self.day)]['starts'], [600, 630, 690])
+
+class SlotsApiWindowTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = ServiceGroup.objects.create(name='Skin')
+        self.service = Service.objects.create(group=self.group, name='Facial', duration=30, price=300000)
+        self.url = reverse('booking:all_available_slots')
+
+    def test_window_and_cursor(self):
+        """پنجره درخواستی برگردانده می‌شود و cursor به روز بعد از پنجره اشاره می‌کند"""
+        today = timezone.localdate()
+        response = self.client.get(self.url, {
+            'service_ids[]': [self.service.id],
+            'from': jalali_key(today),
+            'to': jalali_key(today + timedelta(days=3)),
+        })
+        data = response.json()
+        self.assertEqual(data['from'], jalali_key(today))
+        self.assertEqual(data['to'], jalali_key(today + timedelta(days=3)))
+        self.assertEqual(data['next'], jalali_key(today + timedelta(days=4)))
+
+    def test_window_is_capped(self):
+        today = timezone.localdate()
+        response = self.client.get(self.url, {
+            'service_ids[]': [self.service.id],
+            'from': jalali_key(today),
+            'to': jalali_key(today + timedelta(days=300)),
+        })
+        self.assertEqual(response.json()['to'], jalali_key(today + timedelta(days=MAX_WINDOW_DAYS - 1)))
+
+    def test_invalid_month(self):
+        response = self.client.get(self.url, {'service_ids[]': [self.service.id], 'month': '1404-13'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_non_ascii_digits_are_rejected(self):
+        for params in ({'month': '٩٩-١'}, {'from': '۱۴۰۵-۰۱-۱۰'}, {'month': '1405-1x'}):
+            response = self.client.get(self.url, {'service_ids[]': [self.service.id], **params})
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_empty_window_is_rejected(self):
+        """پنجره‌ای که پس از محدودسازی به امروز و افق خالی می‌ماند 400 است و cursor هرگز به گذشته برنمی‌گردد"""
+        today = timezone.localdate()
+        for start, end in (
+            (today + timedelta(days=400), today - timedelta(days=300)),
+            (today - timedelta(days=40), today - timedelta(days=10)),
+        ):
+            response = self.client.get(self.url, {
+                'service_ids[]': [self.service.id], 'from': jalali_key(start), 'to': jalali_key(end),
+            })
+            self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(self.url, {
+            'service_ids[]': [self.service.id],
+            'from': jalali_key(today - timedelta(days=10)),
+            'to': jalali_key(today + timedelta(days=1)),
+        })
+        self.assertEqual(response.json()['from'], jalali_key(today))
+        self.assertEqual(response.json()['next'], jalali_key(today + timedelta(days=2)))
@@ -12,6 +12,13 @@ urlpatterns = [
     
     # APIs
     path('api/all-available-slots/', api_views.all_available_slots_api, name='all_available_slots'),    
+    path('api/all-available-slots/async/', api_views.all_available_slots_async_api, name='all_available_slots_async'),
+    path('api/all-available-slots/stream/', api_views.all_available_slots_stream_api, name='all_available_slots_stream'),
+    path('api/next-available/', api_views.next_available_api, name='next_available'),
+    path('api/next-available/batch/', api_views.next_available_batch_api, name='next_available_batch'),
     path('api/get-services-for-group/', api_views.get_services_for_group_api, name='get_services_for_group'),
+    path('api/availability-feed/', api_views.availability_feed_api, name='availability_feed'),
+    path('api/slot-hold/', api_views.slot_hold_api, name='slot_hold'),
+    path('api/slot-hold/release/', api_views.slot_hold_release_api, name='slot_hold_release'),
     path('api/apply-discount/', api_views.apply_discount_api, name='apply_discount'),
 ]
\ No newline at end of file
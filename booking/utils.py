@@ -25,6 +25,25 @@ def _get_patient_for_booking(request) -> Tuple[Optional[CustomUser], bool, Optio
     
     return patient_user, is_reception_booking, patient_user_for_template
 
+async def _aget_patient_for_booking(request) -> Tuple[Optional[CustomUser], bool, Optional[CustomUser]]:
+    """نسخه async از _get_patient_for_booking برای ویوهای ASGI."""
+    is_reception_booking = False
+    user = await request.auser()
+    patient_user = user if user.is_authenticated else None
+    patient_user_for_template = None
+
+    if patient_user and patient_user.is_staff:
+        p_id = await request.session.aget('reception_acting_as_patient_id')
+        if p_id:
+            is_reception_booking = True
+            try:
+                patient_user = await CustomUser.objects.aget(id=p_id)
+                patient_user_for_template = patient_user
+            except CustomUser.DoesNotExist:
+                patient_user = None
+
+    return patient_user, is_reception_booking, patient_user_for_template
+
 def _calculate_discounts(patient_user: Optional[CustomUser], total_price: float, apply_points: bool, discount_code_str: str):
     """
     محاسبه تخفیف‌ها. برای مهمانان (patient_user=None) امتیاز محاسبه نمی‌شود.
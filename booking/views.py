@@ -8,7 +8,13 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 
 from clinic.models import Service, ServiceGroup, Device
+from .closures import closed_lanes
+from .holds import held_by_others, release_hold
+from .intervals import saturated_intervals
+from .lanes import ANY_DEVICE
 from .models import Appointment
+from .occupancy import no_device_capacity
+from .resources import required_resources
 from .forms import RatingForm
 from site_settings.models import SiteSettings
 from .utils import _get_patient_for_booking, _calculate_discounts
@@ -46,6 +52,7 @@ def create_booking_view(request):
         discount_code = request.POST.get('discount_code', '').strip()
         device_id = request.POST.get('device_id')
         manual_confirm = request.POST.get('manual_confirm')
+        hold_token = request.POST.get('hold_token') or None
         
         # دریافت اطلاعات مهمان
         guest_fname = request.POST.get('guest_first_name')
@@ -77,8 +84,10 @@ def create_booking_view(request):
                 messages.error(request, 'انتخاب دستگاه الزامی است.')
                 return redirect('booking:create_booking')
             try:
-                selected_device = group.available_devices.get(id=device_id)
-            except Device.DoesNotExist:
+                # در حالت «هر دستگاهی» دستگاه آزاد داخل تراکنش انتخاب می‌شود
+                if device_id != ANY_DEVICE:
+                    selected_device = group.available_devices.get(id=device_id)
+            except (Device.DoesNotExist, ValueError):
                 messages.error(request, 'دستگاه نامعتبر است.')
                 return redirect('booking:create_booking')
         
@@ -106,23 +115,60 @@ def create_booking_view(request):
             messages.error(request, 'فرمت زمان یا تاریخ نامعتبر است.')
             return redirect('booking:create_booking')
 
+        # نگه‌داشت موقت کاربران دیگر که (همراه نوبت‌ها) ظرفیت خط را پر کرده، بدون باز کردن تراکنش رد می‌شود
+        if not (group.has_devices and selected_device is None):
+            lane_device_id = selected_device.id if selected_device else None
+            if held_by_others([lane_device_id], aware_start, aware_end, hold_token):
+                messages.error(request, 'این زمان موقتاً توسط کاربر دیگری در حال رزرو است.')
+                return redirect('booking:create_booking')
+
         # --- تراکنش اتمیک و قفل رکورد ---
         try:
             with transaction.atomic():
-                # بررسی تداخل زمانی
+                # بررسی تداخل زمانی: نوبت‌های هم‌پوشان هر خط با sweep line شمرده می‌شوند
+                # و خط فقط وقتی پر است که جایی در بازه به ظرفیت هم‌زمان آن برسد
                 collision_qs = Appointment.objects.select_for_update().filter(
                     start_time__lt=aware_end,
                     end_time__gt=aware_start,
                     status__in=['PENDING', 'CONFIRMED']
                 )
 
+                def lane_full(lane_qs, capacity):
+                    return bool(saturated_intervals(lane_qs.values_list('start_time', 'end_time'), capacity))
+
                 if group.has_devices:
-                    if collision_qs.filter(selected_device=selected_device).exists():
+                    if selected_device is None:
+                        group_devices = list(group.available_devices.order_by('id'))
+                        group_device_ids = [device.id for device in group_devices]
+                        booked = {}
+                        for booked_device_id, start, end in collision_qs.filter(
+                                selected_device__isnull=False).values_list('selected_device_id', 'start_time', 'end_time'):
+                            booked.setdefault(booked_device_id, []).append((start, end))
+                        # دستگاه‌های در حال سرویس، تعطیل یا نگه‌داشته‌شده توسط دیگران هم کنار گذاشته می‌شوند
+                        unavailable_ids = (
+                            closed_lanes(group.id, group_device_ids, aware_start, aware_end)
+                            | held_by_others(group_device_ids, aware_start, aware_end, hold_token, booked)
+                        )
+                        selected_device = next((
+                            device for device in group_devices
+                            if device.id not in unavailable_ids
+                            and not saturated_intervals(booked.get(device.id, []), device.capacity)
+                        ), None)
+                        if selected_device is None:
+                            raise ValueError('متاسفانه این زمان پر شد.')
+                    elif (closed_lanes(group.id, [selected_device.id], aware_start, aware_end)
+                          or lane_full(collision_qs.filter(selected_device=selected_device), selected_device.capacity)):
                         raise ValueError('متاسفانه این زمان پر شد.')
                 else:
-                    if collision_qs.filter(selected_device__isnull=True).exists():
+                    if (closed_lanes(group.id, [None], aware_start, aware_end)
+                            or lane_full(collision_qs.filter(selected_device__isnull=True), no_device_capacity())):
                          raise ValueError('متاسفانه این زمان پر شده است.')
 
+                # پزشک، اپراتور یا اتاق لازم گروه نباید در نوبت هم‌پوشان دیگری رزرو شده باشد
+                resource_ids = required_resources(group.id)
+                if resource_ids and collision_qs.filter(resources__in=resource_ids).exists():
+                    raise ValueError('متاسفانه این زمان پر شد.')
+
                 status = 'CONFIRMED' if (is_reception_booking and manual_confirm) else 'PENDING'
 
                 # ایجاد نوبت
@@ -142,6 +188,8 @@ def create_booking_view(request):
                     selected_device=selected_device,
                 )
                 appt.services.set(selected_services)
+                if resource_ids:
+                    appt.resources.set(resource_ids)
                 
                 # کسر امتیاز (فقط اگر کاربر باشد و امتیاز استفاده کرده باشد)
                 if patient_user and p_used > 0:
@@ -153,6 +201,8 @@ def create_booking_view(request):
                     c_obj.is_used = True
                     c_obj.save()
 
+                transaction.on_commit(lambda: release_hold(hold_token))
+
             # --- پایان تراکنش ---
             
             if is_reception_booking:
@@ -10,7 +10,7 @@ from django.db.models import QuerySet
 from django.http import HttpRequest
 from .models import (
     Service, PortfolioItem, FAQ, Testimonial, 
-    DiscountCode, ServiceGroup, Device, WorkHours
+    DiscountCode, ServiceGroup, Device, WorkHours, Closure, Resource, ResourceWorkHours
 )
 from jalali_date.admin import ModelAdminJalaliMixin
 
@@ -42,10 +42,30 @@ class WorkHoursInline(admin.TabularInline):
                 formset.form.base_fields['service_group'].required = False
         return formset
 
+@admin.register(Closure)
+class ClosureAdmin(ModelAdminJalaliMixin, admin.ModelAdmin):
+    list_display = ('title', 'start_date', 'end_date', 'start_time', 'end_time', 'service_group', 'device')
+    list_filter = ('service_group', 'device')
+    list_select_related = ('service_group', 'device')
+    search_fields = ('title',)
+
 @admin.register(Device)
 class DeviceAdmin(admin.ModelAdmin):
-    list_display = ('name', 'description')
+    list_display = ('name', 'capacity', 'description')
+    search_fields = ('name',)
+
+class ResourceWorkHoursInline(admin.TabularInline):
+    model = ResourceWorkHours
+    extra = 1
+    verbose_name = "ساعت حضور"
+    verbose_name_plural = "ساعات حضور"
+
+@admin.register(Resource)
+class ResourceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'kind', 'description')
+    list_filter = ('kind',)
     search_fields = ('name',)
+    inlines = [ResourceWorkHoursInline]
 
 class ServiceInline(admin.TabularInline):
     model = Service
@@ -55,10 +75,10 @@ class ServiceInline(admin.TabularInline):
 
 @admin.register(ServiceGroup)
 class ServiceGroupAdmin(admin.ModelAdmin):
-    list_display = ('name', 'allow_multiple_selection', 'has_devices')
+    list_display = ('name', 'allow_multiple_selection', 'has_devices', 'slot_step', 'best_fit_slots')
     search_fields = ('name',)
     inlines = [ServiceInline, WorkHoursInline]
-    filter_horizontal = ('available_devices',)
+    filter_horizontal = ('available_devices', 'required_resources')
 
 @admin.register(Service)
 class ServiceAdmin(admin.ModelAdmin):
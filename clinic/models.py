@@ -5,6 +5,7 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
 from django.utils.translation import gettext_lazy as _
 
 class WorkHours(models.Model):
@@ -79,6 +80,12 @@ class WorkHours(models.Model):
 class Device(models.Model):
     name = models.CharField(max_length=200, verbose_name=_("نام دستگاه"))
     description = models.TextField(blank=True, verbose_name=_("توضیحات"))
+    capacity = models.PositiveSmallIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        verbose_name=_("ظرفیت هم‌زمان"),
+        help_text=_("تعداد نوبت‌هایی که دستگاه هم‌زمان انجام می‌دهد (مثلاً دو هندپیس یا دو اپراتور).")
+    )
 
     class Meta:
         verbose_name = _("دستگاه")
@@ -87,6 +94,118 @@ class Device(models.Model):
     def __str__(self):
         return self.name
 
+
+class Resource(models.Model):
+    """
+    منبع مشترک نوبت‌دهی غیر از دستگاه (پزشک/اپراتور یا اتاق).
+    هر نوبت گروهی که این منبع را لازم دارد، آن را برای تمام مدت نوبت اشغال می‌کند.
+    """
+    class Kind(models.TextChoices):
+        PRACTITIONER = 'PRACTITIONER', _('پزشک / اپراتور')
+        ROOM = 'ROOM', _('اتاق')
+
+    name = models.CharField(max_length=200, verbose_name=_("نام"))
+    kind = models.CharField(max_length=20, choices=Kind.choices, verbose_name=_("نوع منبع"))
+    description = models.TextField(blank=True, verbose_name=_("توضیحات"))
+
+    class Meta:
+        verbose_name = _("منبع")
+        verbose_name_plural = _("منابع (پزشکان و اتاق‌ها)")
+        ordering = ['kind', 'name']
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.name}"
+
+
+class ResourceWorkHours(models.Model):
+    """
+    ساعات حضور یک منبع در روزهای هفته.
+    منبعی که هیچ ساعت حضوری ندارد محدودیت ساعتی ندارد و فقط نوبت‌هایش اشغال حساب می‌شوند.
+    """
+    resource = models.ForeignKey(
+        Resource, on_delete=models.CASCADE, related_name='work_hours', verbose_name=_("منبع")
+    )
+    day_of_week = models.IntegerField(choices=WorkHours.DAY_CHOICES, verbose_name=_("روز هفته"))
+    start_time = models.TimeField(verbose_name=_("ساعت شروع"))
+    end_time = models.TimeField(verbose_name=_("ساعت پایان"))
+
+    class Meta:
+        verbose_name = _("ساعت حضور منبع")
+        verbose_name_plural = _("ساعات حضور منابع")
+        ordering = ['day_of_week', 'start_time']
+
+    def clean(self):
+        if self.start_time and self.end_time and self.start_time >= self.end_time:
+            raise ValidationError(_("ساعت پایان باید بعد از ساعت شروع باشد."))
+
+    def __str__(self):
+        day = self.get_day_of_week_display()
+        return f"{self.resource.name} | {day}: {self.start_time.strftime('%H:%M')}-{self.end_time.strftime('%H:%M')}"
+
+
+class Closure(models.Model):
+    """
+    تعطیلی یا توقف سرویس (مثلاً تعطیلات رسمی یا سرویس دوره‌ای دستگاه لیزر).
+    بدون گروه و دستگاه برای کل کلینیک، با گروه برای تمام خدمات گروه و با دستگاه فقط برای همان دستگاه.
+    اگر ساعت شروع و پایان خالی باشد کل روزهای بازه تعطیل است؛ در غیر این صورت
+    در هر روز بازه فقط همان ساعت‌ها بسته است.
+    """
+    title = models.CharField(max_length=200, verbose_name=_("عنوان"))
+    start_date = models.DateField(verbose_name=_("از تاریخ"))
+    end_date = models.DateField(verbose_name=_("تا تاریخ"))
+    start_time = models.TimeField(null=True, blank=True, verbose_name=_("از ساعت"),
+                                  help_text=_("خالی یعنی تمام روز"))
+    end_time = models.TimeField(null=True, blank=True, verbose_name=_("تا ساعت"))
+
+    service_group = models.ForeignKey(
+        'ServiceGroup',
+        on_delete=models.CASCADE,
+        related_name='closures',
+        null=True, blank=True,
+        verbose_name=_("گروه خدماتی")
+    )
+    device = models.ForeignKey(
+        Device,
+        on_delete=models.CASCADE,
+        related_name='closures',
+        null=True, blank=True,
+        verbose_name=_("دستگاه")
+    )
+
+    class Meta:
+        verbose_name = _("تعطیلی")
+        verbose_name_plural = _("تعطیلی‌ها و توقف دستگاه‌ها")
+        ordering = ['start_date', 'start_time']
+        constraints = [
+            models.CheckConstraint(
+                condition=~models.Q(service_group__isnull=False, device__isnull=False),
+                name='closure_group_or_device'
+            )
+        ]
+        indexes = [models.Index(fields=['end_date', 'start_date'], name='closure_range_idx')]
+
+    def clean(self):
+        """اعتبارسنجی سطح مدل"""
+        if self.start_date and self.end_date and self.start_date > self.end_date:
+            raise ValidationError(_("تاریخ پایان نمی‌تواند قبل از تاریخ شروع باشد."))
+
+        if (self.start_time is None) != (self.end_time is None):
+            raise ValidationError(_("ساعت شروع و پایان باید با هم تعیین شوند یا هر دو خالی بمانند."))
+
+        if self.start_time and self.end_time and self.start_time >= self.end_time:
+            raise ValidationError(_("ساعت پایان باید بعد از ساعت شروع باشد."))
+
+        if self.service_group_id and self.device_id:
+            raise ValidationError(_("تعطیلی یا برای یک گروه است یا برای یک دستگاه، نه هر دو."))
+
+    @property
+    def is_full_day(self):
+        return self.start_time is None or self.end_time is None
+
+    def __str__(self):
+        target = self.device.name if self.device else (self.service_group.name if self.service_group else _("کل کلینیک"))
+        return f"{self.title} | {target}: {self.start_date} - {self.end_date}"
+
 class ServiceGroup(models.Model):
     name = models.CharField(max_length=200, verbose_name=_("نام گروه خدمت"))
     description = models.TextField(blank=True, verbose_name=_("توضیحات"))
@@ -110,6 +229,22 @@ class ServiceGroup(models.Model):
     available_devices = models.ManyToManyField(
         Device, blank=True, verbose_name=_("دستگاه‌های موجود")
     )
+    required_resources = models.ManyToManyField(
+        Resource, blank=True, related_name='service_groups',
+        verbose_name=_("منابع لازم"),
+        help_text=_("پزشک، اپراتور یا اتاقی که هر نوبت این گروه باید هم‌زمان آزاد داشته باشد.")
+    )
+
+    slot_step = models.PositiveSmallIntegerField(
+        null=True, blank=True,
+        verbose_name=_("گام اسلات‌ها (دقیقه)"),
+        help_text=_("فاصله شروع زمان‌های پیشنهادی (مثلاً ۱۰ یا ۱۵). خالی = برابر مدت خدمات انتخاب‌شده.")
+    )
+    best_fit_slots = models.BooleanField(
+        default=False,
+        verbose_name=_("چینش فشرده نوبت‌ها"),
+        help_text=_("زمان‌های چسبیده به نوبت‌های ثبت‌شده یا ابتدا و انتهای شیفت اول پیشنهاد می‌شوند.")
+    )
 
     class Meta:
         verbose_name = _("گروه خدمت")
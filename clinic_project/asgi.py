@@ -0,0 +1,15 @@
+# clinic_project/asgi.py
+"""
+نقطه ورود ASGI پروژه (مثلاً: uvicorn clinic_project.asgi:application).
+ویوهای async مانند booking:all_available_slots_async بدون اشغال یک thread برای هر درخواست
+اجرا می‌شوند و ویوهای sync همانند قبل در thread pool جنگو اجرا می‌شوند.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+# در سرور، متغیر محیطی DJANGO_SETTINGS_MODULE مقداردهی می‌شود و این خط نادیده گرفته می‌شود.
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'clinic_project.settings.production')
+
+application = get_asgi_application()
@@ -86,6 +86,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'clinic_project.wsgi.application'
+ASGI_APPLICATION = 'clinic_project.asgi.application'
 
 # --- پیکربندی دیتابیس ---
 DATABASE_URL = os.environ.get('DATABASE_URL')
@@ -157,6 +158,12 @@ DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER)
 
 POINTS_TO_TOMAN_RATE = 100
 
+# موتور محاسبه اسلات‌های آزاد: 'python' (مرجع) یا 'numpy' (برداری برای بازه‌های طولانی)
+BOOKING_SLOT_ENGINE = os.environ.get('BOOKING_SLOT_ENGINE', 'python')
+
+# ظرفیت هم‌زمان خط مشترک خدمات بدون دستگاه (تعداد نوبت‌های موازی؛ ظرفیت دستگاه‌ها در Device.capacity است)
+BOOKING_NO_DEVICE_CAPACITY = int(os.environ.get('BOOKING_NO_DEVICE_CAPACITY', 1))
+
 JALALI_DATE_DEFAULTS = {
    'Strftime': {
         'date': '%Y/%m/%d',
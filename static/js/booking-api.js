@@ -31,14 +31,19 @@ const BookingAPI = {
     },
 
     /**
-     * دریافت لیست اسلات‌های خالی
+     * دریافت لیست اسلات‌های خالی یک ماه شمسی
+     * @param {string} month - ماه شمسی با فرمت jYYYY-jMM (خالی = ماه جاری)
+     * خروجی: {slots: {...}, from, to, next}
      */
-    async fetchAvailableSlots(apiUrl, serviceIds, deviceId = null) {
+    async fetchAvailableSlots(apiUrl, serviceIds, deviceId = null, month = null) {
         if (!apiUrl || !serviceIds || serviceIds.length === 0) return null;
 
         const params = new URLSearchParams();
         serviceIds.forEach(id => params.append('service_ids[]', id));
         if (deviceId) params.append('device_id', deviceId);
+        if (month) params.append('month', month);
+        // قالب فشرده ستونی؛ برچسب‌ها در BookingUI ساخته می‌شوند
+        params.append('format', 'compact');
 
         try {
             const response = await fetch(`${apiUrl}?${params.toString()}`, {
@@ -47,13 +52,72 @@ const BookingAPI = {
             });
 
             if (!response.ok) throw new Error('خطا در دریافت نوبت‌ها');
-            return await response.json();
+            const data = await response.json();
+            if (data.format === 'compact') data.slots = BookingUI.expandCompactSlots(data);
+            return data;
         } catch (error) {
             console.error('BookingAPI Error (Slots):', error);
             return null;
         }
     },
 
+    /**
+     * نگه‌داشت موقت اسلات انتخاب‌شده تا ثبت نهایی فرم
+     * خروجی موفق: {status: 'success', token, device_id, expires_in}؛ در صورت پر شدن اسلات status: 'error'
+     */
+    async holdSlot(apiUrl, slotStart, serviceIds, deviceId, holdToken, csrfToken) {
+        const formData = new FormData();
+        formData.append('slot', slotStart);
+        serviceIds.forEach(id => formData.append('services[]', id));
+        if (deviceId) formData.append('device_id', deviceId);
+        if (holdToken) formData.append('hold_token', holdToken);
+
+        try {
+            const response = await fetch(apiUrl, {
+                method: 'POST',
+                body: formData,
+                headers: {
+                    'X-Requested-With': 'XMLHttpRequest',
+                    'X-CSRFToken': csrfToken
+                }
+            });
+            return await response.json();
+        } catch (error) {
+            console.error('BookingAPI Error (Hold):', error);
+            return null;
+        }
+    },
+
+    /**
+     * آزادسازی نگه‌داشت قبلی (مثلاً با تغییر خدمات یا دستگاه)
+     */
+    releaseHold(apiUrl, holdToken, csrfToken) {
+        if (!apiUrl || !holdToken) return;
+        const formData = new FormData();
+        formData.append('hold_token', holdToken);
+        fetch(apiUrl, {
+            method: 'POST',
+            body: formData,
+            headers: { 'X-Requested-With': 'XMLHttpRequest', 'X-CSRFToken': csrfToken }
+        }).catch(error => console.error('BookingAPI Error (Release):', error));
+    },
+
+    /**
+     * اتصال به فید زنده تغییرات اسلات‌ها (SSE)؛ EventSource خودش با Last-Event-ID دوباره وصل می‌شود
+     */
+    openAvailabilityFeed(apiUrl, serviceIds, deviceId, onDays, onReset) {
+        if (!apiUrl || !window.EventSource || !serviceIds || serviceIds.length === 0) return null;
+
+        const params = new URLSearchParams();
+        serviceIds.forEach(id => params.append('service_ids[]', id));
+        if (deviceId) params.append('device_id', deviceId);
+
+        const source = new EventSource(`${apiUrl}?${params.toString()}`);
+        source.addEventListener('days', (event) => onDays(JSON.parse(event.data).days));
+        source.addEventListener('reset', () => onReset());
+        return source;
+    },
+
     /**
      * اعمال کد تخفیف
      */
@@ -15,8 +15,9 @@ const BookingCalendar = {
         nextBtn: null,
     },
     onDateSelect: null,
+    onMonthChange: null,
 
-    init(wrapperEl, onDateSelect) {
+    init(wrapperEl, onDateSelect, onMonthChange = null) {
         if (!wrapperEl) return;
 
         this.elements.wrapper = wrapperEl;
@@ -25,6 +26,7 @@ const BookingCalendar = {
         this.elements.prevBtn = document.getElementById('calendar-prev-month');
         this.elements.nextBtn = document.getElementById('calendar-next-month');
         this.onDateSelect = onDateSelect;
+        this.onMonthChange = onMonthChange;
 
         if (typeof moment === 'undefined') {
             console.error('Jalali Moment library missing!');
@@ -47,6 +49,15 @@ const BookingCalendar = {
     changeMonth(step) {
         this.currentMonth.add(step, 'jMonth');
         this.render();
+        // دریافت اسلات‌های ماه جدید (سرور فقط پنجره ماه نمایش داده شده را برمی‌گرداند)
+        if (this.onMonthChange) this.onMonthChange(this.visibleMonthKey());
+    },
+
+    /**
+     * کلید ماه در حال نمایش با فرمت jYYYY-jMM (اعداد انگلیسی)
+     */
+    visibleMonthKey() {
+        return this.currentMonth.clone().locale('en').format('jYYYY-jMM');
     },
 
     updateEvents(slotsData) {
@@ -54,6 +65,28 @@ const BookingCalendar = {
         this.render();
     },
 
+    /**
+     * افزودن اسلات‌های یک پنجره جدید بدون پاک کردن ماه‌های قبلاً دریافت شده
+     */
+    mergeEvents(slotsData) {
+        Object.assign(this.availableDatesMap, slotsData || {});
+        this.render();
+    },
+
+    /**
+     * اعمال تغییرات فید زنده: اسلات‌های هر روز ارسال‌شده جایگزین کامل همان روز می‌شود
+     */
+    applyDelta(days) {
+        Object.entries(days || {}).forEach(([dateKey, slots]) => {
+            if (slots && slots.length > 0) {
+                this.availableDatesMap[dateKey] = slots;
+            } else {
+                delete this.availableDatesMap[dateKey];
+            }
+        });
+        this.render();
+    },
+
     render() {
         if (!this.elements.gridBody) return;
 
@@ -54,6 +54,15 @@ document.addEventListener('DOMContentLoaded', async () => {
             } else {
                 BookingUI.clearSlots();
             }
+        }, async (monthKey) => {
+            // با تغییر ماه، اسلات‌های همان ماه دریافت و به نقشه اضافه می‌شود
+            const serviceIds = Array.from(document.querySelectorAll('.service-input:checked')).map(input => input.value);
+            const deviceSelect = document.getElementById('id_device');
+            const deviceId = deviceSelect ? deviceSelect.value : null;
+            if (serviceIds.length === 0 || (deviceSelect && !deviceId)) return;
+
+            const slotsData = await BookingAPI.fetchAvailableSlots(config.getSlotsUrl, serviceIds, deviceId, monthKey);
+            if (slotsData) BookingCalendar.mergeEvents(slotsData.slots);
         });
     }
 
@@ -132,13 +141,14 @@ document.addEventListener('DOMContentLoaded', async () => {
             const slotsData = await BookingAPI.fetchAvailableSlots(
                 config.getSlotsUrl, 
                 serviceIds, 
-                deviceId
+                deviceId,
+                BookingCalendar.visibleMonthKey()
             );
             
             BookingUI.toggleSlotsLoading(false);
             
             if (slotsData) {
-                BookingCalendar.updateEvents(slotsData);
+                BookingCalendar.updateEvents(slotsData.slots);
                 // نمایش کانتینر تقویم
                 const slotsContainer = document.getElementById('slotsContainer');
                 if(slotsContainer) slotsContainer.style.display = 'block';
@@ -74,6 +74,10 @@ const BookingUI = {
         select.id = 'id_device'; // شناسه برای دسترسی راحت‌تر
         
         let options = '<option value="">--- انتخاب دستگاه ---</option>';
+        // با «هر دستگاهی» اولین دستگاه آزاد هنگام ثبت نوبت انتخاب می‌شود
+        if (devices.length > 1) {
+            options += '<option value="any">هر دستگاهی (اولین زمان آزاد)</option>';
+        }
         devices.forEach(dev => {
             options += `<option value="${dev.id}">${dev.name}</option>`;
         });
@@ -159,6 +163,40 @@ const BookingUI = {
         // if (initMsg) initMsg.style.display = 'block';
     },
 
+    /**
+     * تبدیل پاسخ فشرده API اسلات‌ها (format=compact) به همان ساختار قالب کامل:
+     * {تاریخ شمسی: [{start, end, readable_start, device_id?}]}
+     * برچسب خوانا از کلید تاریخ شمسی و روز هفته تاریخ میلادی ساخته می‌شود.
+     */
+    expandCompactSlots(data) {
+        const weekdays = ['شنبه', 'یکشنبه', 'دوشنبه', 'سه‌شنبه', 'چهارشنبه', 'پنجشنبه', 'جمعه'];
+        const months = ['فروردین', 'اردیبهشت', 'خرداد', 'تیر', 'مرداد', 'شهریور', 'مهر', 'آبان', 'آذر', 'دی', 'بهمن', 'اسفند'];
+        const persianDigits = (text) => String(text).replace(/\d/g, d => '۰۱۲۳۴۵۶۷۸۹'[d]);
+        const pad = (n) => String(n).padStart(2, '0');
+        const clock = (minute) => `${pad(Math.floor(minute / 60))}:${pad(minute % 60)}`;
+
+        const slotsMap = {};
+        Object.entries(data.days || {}).forEach(([dateKey, day]) => {
+            const [, jMonth, jDay] = dateKey.split('-').map(Number);
+            const [year, month, dayOfMonth] = day.date.split('-').map(Number);
+            // getDay: یکشنبه=۰؛ در تقویم شمسی شنبه=۰
+            const weekday = weekdays[(new Date(year, month - 1, dayOfMonth).getDay() + 1) % 7];
+            const prefix = `${weekday} ${persianDigits(jDay)} ${months[jMonth - 1]}، ساعت `;
+
+            slotsMap[dateKey] = day.starts.map((minute, i) => {
+                const offset = day.offsets ? day.offsets[i] : day.tz;
+                const slot = {
+                    start: `${day.date}T${clock(minute)}:00${offset}`,
+                    end: `${day.date}T${clock(minute + data.duration)}:00${offset}`,
+                    readable_start: prefix + persianDigits(clock(minute)),
+                };
+                if (day.devices) slot.device_id = day.devices[i];
+                return slot;
+            });
+        });
+        return slotsMap;
+    },
+
     updateFinalPrice(price) {
         const el = document.getElementById('finalPrice');
         if (el) el.textContent = price.toLocaleString('fa-IR') + ' تومان';